@@ -4,14 +4,12 @@
 const int MAX_JOINTS = 100;
 const int MAX_WEIGHTS = 3;
 
-layout(binding = 1) uniform MVPMatrix
-{
-    mat4 model;
+layout(set = 0, binding = 0) uniform CameraData {
     mat4 view;
     mat4 proj;
-} mvp;
+} camera;
 
-layout(binding = 3) uniform JointData 
+layout(set = 1, binding = 1) uniform JointData 
 {
 	mat4 joints[MAX_JOINTS];
 } j;
@@ -23,11 +21,18 @@ layout(location = 3) in vec3 inNormal;
 layout(location = 4) in vec3 inJointIndices;
 layout(location = 5) in vec3 inWeights;
 
+// Read once per draw from the InstanceBuffer, see DrawData
+layout(location = 6) in mat4 inModel;
+layout(location = 10) in vec4 inTint;
+
 layout(location = 0) out vec3 fragColor;
 layout(location = 1) out vec2 fragTexCoord;
 layout(location = 2) out vec3 fragNormal;
 layout(location = 3) out vec4 worldPosition;
 
+// Handed on to the fragment stages reading DrawData
+layout(location = 4) flat out vec4 drawTint;
+
 void main()
 {
 
@@ -45,9 +50,10 @@ void main()
 	}
 
 
-	worldPosition = mvp.model * totalLocalPos;
-    gl_Position = mvp.proj * mvp.view * worldPosition;
+	worldPosition = inModel * totalLocalPos;
+    gl_Position = camera.proj * camera.view * worldPosition;
     fragColor = inColor;
     fragTexCoord = inTexCoord;
-    fragNormal = (mvp.model * totalNormal).xyz;
+    fragNormal = (inModel * totalNormal).xyz;
+    drawTint = inTint;
 }
@@ -3,9 +3,9 @@
 
 const int MAX_LIGHTS = 50;
 
-layout(binding = 0) uniform sampler2D tex;
+layout(set = 1, binding = 0) uniform sampler2D tex;
 
-layout(binding = 2) uniform SceneLighting
+layout(set = 0, binding = 1) uniform SceneLighting
 {
 		vec4 position[MAX_LIGHTS];
 		vec4 direction[MAX_LIGHTS];
@@ -25,6 +25,9 @@ layout(location = 1) in vec2 fragTexCoord;
 layout(location = 2) in vec3 fragNormal;
 layout(location = 3) in vec4 worldPosition;
 
+// The entity's tint, handed on by the vertex stage, see DrawData
+layout(location = 4) flat in vec4 drawTint;
+
 layout(location = 0) out vec4 outColor;
 
 void main() {
@@ -72,5 +75,5 @@ void main() {
 	}
 
 	
-    outColor = totalLightingColor * texture(tex, fragTexCoord);
+    outColor = totalLightingColor * texture(tex, fragTexCoord) * drawTint;
 }
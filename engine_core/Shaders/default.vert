@@ -1,26 +1,39 @@
 #version 450
 #extension GL_ARB_separate_shader_objects : enable
 
-layout(binding = 1) uniform MVPMatrix {
-    mat4 model;
+layout(set = 0, binding = 0) uniform CameraData {
     mat4 view;
     mat4 proj;
-} mvp;
+} camera;
 
 layout(location = 0) in vec3 inPosition;
 layout(location = 1) in vec3 inColor;
 layout(location = 2) in vec2 inTexCoord;
 layout(location = 3) in vec3 inNormal;
 
+// Read once per draw from the InstanceBuffer, see DrawData
+layout(location = 6) in mat4 inModel;
+layout(location = 10) in vec4 inTint;
+layout(location = 11) in vec4 inPickColor;
+layout(location = 12) in vec4 inFlags;
+
 layout(location = 0) out vec3 fragColor;
 layout(location = 1) out vec2 fragTexCoord;
 layout(location = 2) out vec3 fragNormal;
 layout(location = 3) out vec4 worldPosition;
 
+// Handed on to the fragment stages reading DrawData
+layout(location = 4) flat out vec4 drawTint;
+layout(location = 5) flat out vec4 drawColor;
+layout(location = 6) flat out vec4 drawFlags;
+
 void main() {
-    worldPosition = mvp.model * vec4(inPosition, 1.0);
-    gl_Position = mvp.proj * mvp.view * worldPosition;
+    worldPosition = inModel * vec4(inPosition, 1.0);
+    gl_Position = camera.proj * camera.view * worldPosition;
     fragColor = inColor;
     fragTexCoord = inTexCoord;
-    fragNormal = (mvp.model * vec4(inNormal, 0.0)).xyz;
+    fragNormal = (inModel * vec4(inNormal, 0.0)).xyz;
+    drawTint = inTint;
+    drawColor = inPickColor;
+    drawFlags = inFlags;
 }
\ No newline at end of file
@@ -1,13 +1,7 @@
 #version 450
 #extension GL_ARB_separate_shader_objects : enable
 
-layout(binding = 1) uniform MVPMatrix {
-    mat4 model;
-    mat4 view;
-    mat4 proj;
-} ubo;
-
-layout(binding = 2) uniform ScreenSize 
+layout(set = 1, binding = 1) uniform ScreenSize 
 {
 	float width;
 	float height;
@@ -18,11 +12,14 @@ layout(location = 1) in vec3 inColor;
 layout(location = 2) in vec2 inTexCoord;
 layout(location = 3) in vec3 inNormal;
 
+// Read once per draw from the InstanceBuffer, see DrawData
+layout(location = 6) in mat4 inModel;
+
 layout(location = 0) out vec3 fragColor;
 layout(location = 1) out vec2 fragTexCoord;
 
 void main() {
-	mat4 newTransform = mat4(ubo.model);
+	mat4 newTransform = mat4(inModel);
 	
 	newTransform[3][0] *= (1/s.width);
 	newTransform[3][0] *= 2;
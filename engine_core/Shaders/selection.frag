@@ -3,9 +3,9 @@
 
 const int MAX_LIGHTS = 50;
 
-layout(binding = 0) uniform sampler2D tex;
+layout(set = 1, binding = 0) uniform sampler2D tex;
 
-layout(binding = 2) uniform SceneLighting
+layout(set = 0, binding = 1) uniform SceneLighting
 {
 		vec4 position[MAX_LIGHTS];
 		vec4 direction[MAX_LIGHTS];
@@ -18,23 +18,11 @@ layout(binding = 2) uniform SceneLighting
 		vec4 modifiers[MAX_LIGHTS];
 } lights;
 
-layout(binding = 3) uniform _A
-{
-	float value;
-} isLit;
-
-layout(binding = 4) uniform Tint {
-	vec4 value;
-} tint;
-
-layout(binding = 5) uniform _B
-{
-	float value;
-} isSelected;
-
-layout(binding = 6) uniform Color {
-	vec4 value;
-} color;
+// Per-draw values handed on by the vertex stage, see DrawData
+// drawFlags: x - isLit, y - isSelected, z - sub
+layout(location = 4) flat in vec4 drawTint;
+layout(location = 5) flat in vec4 drawColor;
+layout(location = 6) flat in vec4 drawFlags;
 
 float ambient = 0.3;
 
@@ -51,7 +39,7 @@ void main() {
 	vec4 totalLightingColor = vec4(0.0);
 	vec3 unitNormal = normalize(fragNormal);
 
-	if(isLit.value > 0.5)
+	if(drawFlags.x > 0.5)
 	{
 		for(int i = 0; i < MAX_LIGHTS; i++)
 		{
@@ -93,12 +81,12 @@ void main() {
 	}
 	else
 	{
-		totalLightingColor = tint.value;
+		totalLightingColor = drawTint;
 	}
 
     outColor = totalLightingColor * texture(tex, fragTexCoord);
-    if(isSelected.value > 0.5)
+    if(drawFlags.y > 0.5)
     	outColor = texture(tex, fragTexCoord) + 0.2;
 
-    outColorPicker = color.value;
+    outColorPicker = drawColor;
 }
@@ -3,9 +3,9 @@
 
 const int MAX_LIGHTS = 50;
 
-layout(binding = 0) uniform sampler2D base;
+layout(set = 1, binding = 0) uniform sampler2D base;
 
-layout(binding = 2) uniform SceneLighting
+layout(set = 0, binding = 1) uniform SceneLighting
 {
 		vec4 position[MAX_LIGHTS];
 		vec4 direction[MAX_LIGHTS];
@@ -18,14 +18,16 @@ layout(binding = 2) uniform SceneLighting
 		vec4 modifiers[MAX_LIGHTS];
 } lights;
 
-layout(binding = 3) uniform Float {
-	float value;
-} sub;
+// Per-draw values handed on by the vertex stage, see DrawData
+// drawFlags: x - isLit, y - isSelected, z - sub
+layout(location = 4) flat in vec4 drawTint;
+layout(location = 5) flat in vec4 drawColor;
+layout(location = 6) flat in vec4 drawFlags;
 
-layout(binding = 4) uniform sampler2D alt1;
-layout(binding = 5) uniform sampler2D alt2;
-layout(binding = 6) uniform sampler2D alt3;
-layout(binding = 7) uniform sampler2D blend;
+layout(set = 1, binding = 1) uniform sampler2D alt1;
+layout(set = 1, binding = 2) uniform sampler2D alt2;
+layout(set = 1, binding = 3) uniform sampler2D alt3;
+layout(set = 1, binding = 4) uniform sampler2D blend;
 
 float ambient = 0.6;
 
@@ -77,7 +79,7 @@ void main() {
 		
 	}
 
-	vec2 tiled_uv = fragTexCoord * sub.value;
+	vec2 tiled_uv = fragTexCoord * drawFlags.z;
 	vec4 tex_color = texture(base, tiled_uv);
 	if(texture(blend, fragTexCoord).r > 0){
 		tex_color *= (1 - texture(blend, fragTexCoord).r);
@@ -37,14 +37,18 @@ import importlib
 from ctypes import *
 
 import vk
-from diskovery_mesh import Mesh, AnimatedMesh, Animator, Rig, TerrainMesh
-from diskovery_ubos import MVPMatrix, SceneLighting, Float
-from diskovery_image import Texture
+import diskovery_collada
+import diskovery_mesh_cache
+import diskovery_pipeline_cache
+from diskovery_mesh import Mesh, AnimatedMesh, Animator, Rig, TerrainMesh, load_model, load_animation
+from diskovery_ubos import MVPMatrix, ModelMatrix, DrawData, SceneLighting
+from diskovery_image import Texture, decode_image, PLACEHOLDER_PIXELS
+from diskovery_loader import AssetLoader
 from diskovery_buffer import UniformBuffer
 from diskovery_instance import DkInstance
 from diskovery_pipeline import Shader, Pipeline
 from diskovery_entity_manager import EntityManager, Renderer
-from diskovery_descriptor import make_set_layout, Descriptor
+from diskovery_descriptor import make_set_layout, Descriptor, DescriptorAllocator, FrameDescriptor
 from diskovery_input_manager import InputManager
 
 _running = True
@@ -55,7 +59,9 @@ _context = None
 _dk = None
 _scene = None
 _input = None
+_loader = None
 _camera = None
+_frame = None
 _classes = { }
 
 _meshes = { }
@@ -67,6 +73,7 @@ _fonts = { }
 
 _shaders = { }
 _descriptors = { }
+_set_allocators = { }
 _pipelines = { }
 
 _light_scenes = { }
@@ -80,17 +87,26 @@ def edit_mode(val):
 	_editing = val
 
 def clear_environment():
-	global _meshes, _textures, _animations, _shaders, _descriptors, _pipelines, _light_scenes
-
+	global _meshes, _textures, _animations, _shaders, _pipelines, _light_scenes
+
+	# The frame sets of the light scenes may still be bound by frames in
+	# flight, and every command buffer binding them is recorded again
+	if _frame is not None:
+		_scene.wait_in_flight()
+		_frame.clear()
+		_scene.refresh(True)
+
+	# The set layouts and their allocators only depend on the definition,
+	# so they are kept for the shaders of the next scene, along with any
+	# sets entities still hold, and cleaned up by quit
 	_meshes.clear()
 	_textures.clear()
 	_animations.clear()
 	_shaders.clear()
-	_descriptors.clear()
 	_pipelines.clear()
 	_light_scenes.clear()
 
-def add_mesh(data, name=None, animated=False, raw=False, overwrite=True, rename=None):
+def add_mesh(data, name=None, animated=False, raw=False, overwrite=True, rename=None, background=False):
 	"""
 	Creates and adds a :class:`~diskovery_mesh.Mesh` to the dictionary
 	of Meshes stored in this module. Has some basic wrapping to ensure
@@ -99,9 +115,27 @@ def add_mesh(data, name=None, animated=False, raw=False, overwrite=True, rename=
 
 	:param filename: A str of the name of a file stored locally that contains 3D object data (either .obj or .dae format)
 	:param name: A given name for the newly created mesh. If not defined, the filename without its extension will be the key used in the dictionary
+	:param background: If True, the file is parsed on the :class:`~diskovery_loader.AssetLoader` and the mesh is added once it has been uploaded. Entities using it are skipped when drawing until then.
+
+	:returns: When loading in the background, a Future that resolves to the :class:`~diskovery_mesh.Mesh`
 	"""
 	global _meshes, _scene
 
+	if background and not raw:
+		if name is None:
+			name = data[:-4]
+
+		def upload(model):
+			if animated:
+				m = AnimatedMesh(_dk, data, True, False, model)
+			else:
+				m = Mesh(_dk, data, model)
+
+			add_mesh(m, name, animated, True, overwrite, rename)
+			return m
+
+		return _loader.submit(load_model, upload, data, animated, animated)
+
 	if not animated and not raw:
 		m = Mesh(_dk, data)
 	elif animated and not raw:
@@ -127,13 +161,22 @@ def add_mesh(data, name=None, animated=False, raw=False, overwrite=True, rename=
 def remove_mesh(name):
 	global _meshes
 
+	# Frames in flight may still draw from its geometry
+	_scene.wait_in_flight()
 	_meshes[name].cleanup()
 	del _meshes[name]
 
-def add_animation(filename, name=None, overwrite=True):
+def add_animation(filename, name=None, overwrite=True, background=False, anim=None):
 	global _animations
 
-	a = AnimatedMesh(_dk, filename, True, True).anim
+	if background:
+		def upload(a):
+			add_animation(filename, name, overwrite, anim=a)
+			return a
+
+		return _loader.submit(load_animation, upload, filename, True)
+
+	a = anim if anim != None else load_animation(filename, True)
 
 	a.filename = filename
 
@@ -150,7 +193,7 @@ def add_animation(filename, name=None, overwrite=True):
 		else:
 			_animations[name] = a
 
-def add_texture(filename, name=None, overwrite=True, rename=None):
+def add_texture(filename, name=None, overwrite=True, rename=None, background=False, pixels=None):
 	"""
 	Creates and adds a :class:`~diskovery_image.Texture` to the dictionary
 	of Textures stored in this module. Has some basic wrapping to ensure
@@ -159,10 +202,34 @@ def add_texture(filename, name=None, overwrite=True, rename=None):
 
 	:param filename: A str of the name of a file stored locally that contains image data (all common formats accepted)
 	:param name: A given name for the newly created texture. If not defined, the filename without its extension will be the key used in the dictionary
+	:param background: If True, the image is decoded on the :class:`~diskovery_loader.AssetLoader`. A 1x1 white placeholder is used under the same name until the real texture is uploaded.
+	:param pixels: Already decoded image data, as returned by :func:`~diskovery_image.decode_image`
+
+	:returns: When loading in the background, a Future that resolves to the :class:`~diskovery_image.Texture`
 	"""
 	global _textures
 
-	t = Texture(_dk, filename)
+	if background:
+		# The name the texture ends up under is settled now, so the
+		# placeholder sits where entities will look for the real texture
+		key = name if name != None else filename[:-4]
+		if name != None and name in _textures and not overwrite:
+			key = "{}-copy".format(name)
+
+		placeholder = None
+		if key not in _textures:
+			placeholder = Texture(_dk, filename, PLACEHOLDER_PIXELS)
+			_textures[key] = placeholder
+
+		def upload(decoded):
+			# A placeholder made by this call is always replaced
+			replace = overwrite or key != name or _textures.get(key) is placeholder
+			add_texture(filename, key, replace, rename, pixels=decoded)
+			return _textures[key]
+
+		return _loader.submit(decode_image, upload, filename)
+
+	t = Texture(_dk, filename, pixels)
 	if name is None:
 		_textures[filename[:-4]] = t
 	else:
@@ -182,6 +249,8 @@ def add_texture(filename, name=None, overwrite=True, rename=None):
 def remove_texture(name):
 	global _textures
 
+	# Frames in flight may still sample from it
+	_scene.wait_in_flight()
 	_textures[name].cleanup()
 	del _textures[name]
 
@@ -203,22 +272,27 @@ def add_shader(vert, frag, name, overwrite=True, rename=None):
 
 	if s.definition not in _descriptors.keys():
 		_descriptors[s.definition] = make_set_layout(_dk, s.definition)
+		_set_allocators[s.definition] = DescriptorAllocator(_dk, s.definition, _descriptors[s.definition])
 
 	if name in _shaders and overwrite:
 		remove_shader(name)
 		_shaders[name] = s
-		_pipelines[name] = Pipeline(_dk, s, _descriptors[s.definition], s.animated)
+		_pipelines[name] = _make_pipeline(s)
 	elif name in _shaders and not overwrite:
 		_shaders["{}-copy".format(name)] = s
-		_pipelines["{}-copy".format(name)] = Pipeline(_dk, s, _descriptors[s.definition], s.animated)
+		_pipelines["{}-copy".format(name)] = _make_pipeline(s)
 	else:
 		_shaders[name] = s
-		_pipelines[name] = Pipeline(_dk, s, _descriptors[s.definition], s.animated)
+		_pipelines[name] = _make_pipeline(s)
 
 	if rename != None and rename != name:
 		remove_shader(rename)
 		_scene.side_effect('shader', rename, name)
 
+def _make_pipeline(s):
+	layouts = [_frame.layout, _descriptors[s.definition]]
+	return Pipeline(_dk, s, layouts, s.animated)
+
 def remove_shader(name):
 	global _shaders, _pipelines
 
@@ -260,7 +334,18 @@ def add_light_scene(name):
 	global _light_scenes
 
 	scene = SceneLighting()
+	# One uniform per scene, bound through the frame set of its entities
+	scene.buffer = UniformBuffer(_dk, SceneLighting)
+	scene.mark_dirty()
+
+	# Replacing a scene destroys its frame sets, which frames in flight
+	# may still bind
+	if name in _frame.sets:
+		_scene.wait_in_flight()
+		_scene.refresh(True)
+
 	_light_scenes[name] = scene
+	_frame.add_scene(name, scene)
 
 def set_camera_settings(position, rotation, fov, draw_distance, aspect_ratio):
 	global _camera
@@ -282,6 +367,32 @@ def mesh(name):
 		return _meshes[name]
 	return None
 
+def mesh_stats():
+	"""
+	Reports the size of every :class:`~diskovery_mesh.Mesh` in the dictionary
+	in this module, after its vertices were deduplicated
+
+	:returns: A dictionary mapping each mesh name to a tuple of its unique vertex count and index buffer entry count
+	"""
+	global _meshes
+	return dict((name, (m.vertex_count, m.count)) for name, m in _meshes.items())
+
+def draw_stats(renderer=-1):
+	"""
+	Reports what the last frame's command buffer of a renderer held
+
+	:param renderer: The index of the renderer, renderers added later come first, so the default is the main one
+	:returns: A dictionary with the counters in :data:`~diskovery_entity_manager.DRAW_STATS`, plus the number of ``binds_saved`` by drawing in sorted order, and the number of entities ``visible`` and ``culled`` by the last frame's frustum culling
+	"""
+	global _scene
+	r = _scene.renderers[renderer]
+
+	stats = dict(r.stats)
+	stats['binds_saved'] = r.binds_saved()
+	stats['visible'] = _scene.render_list.visible_count
+	stats['culled'] = _scene.render_list.culled_count
+	return stats
+
 def texture(name):
 	"""
 	Retrieve a :class:`~diskovery_image.Texture` from the dictionary in this module
@@ -314,6 +425,39 @@ def descriptor(definition):
 	global _descriptors
 	return _descriptors[definition]
 
+def set_allocator(definition):
+	"""
+	Retrieve the :class:`~diskovery_descriptor.DescriptorAllocator` handing
+	out the sets of a VkDescriptorSetLayout_ from the dictionary in this module
+
+	:param definition: The definition (key) of the VkDescriptorSetLayout_
+	"""
+	global _set_allocators
+	return _set_allocators[definition]
+
+def descriptor_stats():
+	"""
+	Reports how the descriptor sets of every entity were allocated
+
+	:returns: A dictionary summing the :meth:`~diskovery_descriptor.DescriptorAllocator.stats` of every shader definition
+	"""
+	global _set_allocators
+
+	stats = { }
+	for allocator in _set_allocators.values():
+		for key, value in allocator.stats().items():
+			stats[key] = stats.get(key, 0) + value
+
+	return stats
+
+def pipeline_stats():
+	"""
+	Reports how long creating the pipelines of every shader took
+
+	:returns: A dictionary with the number of ``pipelines`` created, the seconds spent in ``vkCreateGraphicsPipelines`` (``create_time``) and the bytes of pipeline cache data loaded at startup (``cache_loaded``, ``0`` when starting cold)
+	"""
+	return dict(_dk.pipeline_stats)
+
 def pipeline(name):
 	"""
 	Retrieve a :class:`~diskovery_pipeline.Pipeline` from the dictionary in this module
@@ -361,6 +505,44 @@ def refresh():
 	global _scene
 	_scene.refresh()
 
+def upload_assets(budget=None):
+	"""
+	Uploads every asset whose background loading work has finished and
+	refreshes the render list so entities waiting on them are drawn.
+	Called once per frame by :func:`run`.
+
+	:param budget: Optional number of seconds to spend uploading before leaving the rest for the next frame
+	:returns: The number of assets uploaded
+	"""
+	global _loader, _scene
+
+	if not _loader.ready():
+		return 0
+
+	# Every asset finished this frame is copied to the GPU in one submit
+	with _dk.uploads:
+		count = _loader.upload(budget)
+	_scene.refresh()
+
+	# Nothing left to load can reuse the parsed COLLADA documents
+	if _loader.pending == 0:
+		diskovery_collada.clear_cache()
+	return count
+
+def wait_for_assets():
+	"""
+	Blocks until every asset being loaded in the background is uploaded
+	"""
+	global _loader, _scene
+
+	if _loader.pending == 0:
+		return
+
+	with _dk.uploads:
+		_loader.wait()
+	_scene.refresh()
+	diskovery_collada.clear_cache()
+
 def init(debug_mode=False, config=None, edit_mode=False):
 	"""
 	Initializes the :class:`~diskovery_instance.DkInstance` and
@@ -370,12 +552,21 @@ def init(debug_mode=False, config=None, edit_mode=False):
 	:param debug_mode: Whether or not the :class:`~diskovery_instance.DkInstance` should be created with Vulkan Validation Layers
 	:param config: An optional dictionary of configuration values to set up the Diskovery instance
 	"""
-	global _dk, _scene, _camera, _input
+	global _dk, _scene, _camera, _input, _loader, _frame
 
 	pygame.init()
 
+	if config != None and 'pipeline_cache' in config:
+		diskovery_pipeline_cache.enabled = config['pipeline_cache']
+
 	_dk = DkInstance(debug_mode)
-	_scene = EntityManager(_dk)
+	_scene = EntityManager(
+		_dk,
+		config['record_threads'] if config != None and 'record_threads' in config else 1,
+		config['culling'] if config != None and 'culling' in config else True,
+		config['indirect_draws'] if config != None and 'indirect_draws' in config else False
+	)
+	_loader = AssetLoader(config['loader_threads'] if config != None and 'loader_threads' in config else None)
 
 	pygame.joystick.init()
 
@@ -384,6 +575,9 @@ def init(debug_mode=False, config=None, edit_mode=False):
 	else:
 		_input = InputManager("maininput.in")
 
+	if config != None and 'mesh_cache' in config:
+		diskovery_mesh_cache.enabled = config['mesh_cache']
+
 	r = Renderer(_dk, _dk.image_data['msaa_samples'], _dk.sc_image_views, edit_mode)
 	_scene.add_renderer(r)
 
@@ -430,6 +624,10 @@ def init(debug_mode=False, config=None, edit_mode=False):
 	_camera = Camera(cam_pos, cam_rot, fov, draw_distance, aspect_ratio)
 	_scene.add_entity(_camera, "Camera")
 
+	# Camera matrices and lights, bound once as set 0 of every pipeline
+	_frame = FrameDescriptor(_dk, _camera)
+	_scene.frame = _frame
+
 def draw():
 	_scene.draw()
 	_scene.draw()
@@ -459,6 +657,7 @@ def run(context = None):
 
 			#for ls in _light_scenes.values():
 			#ls.update()
+			upload_assets()
 			_scene.draw()
 			_input.update()
 
@@ -476,11 +675,12 @@ def run(context = None):
 
 def quit():
 	"""Handles necessary Vulkan Destroy methods for all Vulkan components"""
-	global _dk, _meshes, _textures, _pipelines, _descriptors, _scene, _running, _input
+	global _dk, _meshes, _textures, _pipelines, _descriptors, _scene, _running, _input, _light_scenes
 	_running = False
 
 	_scene.quitting = True
 	_input.quitting = True
+	_loader.shutdown()
 	_dk.DeviceWaitIdle(_dk.device)
 
 	# pygame.joystick.quit()
@@ -495,9 +695,16 @@ def quit():
 	for pipeline in _pipelines.values():
 		pipeline.cleanup()
 
+	# Along with the buffer of every light scene
+	_frame.cleanup()
+
+	for allocator in _set_allocators.values():
+		allocator.cleanup()
+
 	for descriptor in _descriptors.values():
 		_dk.DestroyDescriptorSetLayout(_dk.device, descriptor, None)
 
+	_dk.save_pipeline_cache()
 	_dk.cleanup()
 	pygame.quit()
 	sys.exit(0)
@@ -702,6 +909,9 @@ class Light(Entity):
 	presets = { }
 	types = [tuple, tuple, tuple, float, float, float, str]
 
+	# Attributes packed into the scene's SceneLighting uniform
+	_packed = ('position', 'rotation', 'tint', 'intensity', 'distance', 'spread')
+
 	def __init__(self, position, direction, tint, intensity, distance, spread, scene):
 		Entity.__init__(self, position, direction)
 
@@ -716,7 +926,15 @@ class Light(Entity):
 
 		self.scene = scene
 
-		_light_scenes[scene].lights.append(self)
+		_light_scenes[scene].add(self)
+
+	def __setattr__(self, name, value):
+		Entity.__setattr__(self, name, value)
+
+		# Repack the scene's lights on the next frame. Components changed
+		# in place (light.position.x = 1) aren't seen, assign a new vector
+		if name in Light._packed and 'scene' in self.__dict__:
+			_light_scenes[self.scene].mark_dirty()
 
 	def update(self, ind):
 		pass
@@ -780,7 +998,41 @@ class RenderedEntity(Entity):
 
 		A :class:`~diskovery_descriptor.Descriptor` defined by the definition described above,
 		the VkDescriptorSetLayout_ associated with that definition (in this module's dictionary
-		of descriptor set layouts, using the definition tuple as a key)
+		of descriptor set layouts, using the definition tuple as a key). Definitions with only
+		textures share one descriptor between every entity binding the same textures.
+
+	.. py:attribute:: draw_data
+
+		A :class:`~diskovery_ubos.DrawData` holding the model matrix, tint
+		and material values of the entity. Its model matrix and tint are
+		set by ``update``, and it is copied into the entity's row of the
+		:class:`~diskovery_buffer.InstanceBuffer` every frame, where the
+		vertex stage reads it
+
+	.. py:attribute:: push_data
+
+		An instance of the :class:`~diskovery_pipeline.Shader`'s push constant
+		type, or ``None``, as none of the stock shaders declare one. Its
+		bytes are recorded with the entity's draw call, so changes only
+		show once the command buffers are recorded again
+
+	.. py:attribute:: transform
+
+		The model matrix computed by the last ``update``, used to move
+		the mesh's bounding sphere into world space when culling
+
+	.. py:attribute:: tint
+
+		An RGBA tuple handed to the fragment stage through :attr:`draw_data`.
+		The default fragment shader multiplies its output by it, and the
+		selection shaders use it as the color of unlit entities
+
+	.. py:attribute:: instancing
+
+		Whether the entity may be drawn in one instanced draw with the other
+		entities sharing its shader, mesh, textures and light scene, when
+		the shader reads every per-draw value from :attr:`draw_data`.
+		``True`` by default
 
 	"""
 	global _dk
@@ -788,6 +1040,9 @@ class RenderedEntity(Entity):
 	presets = {}
 	types = [tuple, tuple, tuple, str, str, list, str]
 
+	instancing = True
+	tint = (1., 1., 1., 1.)
+
 	def __init__(self,
 		position=None,
 		rotation=None,
@@ -805,10 +1060,22 @@ class RenderedEntity(Entity):
 
 		self.textures = textures_str if textures_str != None else ["Default"]
 		self.mesh = mesh_str if mesh_str != None else None
+		self.transform = glm.mat4(1.0)
+		self.draw_data = DrawData()
 
 		self.fill_descriptor(shader_str, self.textures)
 
 	def fill_descriptor(self, shader_str, textures):
+		# Refilled when a shader or texture is replaced, once no frame in
+		# flight can still read the previous uniforms and sets
+		if hasattr(self, 'uniforms'):
+			for u in self.uniforms:
+				u.cleanup()
+
+		if hasattr(self, 'descriptor'):
+			self.descriptor.cleanup()
+			del self.descriptor
+
 		self.definition = shader(shader_str).definition if shader_str != None else shader("Default").definition
 		self.pipeline = shader_str
 		self.uniforms = []
@@ -819,13 +1086,26 @@ class RenderedEntity(Entity):
 		for u_type in uniform_types:
 			self.uniforms.append(UniformBuffer(_dk, u_type))
 
-		if len(self.definition) > 0:
+		# Recorded into the command buffer with the draw
+		push_type = shader(shader_str).push_constant
+		self.push_data = push_type() if push_type != None else None
+
+		# Refilled in place by update every frame, for shaders that take the
+		# model matrix as their first uniform rather than a push constant
+		self.mvp = None
+		if len(uniform_types) > 0 and uniform_types[0] in (MVPMatrix, ModelMatrix):
+			self.mvp = uniform_types[0]()
+
+		if len(self.definition) > 0 and len(uniform_types) == 0:
+			self.descriptor = set_allocator(self.definition).share([texture(t) for t in textures])
+		elif len(self.definition) > 0:
 			self.descriptor = Descriptor(
 				_dk,
 				self.definition,
 				descriptor(self.definition),
 				self.uniforms,
-				[texture(t) for t in textures]
+				[texture(t) for t in textures],
+				set_allocator(self.definition)
 			)
 
 	def update(self, ind):
@@ -835,18 +1115,35 @@ class RenderedEntity(Entity):
 
 		:param ind: the index indicating which :class:`~diskovery_buffer.Buffer` in each :class:`~diskovery_buffer.UniformBuffer` should be filled with new data
 		"""
-		m = MVPMatrix()
-
-		m.model = glm.scale(glm.translate(glm.mat4(1.0), self.position) * \
+		model = glm.scale(glm.translate(glm.mat4(1.0), self.position) * \
 				  glm.mat4_cast(glm.quat(self.rotation)), self.scale)
+		self.transform = model
+
+		self.draw_data.model = model
+		self.draw_data.tint = self.tint
 
-		m.view = _camera.view_matrix
-		m.projection = _camera.proj_matrix
+		if self.push_data != None:
+			self.push_data.model = model
 
-		self.uniforms[0].update(m.get_data(), ind)
+		m = self.mvp
+		if m != None:
+			m.model = model
 
-		if hasattr(self, 'light_scene'):
-			self.uniforms[1].update(_light_scenes[self.light_scene].get_data(), ind)
+			# The camera and lights are written once per frame by the FrameDescriptor
+			if isinstance(m, MVPMatrix):
+				m.view = _camera.view_matrix
+				m.projection = _camera.proj_matrix
+
+			self.uniforms[0].update(m.get_data(), ind)
+
+	def get_frame_set(self, index):
+		"""
+		Retrieves the frame set (set 0) holding the camera matrices and the
+		lights of this :class:`~diskovery.RenderedEntity`'s light scene
+
+		:returns: The VkDescriptorSet_ for the framebuffer at the given index
+		"""
+		return _frame.get_set(getattr(self, 'light_scene', None), index)
 
 	def get_pipeline(self):
 		"""
@@ -936,8 +1233,7 @@ class Terrain(RenderedEntity):
 
 	def update(self, ind):
 		RenderedEntity.update(self, ind)
-		sub_val = Float(self.sub_div)
-		self.uniforms[2].update(sub_val.get_data(), ind)
+		self.draw_data.sub = self.sub_div
 
 	def make_mesh(self):
 		self.img = pygame.image.load(self.heightmap)
@@ -1010,10 +1306,21 @@ class AnimatedEntity(RenderedEntity):
 		RenderedEntity.__init__(self, position, rotation, scale, shader_str, mesh_str, textures_str, light_scene)
 
 		self.animations = animations_str if animations_str != None else []
-		self.rig = Rig.from_template(mesh(mesh_str).rig)
+		self.rig = None
+		self.make_rig()
 
 		self.animator = Animator(_scene, _animations, self, self.animations)
 
+	def make_rig(self):
+		"""
+		Copies the rig of this entity's mesh. Returns False if the mesh
+		is still being loaded in the background.
+		"""
+		if self.rig is None and mesh(self.mesh) != None:
+			self.rig = Rig.from_template(mesh(self.mesh).rig)
+
+		return self.rig != None
+
 	def update(self, ind):
 		"""
 		Updates every :class:`~diskovery_buffer.UniformBuffer` stored in
@@ -1024,11 +1331,11 @@ class AnimatedEntity(RenderedEntity):
 
 		RenderedEntity.update(self, ind)
 
+		if not self.make_rig():
+			return
+
 		self.animator.update()
-		if hasattr(self, 'light_scene'):
-			self.uniforms[2].update(self.rig.get_joint_data(), ind)
-		else:
-			self.uniforms[1].update(self.rig.get_joint_data(), ind)
+		self.uniforms[0].update(self.rig.get_joint_data(), ind)
 
 def _save_scene(filename, scene_name):
 	global _meshes, _textures, _shaders, _animations, _scene
@@ -1142,5 +1449,5 @@ def is_used(asset_type, name):
 def remove_entity(name):
 	global _scene, _light_scenes
 	if hasattr(entity(name), 'scene'):
-		_light_scenes[entity(name).scene].lights.remove(entity(name))
+		_light_scenes[entity(name).scene].remove(entity(name))
 	_scene.remove_entity(name)
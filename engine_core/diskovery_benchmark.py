@@ -0,0 +1,511 @@
+#!/bin/env/python
+
+"""
+The :mod:`diskovery_benchmark` module collects small timing scripts used
+to compare different implementations of the same DisKovery feature. Each
+benchmark is registered by name at the bottom of the module, and can be
+run from the ``engine_core`` directory with::
+
+	python diskovery_benchmark.py [name ...]
+
+When no names are given, every registered benchmark is run in turn.
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as xml
+import diskovery_collada
+import diskovery_mesh_cache
+import diskovery_shader_cache
+from diskovery_loader import AssetLoader
+from diskovery_image import decode_image
+from diskovery_mesh import Parser, ParseType, load_model, load_animation
+
+def best_of(fn, repeat=3):
+	"""
+	Calls ``fn`` ``repeat`` times and returns the shortest run, in seconds.
+	Taking the minimum filters out most of the noise from other processes.
+	"""
+	best = None
+	for i in range(0, repeat):
+		start = time.perf_counter()
+		fn()
+		elapsed = time.perf_counter() - start
+
+		if best == None or elapsed < best:
+			best = elapsed
+
+	return best
+
+def bench_obj(files=('tree.obj', 'rock.obj'), repeat=3):
+	"""
+	Compares :meth:`~diskovery_mesh.Parser.load_obj` against the packed
+	``numpy`` loader, :meth:`~diskovery_mesh.Parser.load_obj_packed`.
+	"""
+	for file in files:
+		legacy = best_of(lambda: Parser(file, ParseType.OBJ_MODEL), repeat)
+		packed = best_of(lambda: Parser(file, ParseType.PACKED_OBJ_MODEL), repeat)
+
+		print("{}: load_obj {:.4f}s, load_obj_packed {:.4f}s ({:.1f}x)".format(
+			file, legacy, packed, legacy / packed
+		))
+
+def bench_dedup(files=('tree.obj', 'rock.obj', 'plant.obj', 'model.dae'), repeat=3):
+	"""
+	Times every parser that goes through :func:`~diskovery_mesh.deduplicate`
+	and reports how many unique vertices and index buffer entries each
+	mesh produced.
+	"""
+	for file in files:
+		if file.split('.')[1] == 'obj':
+			parse_types = (ParseType.OBJ_MODEL, ParseType.PACKED_OBJ_MODEL)
+		else:
+			parse_types = (ParseType.DAE_MODEL,)
+
+		for parse_type in parse_types:
+			elapsed = best_of(lambda: Parser(file, parse_type), repeat)
+			data = Parser(file, parse_type).data
+
+			print("{} ({}): {:.4f}s, {} vertices, {} indices".format(
+				file, parse_type.name, elapsed, len(data[0]), len(data[1])
+			))
+
+def bench_cache(files=('tree.obj', 'rock.obj', 'plant.obj'), repeat=3):
+	"""
+	Compares parsing each model against memory-mapping its compiled
+	``.dkmesh`` entry from :mod:`diskovery_mesh_cache`.
+	"""
+	for file in files:
+		diskovery_mesh_cache.enabled = False
+		parsed = best_of(lambda: load_model(file), repeat)
+
+		diskovery_mesh_cache.enabled = True
+		load_model(file)
+		cached = best_of(lambda: load_model(file), repeat)
+
+		print("{}: parsed {:.4f}s, cached {:.4f}s ({:.1f}x)".format(
+			file, parsed, cached, parsed / cached
+		))
+
+def peak_memory(fn):
+	"""
+	Calls ``fn`` once and returns its elapsed time in seconds and the peak
+	memory allocated while it ran, in bytes, as seen by ``tracemalloc``.
+	"""
+	tracemalloc.start()
+	start = time.perf_counter()
+	result = fn()
+	elapsed = time.perf_counter() - start
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+
+	del result
+	return (elapsed, peak)
+
+def bench_collada(files=('model.dae',)):
+	"""
+	Reports the time and peak memory of reading every section of a COLLADA
+	file with the streaming :class:`~diskovery_collada.ColladaDocument`,
+	next to the previous approach of keeping the full ``xml.parse`` DOM
+	alive and splitting the array text into Python lists.
+	"""
+	def dom(file):
+		root = xml.parse(file).getroot()
+		arrays = []
+		for tag in ('float_array', 'p', 'v', 'vcount'):
+			for node in root.iter(tag):
+				arrays.append([float(x) for x in ' '.join(node.text.split('\n')).split(' ') if x != ''])
+		return (root, arrays)
+
+	def stream(file):
+		doc = diskovery_collada.ColladaDocument(file)
+		return (doc.geometry, doc.skin, doc.skeleton, doc.animations)
+
+	for file in files:
+		size = os.path.getsize(file)
+		dom_time, dom_peak = peak_memory(lambda: dom(file))
+		stream_time, stream_peak = peak_memory(lambda: stream(file))
+
+		print("{} ({:.1f} MB): DOM {:.4f}s peak {:.1f} MB, streamed {:.4f}s peak {:.1f} MB".format(
+			file, size / 2**20, dom_time, dom_peak / 2**20, stream_time, stream_peak / 2**20
+		))
+
+def scene_textures(scene):
+	"""
+	Returns the image files listed in the ``Textures`` section of a .dk scene
+	"""
+	with open(scene, 'r') as f:
+		lines = f.read().splitlines()
+
+	files = []
+	for line in lines[lines.index('Textures') + 1:]:
+		if ' ' not in line:
+			break
+		files.append(line.split(' ')[0])
+	return files
+
+def bench_startup(scene='terrain.dk', workers=None):
+	"""
+	Times the CPU side of loading every mesh, texture and animation of a
+	.dk scene, first one after another and then through an
+	:class:`~diskovery_loader.AssetLoader`. The mesh cache is turned off
+	so every model is parsed.
+	"""
+	meshes, animations = diskovery_mesh_cache.scene_assets(scene)
+	textures = scene_textures(scene)
+
+	jobs = [(load_model, file, animated, animated) for file, animated in meshes] + \
+		[(decode_image, file) for file in textures] + \
+		[(load_animation, file, True) for file in animations]
+
+	diskovery_mesh_cache.enabled = False
+
+	def sequential():
+		diskovery_collada.clear_cache()
+		for job in jobs:
+			job[0](*job[1:])
+
+	def pooled():
+		diskovery_collada.clear_cache()
+		loader = AssetLoader(workers)
+
+		start = time.perf_counter()
+		for job in jobs:
+			loader.submit(job[0], lambda result: result, *job[1:])
+		blocked = time.perf_counter() - start
+
+		loader.wait()
+		loader.shutdown()
+		return blocked
+
+	start = time.perf_counter()
+	sequential()
+	before = time.perf_counter() - start
+
+	start = time.perf_counter()
+	blocked = pooled()
+	after = time.perf_counter() - start
+
+	diskovery_mesh_cache.enabled = True
+
+	print("{} ({} assets): sequential {:.4f}s, loader {:.4f}s ({:.4f}s blocking the caller)".format(
+		scene, len(jobs), before, after, blocked
+	))
+
+def bench_ubos(count=1000, joints=30, frames=20):
+	"""
+	Times preparing the uniform data of a frame with ``count`` entities,
+	each with a model-view-projection matrix and ``joints`` animated
+	joints, and reports the peak memory allocated while doing it. The
+	previous approach of building new ``ctypes`` arrays row by row every
+	frame is compared against the preallocated
+	:class:`~diskovery_ubos.MVPMatrix` and :class:`~diskovery_ubos.JointData`.
+	"""
+	import glm
+	from ctypes import c_float, c_char, memmove, sizeof, byref
+	from diskovery_ubos import MVPMatrix, JointData
+
+	matrix_type = (c_float*4)*4
+	# Stands in for the mapped memory both approaches copy their data into
+	staging = (c_char*(MVPMatrix.get_size() + JointData.get_size()))()
+
+	def write(mvp, joint_data):
+		memmove(staging, mvp, sizeof(mvp))
+		memmove(byref(staging, sizeof(mvp)), joint_data, sizeof(joint_data))
+
+	transforms = [glm.rotate(glm.mat4(1.0), i * 0.1, glm.vec3(0, 1, 0)) for i in range(0, joints)]
+	model = glm.translate(glm.mat4(1.0), glm.vec3(1, 2, 3))
+
+	def matrix_rows(matrix):
+		m_data = matrix_type()
+		for i, row in enumerate(matrix):
+			m_data[i] = (c_float*4)(*row)
+		return m_data
+
+	def rebuilt():
+		for e in range(0, count):
+			mvp = (matrix_type*3)(matrix_rows(model), matrix_rows(model), matrix_rows(model))
+			joint_data = (matrix_type*joints)()
+			for j, transform in enumerate(transforms):
+				joint_data[j] = matrix_rows(transform)
+			write(mvp, joint_data)
+
+	entities = [(MVPMatrix(), JointData()) for e in range(0, count)]
+	def preallocated():
+		for mvp, joint_data in entities:
+			mvp.model = mvp.view = mvp.projection = model
+			for j, transform in enumerate(transforms):
+				joint_data.set(j, transform)
+			write(mvp.get_data(), joint_data.get_data())
+
+	for name, frame in (('rebuilt', rebuilt), ('preallocated', preallocated)):
+		elapsed = best_of(frame)
+		peak = peak_memory(lambda: [frame() for f in range(0, frames)])[1]
+
+		print("{} entities, {} joints, {}: {:.2f}ms/frame, peak {:.1f} KB allocated".format(
+			count, joints, name, elapsed * 1000, peak / 1024
+		))
+
+def bench_uniforms(count=1000, frames=100):
+	"""
+	Times the uniform writes of a frame with ``count`` entities, each with
+	a model-view-projection matrix and a light scene. Slices of the
+	:class:`~diskovery_buffer.UniformArena` are compared against the old
+	approach of mapping, writing and unmapping a uniform's memory on every
+	update. Unlike the other benchmarks, this one needs a Vulkan device
+	and opens a window.
+	"""
+	from ctypes import memmove, byref, c_void_p
+	import vk
+	import diskovery
+	from diskovery_buffer import UniformBuffer, MemoryBlock, align
+	from diskovery_ubos import MVPMatrix, SceneLighting
+
+	diskovery.init(False, {'fullscreen': False})
+	dk = diskovery._dk
+	arena = dk.uniform_arena
+	images = dk.image_data['count']
+
+	u_types = (MVPMatrix, SceneLighting)
+	data = [u_type().get_data() for u_type in u_types]
+	sizes = [u_type.get_size() for u_type in u_types]
+
+	sliced = [UniformBuffer(dk, u_type) for i in range(0, count) for u_type in u_types]
+
+	# The old path needs memory that is not already mapped, so every back
+	# buffer gets one unmapped block and each update maps its own range
+	stride = sum(align(size, arena.alignment) for size in sizes)
+	type_index = dk.get_memory_type(
+		arena.pages[0][0].mem_req.memory_type_bits,
+		vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT | vk.MEMORY_PROPERTY_HOST_COHERENT_BIT
+	)
+	blocks = [MemoryBlock(dk, (type_index, True), stride * count, False) for i in range(0, images)]
+
+	def arena_frame(ind):
+		for i, u in enumerate(sliced):
+			u.update(data[i % 2], ind)
+
+	def mapped_frame(ind):
+		memory = blocks[ind].memory
+		dst = c_void_p(0)
+		for e in range(0, count):
+			offset = e * stride
+			for k in range(0, 2):
+				dk.MapMemory(dk.device, memory, offset, sizes[k], 0, byref(dst))
+				memmove(dst, data[k], sizes[k])
+				dk.UnmapMemory(dk.device, memory)
+				offset += align(sizes[k], arena.alignment)
+
+	def run(frame):
+		for f in range(0, frames):
+			frame(f % images)
+
+	before = best_of(lambda: run(mapped_frame)) / frames
+	after = best_of(lambda: run(arena_frame)) / frames
+
+	print("{} entities: map per update {:.3f}ms/frame, arena {:.3f}ms/frame ({:.1f}x)".format(
+		count, before * 1000, after * 1000, before / after
+	))
+
+	for u in sliced:
+		u.cleanup()
+	for block in blocks:
+		block.cleanup()
+	diskovery.quit()
+
+def bench_frame(count=1000, frames=20):
+	"""
+	Times the uniform writes of a frame with ``count`` lit entities. The
+	previous layout, where every entity copied the camera matrices and its
+	light scene into its own uniforms, is compared against the frame set,
+	where each entity only writes its model matrix and the camera is
+	written once. Copies go into a plain host buffer, so no device is needed.
+	"""
+	import glm
+	from ctypes import memmove, sizeof, create_string_buffer
+	from diskovery_ubos import MVPMatrix, ModelMatrix, CameraData, SceneLighting
+
+	model = glm.translate(glm.mat4(1.0), glm.vec3(1, 2, 3))
+	lighting = SceneLighting()
+	target = create_string_buffer(count * (MVPMatrix.get_size() + SceneLighting.get_size()))
+
+	def per_entity():
+		written = 0
+		for e in range(0, count):
+			m = MVPMatrix()
+			m.model = m.view = m.projection = model
+			for data in (m.get_data(), lighting.get_data()):
+				memmove(target, data, sizeof(data))
+				written += sizeof(data)
+		return written
+
+	camera = CameraData()
+	matrices = [ModelMatrix() for e in range(0, count)]
+	def frame_set():
+		camera.view = camera.projection = model
+		memmove(target, camera.get_data(), CameraData.get_size())
+		written = CameraData.get_size()
+		for m in matrices:
+			m.model = model
+			memmove(target, m.get_data(), ModelMatrix.get_size())
+			written += ModelMatrix.get_size()
+		return written
+
+	for name, frame in (('per entity', per_entity), ('frame set', frame_set)):
+		elapsed = best_of(lambda: [frame() for f in range(0, frames)]) / frames
+		print("{} entities, {}: {:.2f}ms/frame, {:.1f} KB written".format(
+			count, name, elapsed * 1000, frame() / 1024
+		))
+
+def bench_shaders(shaders=(("default.vert", "selection.frag"), ("basic.vert", "basic.frag"),
+	("default.vert", "terrain_selection.frag"), ("default.vert", "default.frag"))):
+	"""
+	Times building the shaders the editor starts with as
+	:class:`~diskovery_pipeline.Shader` objects. With an empty cache every
+	stage is compiled, first one stage at a time as before, then with all
+	stages compiled at once through
+	:func:`~diskovery_shader_cache.compile_all`. The last run finds every
+	stage in the cache. Needs ``glslangValidator`` on the ``PATH``.
+	"""
+	from diskovery_pipeline import Shader
+
+	threads = diskovery_shader_cache.COMPILE_THREADS
+
+	def build():
+		for vert, frag in shaders:
+			Shader([vert, frag])
+
+	def one_at_a_time():
+		diskovery_shader_cache.COMPILE_THREADS = 1
+		build()
+		diskovery_shader_cache.COMPILE_THREADS = threads
+
+	def parallel():
+		diskovery_shader_cache.compile_all([f for s in shaders for f in s])
+		build()
+
+	for name, fn in (('cold, one at a time', one_at_a_time), ('cold, parallel', parallel)):
+		diskovery_shader_cache.invalidate()
+		start = time.perf_counter()
+		fn()
+		print("{} shaders, {}: {:.3f}s".format(len(shaders), name, time.perf_counter() - start))
+
+	print("{} shaders, cached: {:.3f}s".format(len(shaders), best_of(build)))
+
+def bench_pipelines(shaders=(("default.vert", "selection.frag", "Selection"),
+	("basic.vert", "basic.frag", "Basic"), ("default.vert", "terrain_selection.frag", "Terrain"),
+	("default.vert", "default.frag", "Default"))):
+	"""
+	Times creating the pipelines of the shaders the editor starts with,
+	first from an empty VkPipelineCache_ and then from one loaded with the
+	data saved by :mod:`diskovery_pipeline_cache`. Drivers that keep their
+	own shader cache on disk may already be warm on the first run. This
+	one needs a Vulkan device and opens a window.
+	"""
+	import diskovery
+	import diskovery_pipeline_cache
+
+	diskovery.init(False, {'fullscreen': False})
+	dk = diskovery._dk
+
+	def restart(load):
+		dk.DeviceWaitIdle(dk.device)
+		dk.DestroyPipelineCache(dk.device, dk.pipeline_cache, None)
+		diskovery_pipeline_cache.enabled = load
+		dk.create_pipeline_cache()
+		diskovery_pipeline_cache.enabled = True
+
+	for name, load in (('empty cache', False), ('warm cache', True)):
+		restart(load)
+		dk.pipeline_stats['pipelines'] = 0
+		dk.pipeline_stats['create_time'] = 0.0
+
+		for vert, frag, shader in shaders:
+			diskovery.add_shader(vert, frag, shader)
+
+		stats = diskovery.pipeline_stats()
+		print("{} pipelines, {}: {:.3f}s ({} bytes loaded)".format(
+			stats['pipelines'], name, stats['create_time'], stats['cache_loaded']
+		))
+
+		dk.save_pipeline_cache()
+		for vert, frag, shader in shaders:
+			diskovery.remove_shader(shader)
+
+	diskovery.quit()
+
+def bench_scene_load(count=1000):
+	"""
+	Times adding ``count`` entities to a scene and drawing the first
+	frame. The old behaviour, where every :func:`~diskovery.add_entity`
+	recorded every command buffer again, is replayed by rebuilding the
+	render list and recording all of them after each add. With the
+	:class:`~diskovery_entity_manager.RenderList` the adds only mark it
+	as changed, and the first frame records the one command buffer it
+	submits. This one needs a Vulkan device and opens a window.
+	"""
+	import diskovery
+
+	diskovery.init(False, {'fullscreen': False})
+	diskovery.add_shader("basic.vert", "basic.frag", "Basic")
+	diskovery.add_mesh("cursor.obj", "Cursor", False)
+	diskovery.add_texture("cursor.png", "Cursor")
+	diskovery.add_light_scene("MainLight")
+
+	scene = diskovery._scene
+
+	def load(name, rebuild):
+		for i in range(0, count):
+			diskovery.add_entity(diskovery.RenderedEntity(
+				position=(i % 32, 0, i // 32),
+				shader_str="Basic",
+				mesh_str="Cursor",
+				textures_str=["Cursor"]
+			), "{}{}".format(name, i))
+
+			if rebuild:
+				scene.render_list.update()
+				for r in scene.renderers:
+					for index in range(0, r.buffer_count):
+						r.record(index, scene.render_list)
+
+		scene.draw()
+		scene.dk.DeviceWaitIdle(scene.dk.device)
+
+	def unload(name):
+		for i in range(0, count):
+			diskovery.remove_entity("{}{}".format(name, i))
+		scene.draw()
+
+	for name, rebuild in (('record on every add', True), ('record on draw', False)):
+		start = time.perf_counter()
+		load(name, rebuild)
+		elapsed = time.perf_counter() - start
+		unload(name)
+
+		print("{} entities, {}: {:.3f}s".format(count, name, elapsed))
+
+	diskovery.quit()
+
+_benchmarks = {
+	'obj': bench_obj,
+	'dedup': bench_dedup,
+	'cache': bench_cache,
+	'collada': bench_collada,
+	'startup': bench_startup,
+	'ubos': bench_ubos,
+	'uniforms': bench_uniforms,
+	'frame': bench_frame,
+	'shaders': bench_shaders,
+	'pipelines': bench_pipelines,
+	'scene_load': bench_scene_load
+}
+
+if __name__ == '__main__':
+	names = sys.argv[1:] if len(sys.argv) > 1 else list(_benchmarks.keys())
+
+	for name in names:
+		print("== {} ==".format(name))
+		_benchmarks[name]()
@@ -9,10 +9,25 @@ graphics card within a CPU). The transferring of data into these regions
 is handled by very low level C commands, which are wrapped by the
 :class:`~diskovery_buffer.Buffer` class for convenience and readability.
 
-There are two classes defined within the :mod:`~diskovery_buffer` module:
+The memory behind every buffer and image is handed out by a
+:class:`~diskovery_buffer.MemoryAllocator`, which carves many objects out of
+a few large VkDeviceMemory_ blocks rather than allocating memory for each one.
+
+There are thirteen classes defined within the :mod:`~diskovery_buffer` module:
 
 - :class:`~diskovery_buffer.Buffer` - for general purpose buffer and memory operations
 - :class:`~diskovery_buffer.UniformBuffer` - for passing data to a :class:`~diskovery_descriptor.Descriptor` with an array of :class:`~diskovery_buffer.Buffer` objects
+- :class:`~diskovery_buffer.UniformArena` - for packing every :class:`~diskovery_buffer.UniformBuffer` into a few shared, mapped buffers
+- :class:`~diskovery_buffer.GeometryArena` - for packing the vertices and indices of every mesh into a few shared buffers
+- :class:`~diskovery_buffer.InstanceBuffer` - for the per-draw vertex data of every entity, written once per frame
+- :class:`~diskovery_buffer.IndirectBuffer` - for the draw commands read by indirect draws, written once per frame
+- :class:`~diskovery_buffer.UploadBatch` - for recording many transfers into one command buffer that is submitted once
+- :class:`~diskovery_buffer.MemoryAllocator` - for sub-allocating buffer and image memory from shared blocks
+- :class:`~diskovery_buffer.MemoryBlock` - for one VkDeviceMemory_ allocation the :class:`~diskovery_buffer.MemoryAllocator` splits into ranges
+- :class:`~diskovery_buffer.Allocation` - for the range of a :class:`~diskovery_buffer.MemoryBlock` given to one buffer or image
+- :class:`~diskovery_buffer.FreeList` - for the free ranges of a :class:`~diskovery_buffer.MemoryBlock` or :class:`~diskovery_buffer.GeometryPage`
+- :class:`~diskovery_buffer.GeometryPage` - for one pair of shared vertex and index buffers of the :class:`~diskovery_buffer.GeometryArena`
+- :class:`~diskovery_buffer.GeometryRange` - for the vertices and indices of one mesh within a :class:`~diskovery_buffer.GeometryPage`
 
 .. _VkBuffer: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkBuffer.html
 .. _VkDeviceMemory: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkDeviceMemory.html
@@ -20,11 +35,12 @@ There are two classes defined within the :mod:`~diskovery_buffer` module:
 """
 
 import vk
+import numpy as np
 from ctypes import *
 
 class Buffer(object):
 	"""
-	There are 3 distinct uses of the :class:`~diskovery_buffer.Buffer` class,
+	There are 5 distinct uses of the :class:`~diskovery_buffer.Buffer` class,
 	which can be differentiated by how many of the optional arguments are
 	given in its constructor:
 
@@ -58,6 +74,22 @@ class Buffer(object):
 		The primary usage of the standard buffer is to store
 		vertex and input data for :class:`~diskovery_mesh.Mesh` objects.
 
+		The data is written into the staging ring of the instance's
+		:class:`~diskovery_buffer.UploadBatch` rather than a staging
+		buffer of its own, and the copy is recorded into the batch.
+
+	#.  A Device Buffer (size and usage defined, ``local`` set)
+
+		An empty buffer in device local memory, filled a range at a time
+		with :meth:`write`. The :class:`~diskovery_buffer.GeometryArena`
+		packs many meshes into each of these.
+
+	#.  A Host Buffer (size and usage defined)
+
+		An empty buffer in host visible, coherent memory with the given
+		usage. The :class:`~diskovery_buffer.UploadBatch` keeps one mapped
+		for its whole lifetime as its staging ring.
+
 	The actual data to be stored in the buffer (passed in the ``info``
 	argument) must be passed in a ``ctypes`` array or a ``Structure``.
 	Python lists are easily converted to ``ctypes`` arrays:::
@@ -85,8 +117,19 @@ class Buffer(object):
 
 	.. py:attribute:: memory
 
-		Stores the VkDeviceMemory_ handle Vulkan will generate when memory on
-		the Vulkan device is allocated
+		The VkDeviceMemory_ block the buffer is bound to. The block is
+		shared with other buffers, see :attr:`allocation`.
+
+	.. py:attribute:: allocation
+
+		The :class:`~diskovery_buffer.Allocation` holding the buffer's
+		range of :attr:`memory`
+
+	.. py:attribute:: mapped
+
+		The host address of the buffer's memory, or ``None`` if it is not
+		host visible. Host visible memory stays mapped for the lifetime
+		of its block.
 
 	.. py:attribute:: size
 
@@ -117,9 +160,12 @@ class Buffer(object):
 			based on which type of buffer it is:
 
 			- Uniform Buffer: ``VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT``
-			- Staging Buffer: ``VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT``
+			- Staging Buffer: ``VK_MEMORY_PROPERTY_HOST_VISIBLE_BIT | VK_MEMORY_PROPERTY_HOST_COHERENT_BIT``
 			- Standard Buffer: ``VK_MEMORY_PROPERTY_DEVICE_LOCAL_BIT``
 
+			Host visible memory is always requested as coherent, since it
+			stays mapped and is never flushed by hand.
+
 		"""
 		buffer_info = vk.BufferCreateInfo(
 			s_type=vk.STRUCTURE_TYPE_BUFFER_CREATE_INFO,
@@ -136,83 +182,95 @@ class Buffer(object):
 			byref(self.mem_req)
 		)
 
-		alloc_info = vk.MemoryAllocateInfo(
-			s_type=vk.STRUCTURE_TYPE_MEMORY_ALLOCATE_INFO,
-			allocation_size=self.mem_req.size,
-			memory_type_index=self.dk.get_memory_type(
-				self.mem_req.memory_type_bits,
-				props
-			)
-		)
+		self.allocation = self.dk.allocator.allocate(self.mem_req, props)
+		self.memory = self.allocation.memory
+		self.mapped = self.allocation.mapped
 
-		self.dk.AllocateMemory(self.dk.device, byref(alloc_info), None, byref(self.memory))
-		self.dk.BindBufferMemory(self.dk.device, self.buffer, self.memory, 0)
+		self.dk.BindBufferMemory(self.dk.device, self.buffer, self.memory, self.allocation.offset)
 
-	def copy_buffer(self, src, dst, size):
+	def copy_buffer(self, src, dst, size, src_offset=0, dst_offset=0):
 		"""
-		Wraps the vkCmdCopyBuffer_ function with a single use VkCommandBuffer_
-		to submit the copy command to the graphics queue. Copies the entire
-		contents of one buffer to another, with the offset of both buffers set to ``0``.
+		Records the vkCmdCopyBuffer_ function into the instance's
+		:class:`~diskovery_buffer.UploadBatch`. Copies ``size`` bytes from
+		``src_offset`` in one buffer to ``dst_offset`` in another. Unless a
+		batch is open, the copy is submitted before this method returns.
 
 		:param src: The VkBuffer_ from which data will be transfered
 		:param dst: The VkBuffer_ to which data will be transfered
 		:param size: The size of the data to transfer (should be the size of both buffers as well)
-
-		.. _VkCommandBuffer: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkCommandBuffer.html
+		:param src_offset: Where in ``src`` the data starts, in bytes
+		:param dst_offset: Where in ``dst`` the data is copied to, in bytes
 		"""
-		cmd = self.dk.start_command()
-
-		region = vk.BufferCopy(src_offset=0, dst_offset=0, size=0)
-		region.size = size
-		self.dk.CmdCopyBuffer(cmd, src, dst, 1, byref(region))
+		with self.dk.uploads as batch:
+			region = vk.BufferCopy(src_offset=src_offset, dst_offset=dst_offset, size=size)
+			self.dk.CmdCopyBuffer(batch.begin(), src, dst, 1, byref(region))
 
-		self.dk.end_command(cmd)
+	def write(self, info, size, offset):
+		"""
+		Uploads ``size`` bytes of ``info`` into a device buffer, starting
+		``offset`` bytes in, through the instance's
+		:class:`~diskovery_buffer.UploadBatch`
+		"""
+		with self.dk.uploads as batch:
+			staging, staged = batch.stage(info, size)
+			self.copy_buffer(staging, self.buffer, size, staged, offset)
 
-	def __init__(self, dk, size, info=None, usage=None, uniform=True):
+	def __init__(self, dk, size, info=None, usage=None, uniform=True, local=False):
 		self.dk = dk
 		# The Vulkan buffer (VkBuffer) that will be referenced elsewhere
 		self.buffer = vk.Buffer(0)
-		# An allocation of memory (VkDeviceMemory) the buffer will be stored in
+		# The block of memory (VkDeviceMemory) the buffer is stored in
 		self.memory = vk.DeviceMemory(0)
+		# The range of that block given to this buffer (Allocation)
+		self.allocation = None
+		# Host address of the buffer's memory, if it is host visible
+		self.mapped = None
 		# A value that stores the size of the buffer (VkDeviceSize)
 		self.size = size
 
 
 		if info != None and usage != None:
-			# Create a standard buffer, wrapped with a staging buffer
-			staging_buffer = Buffer(self.dk, size, info)
+			# Create a standard buffer, filled through the upload batch
 			self.make_buffer(
 				vk.BUFFER_USAGE_TRANSFER_DST_BIT | usage,
 				vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT
 			)
 
-			self.copy_buffer(staging_buffer.buffer, self.buffer, size)
-			staging_buffer.cleanup()
+			with self.dk.uploads as batch:
+				staging, offset = batch.stage(info, size)
+				self.copy_buffer(staging, self.buffer, size, offset)
 
 		elif info != None and usage == None:
 			# Create a staging buffer to transfer the data
 			self.make_buffer(
 				vk.BUFFER_USAGE_TRANSFER_SRC_BIT,
-				vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT
+				vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT |
+				vk.MEMORY_PROPERTY_HOST_COHERENT_BIT
 			)
 
-			data = vk.c_void_p(0)
-			self.dk.MapMemory(
-				self.dk.device,
-				self.memory,
-				0,
-				self.mem_req.size,
-				0,
-				byref(data)
+			memmove(self.mapped, info, size)
+		elif info == None and usage != None and local:
+			# Create an empty buffer to be filled through the upload batch
+			self.make_buffer(
+				vk.BUFFER_USAGE_TRANSFER_DST_BIT | usage,
+				vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT
 			)
-			memmove(data, info, size)
-			self.dk.UnmapMemory(self.dk.device, self.memory)
+
+		elif info == None and usage != None:
+			# Create an empty buffer the host can write into
+			self.make_buffer(
+				usage,
+				vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT |
+				vk.MEMORY_PROPERTY_HOST_COHERENT_BIT
+			)
+
 		elif info == None and usage == None and not uniform:
 			# Destination buffer for data to be dropped in
 
 			self.make_buffer(
 				vk.BUFFER_USAGE_TRANSFER_DST_BIT,
-				vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT
+				vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT |
+				vk.MEMORY_PROPERTY_HOST_COHERENT_BIT
 			)
 
 		else:
@@ -228,8 +286,11 @@ class Buffer(object):
 		Handles necessary Destroy methods for all the Vulkan components
 		contained inside the :class:`~diskovery_buffer.Buffer`
 		"""
+		# A recorded copy may still refer to this buffer
+		self.dk.uploads.flush()
+
 		self.dk.DestroyBuffer(self.dk.device, self.buffer, None)
-		self.dk.FreeMemory(self.dk.device, self.memory, None)
+		self.dk.allocator.free(self.allocation)
 
 class UniformBuffer(object):
 	"""
@@ -240,12 +301,15 @@ class UniformBuffer(object):
 	:class:`~diskovery_buffer.UniformBuffer` defined for each uniform
 	listed in the definition of that RenderedEntity's :class:`~diskovery_pipeline.Shader`.
 
-	Each :class:`~diskovery_buffer.Uniform_Buffer` holds a list of
+	Each :class:`~diskovery_buffer.Uniform_Buffer` refers to a list of
 	:class:`~diskovery_buffer.Buffer` objects with a length that is
 	determined by the number of back buffers the VkPhysicalDevice_ can
 	handle, a value that is calculated in the
 	:meth:`~diskovery_instance.DkInstance.create_swap_chain` method
-	of the :class:`~diskovery_instance.DkInstance` class.
+	of the :class:`~diskovery_instance.DkInstance` class. The buffers
+	belong to the instance's :class:`~diskovery_buffer.UniformArena` and
+	are shared with other uniforms, each of which owns the slice starting
+	at its :attr:`offset`.
 
 	**Attributes of the UniformBuffer class:**
 
@@ -271,8 +335,13 @@ class UniformBuffer(object):
 		The list in which :class:`~diskovery_buffer.Buffer` objects are stored.
 		The :class:`~diskovery_instance.DkInstance` stores the number of
 		back buffers the VkPhysicalDevice_ can handle, and this number is
-		used to size this list and append that many :class:`~diskovery_buffer.Buffer`
-		objects.
+		used to size this list, which is one page of the
+		:class:`~diskovery_buffer.UniformArena`.
+
+	.. py:attribute:: offset
+
+		Where this uniform's data starts in each of the :attr:`buffers`,
+		in bytes
 
 	"""
 	def __init__(self, dk, u_type):
@@ -280,10 +349,8 @@ class UniformBuffer(object):
 		self.u_type = u_type
 		self.size = u_type.get_size()
 
-		self.buffers = []
-
-		for i in range(0, self.dk.image_data['count']):
-			self.buffers.append(Buffer(self.dk, self.size))
+		self.page, self.offset = self.dk.uniform_arena.allocate(self.size)
+		self.buffers = self.dk.uniform_arena.pages[self.page]
 
 	def update(self, data, index):
 		"""
@@ -296,18 +363,7 @@ class UniformBuffer(object):
 		:param data: The data, stored in a ``ctypes`` array or ``Structure``
 		:param index: The index of the :class:`~diskovery_buffer.Buffer` the new data will be copied into
 		"""
-		info = vk.c_void_p(0)
-		self.dk.MapMemory(
-			self.dk.device,
-			self.buffers[index].memory,
-			0,
-			self.size,
-			0,
-			byref(info)
-		)
-
-		memmove(info, data, self.size)
-		self.dk.UnmapMemory(self.dk.device, self.buffers[index].memory)
+		memmove(self.buffers[index].mapped + self.offset, data, self.size)
 
 	def buffer(self, index):
 		"""
@@ -322,8 +378,884 @@ class UniformBuffer(object):
 
 	def cleanup(self):
 		"""
-		Handles necessary Destroy methods for all the Vulkan components
-		contained inside the :class:`~diskovery_buffer.Buffer`
+		Returns this uniform's slice to the :class:`~diskovery_buffer.UniformArena`
+		"""
+		self.dk.uniform_arena.release(self.page, self.offset, self.size)
+
+#: Size of each page of a :class:`~diskovery_buffer.UniformArena`, in bytes
+ARENA_PAGE_SIZE = 1 << 18
+
+class UniformArena(object):
+	"""
+	The :class:`~diskovery_buffer.UniformArena` class packs the data of
+	every :class:`~diskovery_buffer.UniformBuffer` into a few large
+	buffers instead of creating a buffer per uniform per back buffer.
+	One is created by the :class:`~diskovery_instance.DkInstance` and
+	stored as ``dk.uniform_arena``.
+
+	The arena is made of pages. A page is one host coherent, persistently
+	mapped uniform :class:`~diskovery_buffer.Buffer` per back buffer, and
+	a uniform owns the same slice of every buffer in its page. Slices
+	start at multiples of the device's ``minUniformBufferOffsetAlignment``
+	so each can be bound on its own. Writing a uniform is a single
+	``memmove`` into the mapped page, and a frame only writes to the
+	buffer of the back buffer it is rendering, so frames still in flight
+	keep reading their own copy.
+
+	Freed slices are kept by size and handed to the next uniform of the
+	same size, since entities are mostly created with the same few
+	uniform types.
+
+	:param page_size: Size of each buffer in a page, in bytes
+	"""
+	def __init__(self, dk, page_size=ARENA_PAGE_SIZE):
+		self.dk = dk
+		self.page_size = page_size
+
+		props = vk.PhysicalDeviceProperties()
+		dk.GetPhysicalDeviceProperties(dk.gpu, byref(props))
+		self.alignment = max(props.limits.min_uniform_buffer_offset_alignment, 1)
+
+		# Each page is a list of Buffer objects, one per back buffer
+		self.pages = []
+		self.head = page_size
+		# Aligned slice size -> list of free (page, offset) tuples
+		self.free = { }
+
+	def allocate(self, size):
+		"""
+		Reserves a slice of ``size`` bytes
+
+		:returns: A tuple of the index of the page in :attr:`pages` and the offset of the slice
+		"""
+		size = align(size, self.alignment)
+
+		if self.free.get(size):
+			return self.free[size].pop()
+
+		if self.head + size > self.page_size:
+			count = self.dk.image_data['count']
+			self.pages.append([Buffer(self.dk, max(size, self.page_size)) for i in range(0, count)])
+			self.head = 0
+
+		offset = self.head
+		self.head += size
+		return (len(self.pages) - 1, offset)
+
+	def release(self, page, offset, size):
+		"""
+		Makes a slice made by :meth:`allocate` available again
+		"""
+		self.free.setdefault(align(size, self.alignment), []).append((page, offset))
+
+	def cleanup(self):
+		for page in self.pages:
+			for buff in page:
+				buff.cleanup()
+		self.pages = []
+		self.free = { }
+
+#: Size of the vertex buffer of each :class:`~diskovery_buffer.GeometryArena` page, in bytes
+GEOMETRY_VERTEX_PAGE = 1 << 24
+
+#: Size of the index buffer of each :class:`~diskovery_buffer.GeometryArena` page, in bytes
+GEOMETRY_INDEX_PAGE = 1 << 22
+
+class GeometryPage(object):
+	"""
+	One device local vertex buffer and one index buffer of a
+	:class:`~diskovery_buffer.GeometryArena`, each split into ranges with
+	a :class:`~diskovery_buffer.FreeList`
+
+	:param dedicated: Whether the page was made for a single large mesh
+	"""
+	def __init__(self, dk, vertex_size, index_size, dedicated=False):
+		self.dedicated = dedicated
+
+		self.vertices = Buffer(dk, vertex_size, None, vk.BUFFER_USAGE_VERTEX_BUFFER_BIT, local=True)
+		self.indices = Buffer(dk, index_size, None, vk.BUFFER_USAGE_INDEX_BUFFER_BIT, local=True)
+
+		self.free_vertices = FreeList(vertex_size)
+		self.free_indices = FreeList(index_size)
+		self.meshes = 0
+
+	def reserve(self, vertex_size, stride, index_size):
+		"""
+		Takes a vertex range aligned to ``stride`` and an index range out
+		of the free lists
+
+		:returns: A tuple of the two byte offsets, or ``None`` if the page is too full
+		"""
+		vertex_start = self.free_vertices.reserve(vertex_size, stride)
+		if vertex_start is None:
+			return None
+
+		index_start = self.free_indices.reserve(index_size, sizeof(c_uint))
+		if index_start is None:
+			self.free_vertices.release(vertex_start, vertex_size)
+			return None
+
+		self.meshes += 1
+		return (vertex_start, index_start)
+
+	def cleanup(self):
+		self.vertices.cleanup()
+		self.indices.cleanup()
+
+class GeometryRange(object):
+	"""
+	The part of a :class:`~diskovery_buffer.GeometryPage` holding one
+	mesh. Draws bind the page's buffers and start at
+	:attr:`first_index`, adding :attr:`vertex_offset` to every index.
+
+	.. py:attribute:: vertex_offset
+
+		The number of vertices in the page's vertex buffer before the mesh
+
+	.. py:attribute:: first_index
+
+		The number of indices in the page's index buffer before the mesh
+	"""
+	def __init__(self, page, vertex_start, vertex_size, stride, index_start, index_size):
+		self.page = page
+		self.vertex_start = vertex_start
+		self.vertex_size = vertex_size
+		self.index_start = index_start
+		self.index_size = index_size
+
+		self.vertex_offset = vertex_start // stride
+		self.first_index = index_start // sizeof(c_uint)
+
+class GeometryArena(object):
+	"""
+	The :class:`~diskovery_buffer.GeometryArena` class packs the vertex
+	and index data of every :class:`~diskovery_mesh.Mesh` into a few
+	large device local buffers, so entities drawn one after the other
+	keep the same vertex and index buffers bound and only move to
+	another range of them. One is created by the
+	:class:`~diskovery_instance.DkInstance` and stored as ``dk.geometry``.
+
+	Like the :class:`~diskovery_buffer.MemoryAllocator`, the arena is made
+	of pages, each a vertex buffer and an index buffer with a free list
+	of their own, so meshes can be removed and added again in the editor
+	and the freed ranges are reused. Vertex ranges start at a multiple of
+	the vertex size, so their offset is a whole number of vertices.
+	Meshes too large for a shared page get a dedicated page of their
+	own, which is destroyed with the mesh.
+
+	:param vertex_page: Size of each shared page's vertex buffer, in bytes
+	:param index_page: Size of each shared page's index buffer, in bytes
+	"""
+	def __init__(self, dk, vertex_page=GEOMETRY_VERTEX_PAGE, index_page=GEOMETRY_INDEX_PAGE):
+		self.dk = dk
+		self.vertex_page = vertex_page
+		self.index_page = index_page
+
+		self.pages = []
+
+	def allocate(self, vertices, indices):
+		"""
+		Uploads a mesh into the first page with room for it
+
+		:param vertices: A structured ``numpy`` array of vertices
+		:param indices: A ``uint32`` ``numpy`` array of indices
+		:returns: The :class:`~diskovery_buffer.GeometryRange` holding the mesh
+		"""
+		stride = vertices.dtype.itemsize
+		# Empty meshes still get a range of their own
+		vertex_size = max(vertices.nbytes, stride)
+		index_size = max(indices.nbytes, sizeof(c_uint))
+
+		if vertex_size > self.vertex_page // 2 or index_size > self.index_page // 2:
+			page = GeometryPage(self.dk, vertex_size, index_size, True)
+			self.pages.append(page)
+			starts = page.reserve(vertex_size, stride, index_size)
+		else:
+			starts = None
+			for page in self.pages:
+				if not page.dedicated:
+					starts = page.reserve(vertex_size, stride, index_size)
+					if starts is not None:
+						break
+
+			if starts is None:
+				page = GeometryPage(self.dk, self.vertex_page, self.index_page)
+				self.pages.append(page)
+				starts = page.reserve(vertex_size, stride, index_size)
+
+		vertex_start, index_start = starts
+
+		with self.dk.uploads:
+			if vertices.nbytes > 0:
+				page.vertices.write(vertices.ctypes.data_as(c_void_p), vertices.nbytes, vertex_start)
+			if indices.nbytes > 0:
+				page.indices.write(indices.ctypes.data_as(c_void_p), indices.nbytes, index_start)
+
+		return GeometryRange(page, vertex_start, vertex_size, stride, index_start, index_size)
+
+	def free(self, geometry):
+		"""
+		Returns the ranges of a :class:`~diskovery_buffer.GeometryRange` to
+		its page. Empty pages are destroyed, except for one shared page
+		that is kept for the next mesh.
+		"""
+		page = geometry.page
+		page.free_vertices.release(geometry.vertex_start, geometry.vertex_size)
+		page.free_indices.release(geometry.index_start, geometry.index_size)
+		page.meshes -= 1
+
+		if page.meshes > 0:
+			return
+
+		if page.dedicated or sum(1 for p in self.pages if p.meshes == 0 and not p.dedicated) > 1:
+			self.pages.remove(page)
+			page.cleanup()
+
+	def stats(self):
+		"""
+		:returns: A dictionary with the number of ``pages`` and ``meshes``,
+			and the bytes of vertex and index data ``reserved`` by the pages
+			and ``used`` by meshes
+		"""
+		return {
+			'pages': len(self.pages),
+			'meshes': sum(p.meshes for p in self.pages),
+			'reserved': sum(p.free_vertices.size + p.free_indices.size for p in self.pages),
+			'used': sum(p.free_vertices.used + p.free_indices.used for p in self.pages)
+		}
+
+	def cleanup(self):
+		for page in self.pages:
+			page.cleanup()
+		self.pages = []
+
+#: Floats per instance in an :class:`~diskovery_buffer.InstanceBuffer`,
+#: laid out like a :class:`~diskovery_ubos.DrawData`: a column-major model
+#: matrix, an RGBA tint, a picking color and the lit, selected and
+#: subdivision values
+INSTANCE_WIDTH = 28
+
+class InstanceBuffer(object):
+	"""
+	The :class:`~diskovery_buffer.InstanceBuffer` class holds the vertex
+	data read once per instance by every pipeline whose vertex stage
+	takes per-instance attributes (see
+	:func:`~diskovery_mesh.instance_attributes`). Each draw reads its rows
+	starting at its ``firstInstance``, so the model matrix and material
+	values of every entity change without recording the command buffers
+	again. Like a page of the
+	:class:`~diskovery_buffer.UniformArena`, it is one host coherent,
+	persistently mapped :class:`~diskovery_buffer.Buffer` per back buffer,
+	so the instances of a whole frame are written with a few ``numpy``
+	copies into the buffer of the image being rendered.
+
+	**Attributes of the InstanceBuffer class:**
+
+	.. py:attribute:: capacity
+
+		How many instances fit in each buffer
+
+	.. py:attribute:: views
+
+		One ``(capacity, INSTANCE_WIDTH)`` float array per back buffer,
+		viewing its mapped memory
+
+	.. py:attribute:: models
+
+		The model matrix columns of :attr:`views` as ``(capacity, 4, 4)``
+		arrays, which ``glm.mat4`` values can be assigned to directly
+	"""
+	def __init__(self, dk):
+		self.dk = dk
+		self.capacity = 0
+		self.buffers = []
+		self.views = []
+		self.models = []
+
+	def fits(self, count):
+		return count <= self.capacity
+
+	def reserve(self, count):
+		"""
+		Makes room for ``count`` instances, replacing the buffers with
+		ones at least twice as large if they are too small. The old
+		buffers are destroyed, so no frame in flight may still read them.
+		"""
+		if self.fits(count):
+			return
+
+		self.cleanup()
+		self.capacity = max(count, self.capacity * 2, 64)
+		size = self.capacity * INSTANCE_WIDTH * sizeof(c_float)
+
+		for i in range(0, self.dk.image_data['count']):
+			buff = Buffer(self.dk, size, None, vk.BUFFER_USAGE_VERTEX_BUFFER_BIT)
+
+			view = np.ctypeslib.as_array(
+				(c_float * (self.capacity * INSTANCE_WIDTH)).from_address(buff.mapped)
+			).reshape(self.capacity, INSTANCE_WIDTH)
+
+			self.buffers.append(buff)
+			self.views.append(view)
+			self.models.append(view[:, :16].reshape(self.capacity, 4, 4).transpose(0, 2, 1))
+
+	def buffer(self, index):
+		return self.buffers[index].buffer
+
+	def cleanup(self):
+		for buff in self.buffers:
+			buff.cleanup()
+
+		self.buffers = []
+		self.views = []
+		self.models = []
+
+#: Number of 32 bit values in a VkDrawIndexedIndirectCommand
+INDIRECT_WIDTH = 5
+
+class IndirectBuffer(object):
+	"""
+	The :class:`~diskovery_buffer.IndirectBuffer` class holds the
+	VkDrawIndexedIndirectCommand_ structures read by
+	``vkCmdDrawIndexedIndirect``. Like the
+	:class:`~diskovery_buffer.InstanceBuffer`, it is one host coherent,
+	persistently mapped :class:`~diskovery_buffer.Buffer` per back buffer,
+	so how many instances each command draws, and where they start, can
+	be changed every frame without recording the command buffers again.
+
+	**Attributes of the IndirectBuffer class:**
+
+	.. py:attribute:: capacity
+
+		How many commands fit in each buffer
+
+	.. py:attribute:: views
+
+		One ``(capacity, INDIRECT_WIDTH)`` unsigned int array per back
+		buffer, viewing its mapped memory. The columns are the index
+		count, instance count, first index, vertex offset and first
+		instance of each command.
+
+	.. py:attribute:: multi_draw
+
+		Whether the device can run more than one command per indirect
+		draw (the ``multiDrawIndirect`` feature)
+
+	.. _VkDrawIndexedIndirectCommand: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkDrawIndexedIndirectCommand.html
+	"""
+	def __init__(self, dk):
+		self.dk = dk
+		self.capacity = 0
+		self.buffers = []
+		self.views = []
+
+		features = getattr(dk, 'features', None)
+		self.multi_draw = features is not None and features.multi_draw_indirect == vk.TRUE
+
+	def fits(self, count):
+		return count <= self.capacity
+
+	def reserve(self, count):
+		"""
+		Makes room for ``count`` commands, replacing the buffers with ones
+		at least twice as large if they are too small. The old buffers are
+		destroyed, so no frame in flight may still read them.
 		"""
+		if self.fits(count):
+			return
+
+		self.cleanup()
+		self.capacity = max(count, self.capacity * 2, 64)
+		size = self.capacity * sizeof(vk.DrawIndexedIndirectCommand)
+
+		for i in range(0, self.dk.image_data['count']):
+			buff = Buffer(self.dk, size, None, vk.BUFFER_USAGE_INDIRECT_BUFFER_BIT)
+
+			view = np.ctypeslib.as_array(
+				(c_uint * (self.capacity * INDIRECT_WIDTH)).from_address(buff.mapped)
+			).reshape(self.capacity, INDIRECT_WIDTH)
+
+			self.buffers.append(buff)
+			self.views.append(view)
+
+	def buffer(self, index):
+		return self.buffers[index].buffer
+
+	def cleanup(self):
 		for buff in self.buffers:
 			buff.cleanup()
+
+		self.buffers = []
+		self.views = []
+
+#: Default size of the staging ring used by :class:`~diskovery_buffer.UploadBatch`, in bytes
+STAGING_SIZE = 1 << 25
+
+def align(value, alignment):
+	"""
+	Rounds ``value`` up to the next multiple of ``alignment``
+	"""
+	return (value + alignment - 1) // alignment * alignment
+
+class UploadBatch(object):
+	"""
+	The :class:`~diskovery_buffer.UploadBatch` class records buffer and
+	image transfers into a single VkCommandBuffer_ and submits them all at
+	once, waiting on a VkFence_ instead of idling the whole queue after
+	every copy. One is created by the :class:`~diskovery_instance.DkInstance`
+	and stored as ``dk.uploads``.
+
+	Data is staged in one large, persistently mapped host buffer used as a
+	ring. Each upload takes the next aligned slice of the ring, and when
+	the ring is full the pending commands are submitted so it can start
+	over from the beginning. Data too large for the ring gets a staging
+	:class:`~diskovery_buffer.Buffer` of its own, destroyed after the
+	submit.
+
+	The batch is used as a context manager. Commands recorded inside the
+	outermost ``with`` block are submitted when it exits, so wrapping many
+	uploads in one block costs a single submit::
+
+		with dk.uploads:
+			mesh = Mesh(dk, 'tree.obj')
+			texture = Texture(dk, 'tree.png')
+
+	Outside of a block, every upload is submitted as soon as it is recorded.
+
+	**Attributes of the UploadBatch class:**
+
+	.. py:attribute:: staging
+
+		The :class:`~diskovery_buffer.Buffer` holding the staging ring
+
+	.. py:attribute:: head
+
+		Offset of the first free byte of the ring
+
+	.. py:attribute:: submits
+
+		How many times the batch has been submitted, kept for reporting
+
+	.. _VkCommandBuffer: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkCommandBuffer.html
+	.. _VkFence: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkFence.html
+	"""
+	def __init__(self, dk, capacity=STAGING_SIZE):
+		self.dk = dk
+		self.capacity = capacity
+
+		# A pool of its own, since the instance's pool is recreated on refresh
+		self.pool = vk.CommandPool(0)
+		pool_info = vk.CommandPoolCreateInfo(
+			s_type=vk.STRUCTURE_TYPE_COMMAND_POOL_CREATE_INFO,
+			flags=vk.COMMAND_POOL_CREATE_TRANSIENT_BIT,
+			queue_family_index=dk.graphics['index']
+		)
+		dk.CreateCommandPool(dk.device, byref(pool_info), None, byref(self.pool))
+
+		self.fence = vk.Fence(0)
+		fence_info = vk.FenceCreateInfo(s_type=vk.STRUCTURE_TYPE_FENCE_CREATE_INFO)
+		dk.CreateFence(dk.device, byref(fence_info), None, byref(self.fence))
+
+		# A single command buffer, reset along with the pool after every submit
+		allocate_info = vk.CommandBufferAllocateInfo(
+			s_type=vk.STRUCTURE_TYPE_COMMAND_BUFFER_ALLOCATE_INFO,
+			level=vk.COMMAND_BUFFER_LEVEL_PRIMARY,
+			command_pool=self.pool,
+			command_buffer_count=1
+		)
+		self.cmd = vk.CommandBuffer(0)
+		dk.AllocateCommandBuffers(dk.device, byref(allocate_info), byref(self.cmd))
+		self.recording = False
+
+		self.staging = Buffer(dk, capacity, None, vk.BUFFER_USAGE_TRANSFER_SRC_BIT)
+
+		self.head = 0
+		self.depth = 0
+		# Oversized staging buffers, destroyed once their copies are done
+		self.garbage = []
+		self.submits = 0
+
+	def stage(self, data, size, alignment=16):
+		"""
+		Copies ``size`` bytes of ``data`` into the staging ring.
+
+		:param data: The data, stored in a ``ctypes`` array, ``Structure``, pointer or ``bytes``
+		:param size: The number of bytes to copy
+		:param alignment: Required alignment of the returned offset
+		:returns: A tuple of the VkBuffer_ holding the data and the offset of the data within it
+		"""
+		if size > self.capacity:
+			buff = Buffer(self.dk, size, data)
+			self.garbage.append(buff)
+			return (buff.buffer, 0)
+
+		offset = align(self.head, alignment)
+		if offset + size > self.capacity:
+			# Everything staged so far has to be consumed before it is overwritten
+			self.flush()
+			offset = 0
+
+		memmove(self.staging.mapped + offset, data, size)
+		self.head = offset + size
+		return (self.staging.buffer, offset)
+
+	def begin(self):
+		"""
+		:returns: The command buffer transfers should be recorded into,
+			beginning it if nothing is pending
+		"""
+		if not self.recording:
+			begin_info = vk.CommandBufferBeginInfo(
+				s_type=vk.STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
+				flags=vk.COMMAND_BUFFER_USAGE_ONE_TIME_SUBMIT_BIT
+			)
+			self.dk.BeginCommandBuffer(self.cmd, byref(begin_info))
+			self.recording = True
+
+		return self.cmd
+
+	def flush(self):
+		"""
+		Submits every pending command and waits for them to complete.
+		Does nothing if no commands were recorded.
+		"""
+		if not self.recording:
+			return
+
+		self.recording = False
+		self.dk.EndCommandBuffer(self.cmd)
+
+		submit_info = vk.SubmitInfo(
+			s_type=vk.STRUCTURE_TYPE_SUBMIT_INFO,
+			command_buffer_count=1,
+			command_buffers=pointer(self.cmd)
+		)
+
+		self.dk.QueueSubmit(self.dk.graphics['queue'], 1, byref(submit_info), self.fence)
+		self.dk.WaitForFences(self.dk.device, 1, byref(self.fence), vk.TRUE, 0xFFFFFFFFFFFFFFFF)
+		self.dk.ResetFences(self.dk.device, 1, byref(self.fence))
+		self.dk.ResetCommandPool(self.dk.device, self.pool, 0)
+
+		self.head = 0
+		self.submits += 1
+
+		garbage = self.garbage
+		self.garbage = []
+		for buff in garbage:
+			buff.cleanup()
+
+	def __enter__(self):
+		self.depth += 1
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.depth -= 1
+		if self.depth == 0:
+			self.flush()
+
+	def cleanup(self):
+		"""
+		Submits anything still pending, then destroys the staging ring,
+		fence and command pool
+		"""
+		self.flush()
+
+		self.staging.cleanup()
+		self.dk.DestroyFence(self.dk.device, self.fence, None)
+		self.dk.DestroyCommandPool(self.dk.device, self.pool, None)
+
+#: Size of each VkDeviceMemory block created by :class:`~diskovery_buffer.MemoryAllocator`, in bytes
+BLOCK_SIZE = 1 << 26
+
+class Allocation(object):
+	"""
+	A range of a :class:`~diskovery_buffer.MemoryBlock` given to one
+	buffer or image by the :class:`~diskovery_buffer.MemoryAllocator`
+
+	.. py:attribute:: memory
+
+		The VkDeviceMemory_ of the block, to be bound at :attr:`offset`
+
+	.. py:attribute:: mapped
+
+		The host address of the range, or ``None`` if the block is not
+		host visible
+	"""
+	def __init__(self, block, offset, size):
+		self.block = block
+		self.offset = offset
+		self.size = size
+		self.memory = block.memory
+		self.mapped = None if block.mapped is None else block.mapped + offset
+
+class FreeList(object):
+	"""
+	The free ranges of ``size`` bytes, kept as a sorted list of
+	``[offset, size]`` pairs in :attr:`ranges`. Neighbouring ranges are
+	merged when a range is released, so only this bookkeeping runs per
+	allocation.
+	"""
+	def __init__(self, size):
+		self.size = size
+		self.used = 0
+		self.ranges = [[0, size]]
+
+	def reserve(self, size, alignment=1):
+		"""
+		Finds the first free range that can hold ``size`` bytes at the
+		given alignment and takes them out of the list.
+
+		:returns: The offset of the reserved bytes, or ``None`` if no range is large enough
+		"""
+		for i, (start, length) in enumerate(self.ranges):
+			offset = align(start, alignment)
+			end = offset + size
+			if end > start + length:
+				continue
+
+			# Alignment padding and whatever is left after the range stay free
+			remaining = []
+			if offset > start:
+				remaining.append([start, offset - start])
+			if end < start + length:
+				remaining.append([end, start + length - end])
+			self.ranges[i:i + 1] = remaining
+
+			self.used += size
+			return offset
+
+		return None
+
+	def release(self, start, size):
+		"""
+		Returns ``size`` bytes starting at ``start`` to the list, merging
+		them with the free ranges on either side (including any alignment
+		padding left in front of them)
+		"""
+		self.used -= size
+
+		i = 0
+		while i < len(self.ranges) and self.ranges[i][0] < start:
+			i += 1
+		self.ranges.insert(i, [start, size])
+
+		if i + 1 < len(self.ranges) and start + size == self.ranges[i + 1][0]:
+			self.ranges[i][1] += self.ranges.pop(i + 1)[1]
+		if i > 0 and self.ranges[i - 1][0] + self.ranges[i - 1][1] == start:
+			self.ranges[i - 1][1] += self.ranges.pop(i)[1]
+
+	def largest(self):
+		return max([length for start, length in self.ranges] or [0])
+
+class MemoryBlock(object):
+	"""
+	One VkDeviceMemory_ allocation, split into ranges with a
+	:class:`~diskovery_buffer.FreeList`, so only the bookkeeping in
+	:meth:`reserve` and :meth:`release` runs per buffer or image.
+
+	:param key: The memory type index and whether the block holds buffers, see :class:`~diskovery_buffer.MemoryAllocator`
+	:param dedicated: Whether the block was made for a single large allocation
+	"""
+	def __init__(self, dk, key, size, host_visible, dedicated=False):
+		self.dk = dk
+		self.key = key
+		self.size = size
+		self.dedicated = dedicated
+
+		self.memory = vk.DeviceMemory(0)
+		alloc_info = vk.MemoryAllocateInfo(
+			s_type=vk.STRUCTURE_TYPE_MEMORY_ALLOCATE_INFO,
+			allocation_size=size,
+			memory_type_index=key[0]
+		)
+		if dk.AllocateMemory(dk.device, byref(alloc_info), None, byref(self.memory)) != vk.SUCCESS:
+			raise MemoryError("Could not allocate {} bytes of device memory".format(size))
+
+		# Host visible blocks are mapped once and stay mapped
+		self.mapped = None
+		if host_visible:
+			data = vk.c_void_p(0)
+			dk.MapMemory(dk.device, self.memory, 0, size, 0, byref(data))
+			self.mapped = data.value
+
+		self.free = FreeList(size)
+		self.allocations = 0
+
+	@property
+	def used(self):
+		return self.free.used
+
+	def reserve(self, size, alignment):
+		"""
+		Takes ``size`` bytes at the given alignment out of the free list
+
+		:returns: An :class:`~diskovery_buffer.Allocation`, or ``None`` if the block is too full
+		"""
+		offset = self.free.reserve(size, alignment)
+		if offset is None:
+			return None
+
+		self.allocations += 1
+		return Allocation(self, offset, size)
+
+	def release(self, start, size):
+		"""
+		Returns ``size`` bytes starting at ``start`` to the free list
+		"""
+		self.allocations -= 1
+		self.free.release(start, size)
+
+	def empty(self):
+		return self.allocations == 0
+
+	def largest_free(self):
+		return self.free.largest()
+
+	def cleanup(self):
+		if self.mapped is not None:
+			self.dk.UnmapMemory(self.dk.device, self.memory)
+		self.dk.FreeMemory(self.dk.device, self.memory, None)
+
+class MemoryAllocator(object):
+	"""
+	The :class:`~diskovery_buffer.MemoryAllocator` class hands out memory
+	for every :class:`~diskovery_buffer.Buffer` and
+	:class:`~diskovery_image.Image`. Devices only allow a few thousand
+	VkDeviceMemory_ objects (``maxMemoryAllocationCount``) and allocating
+	one is slow, so instead of one allocation per object the allocator
+	creates blocks of :data:`BLOCK_SIZE` bytes for each memory type and
+	gives out aligned ranges of them. One is created by the
+	:class:`~diskovery_instance.DkInstance` and stored as ``dk.allocator``.
+
+	Buffers and images are kept in separate blocks, so the
+	``bufferImageGranularity`` limit between linear and optimally tiled
+	resources never has to be considered. Requests larger than half a
+	block get a dedicated block of their own, which is freed as soon as
+	the request is.
+
+	The allocator only talks to Vulkan when it creates or frees a block,
+	so it works the same on a software implementation such as lavapipe.
+
+	:param block_size: Size of each shared block, in bytes
+	"""
+	def __init__(self, dk, block_size=BLOCK_SIZE):
+		self.dk = dk
+		self.block_size = block_size
+
+		self.properties = vk.PhysicalDeviceMemoryProperties()
+		dk.GetPhysicalDeviceMemoryProperties(dk.gpu, byref(self.properties))
+
+		# (memory type index, linear) -> list of MemoryBlock
+		self.blocks = { }
+		# Blocks holding a single large allocation
+		self.dedicated = []
+		# Number of vkAllocateMemory calls made, kept for reporting
+		self.device_allocations = 0
+
+	def _host_visible(self, type_index):
+		flags = self.properties.memory_types[type_index].property_flags
+		return flags & vk.MEMORY_PROPERTY_HOST_VISIBLE_BIT != 0
+
+	def _new_block(self, key, size, dedicated=False):
+		self.device_allocations += 1
+		return MemoryBlock(self.dk, key, size, self._host_visible(key[0]), dedicated)
+
+	def allocate(self, mem_req, props, linear=True):
+		"""
+		Reserves memory matching a VkMemoryRequirements_ structure
+
+		:param mem_req: The requirements returned for the buffer or image
+		:param props: The VkMemoryPropertyFlags_ the memory must have
+		:param linear: ``True`` for buffers, ``False`` for optimally tiled images
+		:returns: An :class:`~diskovery_buffer.Allocation`
+
+		.. _VkMemoryRequirements: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkMemoryRequirements.html
+		.. _VkMemoryPropertyFlags: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkMemoryPropertyFlags.html
+		"""
+		type_index = self.dk.get_memory_type(mem_req.memory_type_bits, props)
+		if type_index is None:
+			raise MemoryError("No memory type supports the requested properties")
+
+		key = (type_index, linear)
+		size = mem_req.size
+		alignment = max(mem_req.alignment, 1)
+
+		if size > self.block_size // 2:
+			block = self._new_block(key, size, True)
+			self.dedicated.append(block)
+			return block.reserve(size, alignment)
+
+		blocks = self.blocks.setdefault(key, [])
+		for block in blocks:
+			allocation = block.reserve(size, alignment)
+			if allocation is not None:
+				return allocation
+
+		block = self._new_block(key, self.block_size)
+		blocks.append(block)
+		return block.reserve(size, alignment)
+
+	def free(self, allocation):
+		"""
+		Returns an :class:`~diskovery_buffer.Allocation` to its block. Empty
+		blocks are released, except for one per memory type that is kept
+		around to avoid allocating it again straight away.
+		"""
+		if allocation is None:
+			return
+
+		block = allocation.block
+
+		if block.dedicated:
+			self.dedicated.remove(block)
+			block.cleanup()
+			return
+
+		block.release(allocation.offset, allocation.size)
+
+		if block.empty():
+			blocks = self.blocks[block.key]
+			if sum(1 for b in blocks if b.empty()) > 1:
+				blocks.remove(block)
+				block.cleanup()
+
+	def stats(self):
+		"""
+		Summarizes how memory is being used, for profiling and to spot
+		fragmentation.
+
+		:returns: A dictionary with the number of ``blocks``, live
+			``allocations`` and ``device_allocations`` ever made, the bytes
+			``reserved`` from the device and
+			``used`` by allocations, the number of ``free_ranges``, the
+			``largest_free`` range and the ``fragmentation`` of the free
+			space (``0`` when it is one contiguous range, approaching ``1``
+			as it is split into many small ones)
+		"""
+		blocks = [b for blocks in self.blocks.values() for b in blocks] + self.dedicated
+
+		reserved = sum(b.size for b in blocks)
+		used = sum(b.used for b in blocks)
+		free = reserved - used
+		largest = max([b.largest_free() for b in blocks] or [0])
+
+		return {
+			'blocks': len(blocks),
+			'allocations': sum(b.allocations for b in blocks),
+			'device_allocations': self.device_allocations,
+			'reserved': reserved,
+			'used': used,
+			'free_ranges': sum(len(b.free.ranges) for b in blocks),
+			'largest_free': largest,
+			'fragmentation': 1 - largest / free if free else 0
+		}
+
+	def cleanup(self):
+		"""
+		Frees every block. Anything still allocated from them must not be used afterwards.
+		"""
+		for blocks in list(self.blocks.values()) + [self.dedicated]:
+			for block in blocks:
+				block.cleanup()
+		self.blocks = { }
+		self.dedicated = []
@@ -0,0 +1,254 @@
+#!/bin/env/python
+
+"""
+The :mod:`diskovery_collada` module reads COLLADA (.dae) files once and
+hands out the parts that :class:`~diskovery_mesh.Parser` needs. A
+:class:`ColladaDocument` only parses the XML when one of its sections is
+first accessed, and each section is built from that single read:
+
+- :attr:`~ColladaDocument.geometry` - positions, normals, texture coordinates and polygon indices
+- :attr:`~ColladaDocument.skin` - joint names and per-vertex joint weights
+- :attr:`~ColladaDocument.skeleton` - the root joint node of the visual scene
+- :attr:`~ColladaDocument.animations` - keyframe times and per-joint transforms
+
+Documents are shared through :func:`document`, which keeps the most
+recently used files in a small LRU cache, so loading the model, rig and
+animations of the same file only reads it from disk once. The cache is
+emptied with :func:`clear_cache` once a scene's assets are loaded, so
+the parsed arrays don't outlive the loads that use them.
+
+Files are read with ``iterparse`` rather than building the whole DOM.
+The text of every ``float_array``, ``p``, ``v``, ``vcount`` and
+``Name_array`` element is converted into an array as soon as the element
+closes and then dropped. Libraries DisKovery doesn't use (images,
+effects, cameras, ...) are removed from the tree as soon as they end.
+The numeric sections are returned as ``numpy`` arrays.
+"""
+
+import os
+import threading
+import numpy as np
+import xml.etree.ElementTree as xml
+from collections import OrderedDict
+
+#: How many parsed documents :func:`document` keeps alive
+CACHE_SIZE = 4
+
+_documents = OrderedDict()
+_documents_lock = threading.Lock()
+
+def document(file):
+	"""
+	Returns the shared :class:`ColladaDocument` for ``file``. A cached
+	document is dropped if the file was modified since it was opened.
+	"""
+	key = os.path.abspath(file)
+	mtime = os.path.getmtime(file)
+
+	with _documents_lock:
+		if key in _documents and _documents[key].mtime == mtime:
+			_documents.move_to_end(key)
+			return _documents[key]
+
+		doc = ColladaDocument(file)
+		_documents[key] = doc
+
+		while len(_documents) > CACHE_SIZE:
+			_documents.popitem(last=False)
+
+	return doc
+
+def clear_cache():
+	"""
+	Drops every document held by :func:`document`
+	"""
+	with _documents_lock:
+		_documents.clear()
+
+def _child_with_attribute(node, tag, attribute, value):
+	for child in node:
+		if child.tag == tag and child.attrib[attribute] == value:
+			return child
+
+def _local_name(tag):
+	# Strips the {namespace} prefix that exporters put on every tag
+	return tag.rsplit('}', 1)[-1]
+
+# Elements whose text is converted to an array while streaming
+_ARRAY_TYPES = {
+	'float_array': np.float64,
+	'p': np.int64,
+	'v': np.int64,
+	'vcount': np.int64
+}
+
+# Top level libraries that are kept in the tree, everything else is dropped
+_LIBRARIES = (
+	'library_geometries',
+	'library_controllers',
+	'library_visual_scenes',
+	'library_animations'
+)
+
+class ColladaDocument(object):
+	"""
+	A lazily parsed COLLADA file
+
+	:param file: Path of the .dae file
+	"""
+	def __init__(self, file):
+		self.file = file
+		self.mtime = os.path.getmtime(file)
+
+		self._root = None
+		self._arrays = { }
+		# Sections may be requested from several loader threads at once
+		self._lock = threading.RLock()
+		self._geometry = None
+		self._skin = None
+		self._skeleton = None
+		self._animations = None
+
+	@property
+	def root(self):
+		"""
+		The root element of the streamed XML tree. Only the libraries in
+		``_LIBRARIES`` are kept, and array elements have no text left.
+		"""
+		with self._lock:
+			if self._root is None:
+				self._root = self._stream()
+		return self._root
+
+	def _stream(self):
+		root = None
+		depth = 0
+
+		for event, elem in xml.iterparse(self.file, events=('start', 'end')):
+			if event == 'start':
+				elem.tag = _local_name(elem.tag)
+				if root is None:
+					root = elem
+				depth += 1
+				continue
+
+			depth -= 1
+
+			if elem.tag in _ARRAY_TYPES:
+				self._arrays[elem] = np.fromstring(elem.text or '', dtype=_ARRAY_TYPES[elem.tag], sep=' ')
+				elem.text = None
+			elif elem.tag == 'Name_array':
+				self._arrays[elem] = (elem.text or '').split()
+				elem.text = None
+			elif depth == 1 and elem.tag not in _LIBRARIES:
+				for child in elem.iter():
+					self._arrays.pop(child, None)
+				root.remove(elem)
+
+		return root
+
+	def _values(self, node):
+		return self._arrays[node]
+
+	def _source(self, parent, src_id, array='float_array'):
+		source = _child_with_attribute(parent, 'source', 'id', src_id)
+		return self._values(source.find(array))
+
+	@property
+	def geometry(self):
+		"""
+		A dictionary with flat ``positions``, ``normals`` and ``texcoords``
+		float arrays, the flat polygon index array ``p``, the number of
+		``inputs`` per polygon corner and the ``offsets`` of the
+		``VERTEX``, ``NORMAL`` and ``TEXCOORD`` inputs within a corner.
+		"""
+		with self._lock:
+			if self._geometry is None:
+				mesh = self.root.find('library_geometries').find('geometry').find('mesh')
+				poly = mesh.find('polylist')
+
+				pos_id = mesh.find('vertices').find('input').attrib['source'][1:]
+				inputs = { }
+				for i in poly.findall('input'):
+					inputs[i.attrib['semantic']] = i
+
+				self._geometry = {
+					'positions': self._source(mesh, pos_id),
+					'normals': self._source(mesh, inputs['NORMAL'].attrib['source'][1:]),
+					'texcoords': self._source(mesh, inputs['TEXCOORD'].attrib['source'][1:]),
+					'inputs': len(inputs),
+					'offsets': { k: int(v.attrib['offset']) for k, v in inputs.items() },
+					'p': self._values(poly.find('p'))
+				}
+
+		return self._geometry
+
+	@property
+	def skin(self):
+		"""
+		A dictionary with the skin's ``joints`` (list of names), the
+		``weights`` float array, the number of joints influencing each
+		vertex (``vcount``) and the flat joint/weight index pairs (``v``).
+		"""
+		with self._lock:
+			if self._skin is None:
+				skin = self.root.find('library_controllers').find('controller').find('skin')
+				vertex_weights = skin.find('vertex_weights')
+
+				joints_id = _child_with_attribute(vertex_weights, 'input', 'semantic', 'JOINT').attrib['source'][1:]
+				weights_id = _child_with_attribute(vertex_weights, 'input', 'semantic', 'WEIGHT').attrib['source'][1:]
+
+				self._skin = {
+					'joints': self._source(skin, joints_id, 'Name_array'),
+					'weights': self._source(skin, weights_id),
+					'vcount': self._values(vertex_weights.find('vcount')),
+					'v': self._values(vertex_weights.find('v'))
+				}
+
+		return self._skin
+
+	@property
+	def skeleton(self):
+		"""
+		The XML node of the root joint. Armatures exported under an
+		``Armature`` node are unwrapped.
+		"""
+		with self._lock:
+			if self._skeleton is None:
+				scene = self.root.find('library_visual_scenes').find('visual_scene')
+				armature = _child_with_attribute(scene, 'node', 'id', 'Armature')
+
+				if armature is None:
+					armature = scene
+
+				self._skeleton = armature.find('node')
+
+		return self._skeleton
+
+	@property
+	def animations(self):
+		"""
+		A dictionary with the keyframe ``times`` and the ``transforms`` of
+		each animated joint, a ``(keyframes, 16)`` array of row-major
+		matrices, keyed by joint name.
+		"""
+		with self._lock:
+			if self._animations is None:
+				library = self.root.find('library_animations')
+
+				times = self._values(library.find('animation').find('source').find('float_array'))
+
+				transforms = OrderedDict()
+				for joint_node in library.findall('animation'):
+					name = joint_node.find('channel').attrib['target'].split('/')[0]
+					data_id = _child_with_attribute(
+						joint_node.find('sampler'),
+						'input',
+						'semantic',
+						'OUTPUT'
+					).attrib['source'][1:]
+					transforms[name] = self._source(joint_node, data_id).reshape(-1, 16)
+
+				self._animations = { 'times': times, 'transforms': transforms }
+
+		return self._animations
@@ -0,0 +1,67 @@
+#!/bin/env/python
+
+"""
+The :mod:`diskovery_culling` module decides which entities can be seen by
+the :class:`~diskovery.Camera`. Every :class:`~diskovery_mesh.Mesh` has a
+bounding sphere in model space, and each frame the spheres of all
+entities are moved into world space with their model matrices and tested
+against the six planes of the camera's view frustum. The far plane sits
+at ``Camera.draw_distance``, so anything further away is culled as well.
+
+The test runs on every entity at once with ``numpy``:
+
+1. :func:`frustum_planes` extracts the planes from the camera's
+   projection and view matrices
+2. :func:`visible_spheres` transforms the sphere centers, scales their
+   radii by the largest axis scale of each model matrix and keeps the
+   spheres that are not fully behind any plane
+
+A sphere is only culled when it is entirely outside the frustum, so the
+test never hides anything that should be drawn.
+"""
+
+import numpy as np
+
+def frustum_planes(view, projection):
+	"""
+	Extracts the planes of the frustum seen through a view and projection
+	matrix. The near plane is taken from OpenGL style clip space (``-w``
+	to ``w``), which also contains the Vulkan one (``0`` to ``w``), so the
+	same planes are safe for projections made either way.
+
+	:param view: The camera's view matrix, a ``glm.mat4``
+	:param projection: The camera's projection matrix, a ``glm.mat4``
+	:returns: A ``(6, 4)`` array of planes ``(a, b, c, d)``, with normals of unit length pointing into the frustum
+	"""
+	# numpy reads a glm matrix row by row
+	m = np.array(projection * view, dtype=np.float64)
+
+	planes = np.array([
+		m[3] + m[0],	# left
+		m[3] - m[0],	# right
+		m[3] + m[1],	# bottom
+		m[3] - m[1],	# top
+		m[3] + m[2],	# near
+		m[3] - m[2]		# far
+	])
+
+	return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+def visible_spheres(planes, models, centers, radii):
+	"""
+	Tests many bounding spheres against a frustum at once
+
+	:param planes: The planes returned by :func:`frustum_planes`
+	:param models: An ``(N, 4, 4)`` array of model matrices, row by row as ``numpy`` reads ``glm.mat4`` values
+	:param centers: An ``(N, 3)`` array of sphere centers in model space
+	:param radii: An ``(N,)`` array of sphere radii in model space
+	:returns: An ``(N,)`` boolean array, ``True`` for the spheres inside or touching the frustum
+	"""
+	rotation = models[:, :3, :3]
+
+	world = np.einsum('nij,nj->ni', rotation, centers) + models[:, :3, 3]
+	scale = np.sqrt((rotation * rotation).sum(axis=1)).max(axis=1)
+
+	distances = world @ planes[:, :3].T + planes[:, 3]
+
+	return (distances >= -(radii * scale)[:, None]).all(axis=1)
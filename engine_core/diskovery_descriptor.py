@@ -7,18 +7,16 @@ a ``layout()`` tag before every uniform variable it declares,
 and those tags can contain information on which bindings and which
 sets that uniform is referenced through in the Vulkan code.
 
-For example, a uniform in a vertex shader might contain the model,
-view, and projection matrices for a given entity in the world space.
-This would be defined in the shader code as::
-		
-	layout(set = 0, binding = 0) uniform UniformBufferObject {
+For example, a uniform in a vertex shader might contain the model
+matrix for a given entity in the world space. This would be defined
+in the shader code as::
+
+	layout(set = 1, binding = 1) uniform ModelMatrix {
 	    mat4 model;
-	    mat4 view;
-	    mat4 proj;
-	} ubo;
+	} mvp;
 
-The ``layout()`` tag tells Vulkan that this uniform is expecting 
-data in the first binding of the first VkDescriptorSet_ it will
+The ``layout()`` tag tells Vulkan that this uniform is expecting
+data in the second binding of the second VkDescriptorSet_ it will
 be passed. Each VkDescriptorSet_ has a VkDescriptorSetLayout_ which
 defines what kind of binding will be at each location within the set,
 how many there will be, and which stages of the shader (vertex or fragment)
@@ -42,6 +40,18 @@ related VkDescriptorPool_ so Vulkan knows where to pull the descriptor
 set from when the call to vkCmdBindDescriptorSets_ happens during the
 draw calls (handled in :class:`~diskovery_entity_manager.EntityManager`).
 
+Every DisKovery pipeline uses two descriptor sets:
+
+- Set 0, the frame set, holds the data shared by every entity in a frame:
+	the camera's view and projection matrices (binding 0, a
+	:class:`~diskovery_ubos.CameraData`) and the lights of a light scene
+	(binding 1, a :class:`~diskovery_ubos.SceneLighting`). It is managed
+	by a single :class:`~diskovery_descriptor.FrameDescriptor` and, since
+	every pipeline layout starts with the same set 0 layout, it stays bound
+	across pipeline changes.
+- Set 1 holds the uniforms and textures of a single entity, and is
+	described by each shader's definition.
+
 There are a number of classes stored in :mod:`~diskovery_descriptor` to
 increase readability when handling binding and uniform data:
 
@@ -51,6 +61,9 @@ increase readability when handling binding and uniform data:
 - :class:`~diskovery_descriptor.MVPMatrix` - An object that can fill a 
 	:class:`~diskovery_buffer.UniformBuffer` that stores matrix data for rendering 
 	a :class:`~diskovery.RenderedEntity`
+- :class:`~diskovery_descriptor.DescriptorAllocator` - Hands out the sets of
+	one VkDescriptorSetLayout_ from a few shared pools, recycling freed sets
+	and sharing the sets of entities binding the same textures
 
 .. _VkDescriptorSetLayout: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkDescriptorSetLayout.html
 .. _VkDescriptorPool: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkDescriptorPool.html
@@ -64,6 +77,8 @@ import vk
 import glm
 from ctypes import * 
 from enum import Enum
+from diskovery_buffer import UniformBuffer
+from diskovery_ubos import CameraData, SceneLighting
 
 class BindingType(Enum):
 	"""
@@ -113,12 +128,234 @@ def make_set_layout(dk, definition):
 	dk.CreateDescriptorSetLayout(dk.device, byref(create_info), None, byref(layout))
 	return layout
 
+def make_pool(dk, definition, set_count):
+	"""
+	Creates a VkDescriptorPool_ with room for ``set_count`` sets of the
+	given definition
+
+	:returns: The new VkDescriptorPool_
+	"""
+	sizes = (vk.DescriptorPoolSize*len(definition))()
+
+	for index, defn in enumerate(definition):
+		size = vk.DescriptorPoolSize()
+
+		if defn == BindingType.UNIFORM_BUFFER:
+			size.type = vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER
+
+		if defn == BindingType.TEXTURE_SAMPLER:
+			size.type = vk.DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER
+
+		size.descriptor_count = set_count
+
+		sizes[index] = size
+
+	pool_info = vk.DescriptorPoolCreateInfo(
+		s_type=vk.STRUCTURE_TYPE_DESCRIPTOR_POOL_CREATE_INFO,
+		pool_size_count=len(sizes),
+		pool_sizes=cast(sizes, POINTER(vk.DescriptorPoolSize)),
+		max_sets=set_count
+	)
+
+	pool = vk.DescriptorPool(0)
+	if dk.CreateDescriptorPool(dk.device, byref(pool_info), None, byref(pool)) != vk.SUCCESS:
+		raise RuntimeError("Unable to create descriptor pool")
+
+	return pool
+
+def allocate_sets(dk, pool, layout, count):
+	"""
+	Allocates ``count`` sets of one layout from a VkDescriptorPool_
+
+	:returns: An array of ``count`` VkDescriptorSet_ handles
+	"""
+	layouts = (vk.DescriptorSetLayout*count)(*([layout] * count))
+	sets = (vk.DescriptorSet*count)()
+
+	alloc_info = vk.DescriptorSetAllocateInfo(
+		s_type=vk.STRUCTURE_TYPE_DESCRIPTOR_SET_ALLOCATE_INFO,
+		descriptor_pool=pool,
+		descriptor_set_count=count,
+		set_layouts=cast(layouts, POINTER(vk.DescriptorSetLayout))
+	)
+
+	if dk.AllocateDescriptorSets(dk.device, byref(alloc_info), cast(sets, POINTER(vk.DescriptorSet))) != vk.SUCCESS:
+		raise RuntimeError("Unable to allocate descriptor sets")
+
+	return sets
+
+#: Number of sets each pool of a :class:`~diskovery_descriptor.DescriptorAllocator` holds
+POOL_SETS = 256
+
+class DescriptorAllocator(object):
+	"""
+	The :class:`~diskovery_descriptor.DescriptorAllocator` class hands out
+	the VkDescriptorSet_ objects of one VkDescriptorSetLayout_. Rather than
+	a VkDescriptorPool_ per :class:`~diskovery_descriptor.Descriptor`, sets
+	are allocated from pools holding :data:`POOL_SETS` sets each, and a
+	new pool is only created when the last one is used up.
+
+	Sets given back by :meth:`release` are never returned to their pool.
+	They are kept on a free list and handed out again by the next
+	:meth:`allocate`, which overwrites every binding, so removing and
+	adding entities in the editor reuses the same sets instead of
+	allocating new ones. One allocator is kept per shader definition by
+	the :mod:`diskovery` module.
+
+	Definitions made only of textures hold nothing specific to one
+	entity, so :meth:`share` gives every entity binding the same image
+	views and samplers the same :class:`~diskovery_descriptor.Descriptor`,
+	counting its users, and its sets are only released with the last one.
+
+	**Attributes of the DescriptorAllocator class:**
+
+	.. py:attribute:: pools
+
+		The VkDescriptorPool_ handles created so far
+
+	.. py:attribute:: free
+
+		The sets released since, ready to be handed out again
+
+	.. py:attribute:: shared
+
+		The descriptors handed out by :meth:`share`, with their number of
+		users, keyed by the :class:`~diskovery_image.Texture` and mip
+		levels (which pick the sampler) of every binding
+
+	:param definition: The definition the layout was made from, see :func:`make_set_layout`
+	:param layout: The VkDescriptorSetLayout_ of every set
+	:param pool_sets: The number of sets in each pool
+	"""
+	def __init__(self, dk, definition, layout, pool_sets=POOL_SETS):
+		self.dk = dk
+		self.definition = definition
+		self.layout = layout
+		self.pool_sets = pool_sets
+
+		self.pools = []
+		# Sets not yet allocated from the newest pool
+		self.remaining = 0
+		self.free = []
+
+		# (texture, mip levels) pairs -> [Descriptor, users]
+		self.shared = { }
+
+		# Kept for reporting
+		self.allocated = 0
+		self.reused = 0
+
+	def allocate(self, count):
+		"""
+		Takes ``count`` sets, from the free list first
+
+		:returns: An array of ``count`` VkDescriptorSet_ handles, whose bindings still have to be written
+		"""
+		reused = self.free[len(self.free) - min(count, len(self.free)):]
+		del self.free[len(self.free) - len(reused):]
+		self.reused += len(reused)
+
+		sets = list(reused)
+
+		while len(sets) < count:
+			if self.remaining == 0:
+				self.pools.append(make_pool(self.dk, self.definition, self.pool_sets))
+				self.remaining = self.pool_sets
+
+			take = min(count - len(sets), self.remaining)
+			sets.extend(allocate_sets(self.dk, self.pools[-1], self.layout, take))
+			self.remaining -= take
+			self.allocated += take
+
+		return (vk.DescriptorSet*count)(*sets)
+
+	def release(self, sets):
+		"""
+		Puts sets handed out by :meth:`allocate` on the free list. No
+		command buffer that may still run may bind them.
+		"""
+		self.free.extend(sets)
+
+	def share(self, textures):
+		"""
+		Finds the descriptor binding the given textures with the sampler
+		for each one's mip levels, or creates it. Every call has to be
+		matched by a :meth:`~diskovery_descriptor.Descriptor.cleanup` of
+		the descriptor returned.
+
+		:param textures: The :class:`~diskovery_image.Texture` of every binding, in order
+		:returns: The shared :class:`~diskovery_descriptor.Descriptor`
+		"""
+		# Keyed on the textures rather than their handles, which Vulkan may
+		# give to a new image view once a texture is destroyed
+		key = tuple((t, t.mip) for t in textures)
+
+		entry = self.shared.get(key)
+		if entry is not None:
+			entry[1] += 1
+			return entry[0]
+
+		descriptor = Descriptor(self.dk, self.definition, self.layout, [], textures, self)
+		descriptor.key = key
+		self.shared[key] = [descriptor, 1]
+
+		return descriptor
+
+	def unshare(self, descriptor):
+		"""
+		Drops a user of a descriptor from :meth:`share`, releasing its sets
+		when it was the last one
+		"""
+		entry = self.shared[descriptor.key]
+		entry[1] -= 1
+
+		if entry[1] == 0:
+			del self.shared[descriptor.key]
+			self.release(descriptor.sets)
+
+	def stats(self):
+		"""
+		:returns: A dictionary with the number of ``pools`` created, the
+			``sets`` allocated from them, the sets ``free`` to be reused,
+			the number of times a set was ``reused``, the number of
+			``shared`` descriptors and the ``shared_users`` holding them,
+			and the ``sets_saved`` and ``writes_saved`` (descriptor
+			writes) by sharing rather than giving each user its own sets
+		"""
+		saved = sum((users - 1) * len(d.sets) for d, users in self.shared.values())
+
+		return {
+			'pools': len(self.pools),
+			'sets': self.allocated,
+			'free': len(self.free),
+			'reused': self.reused,
+			'shared': len(self.shared),
+			'shared_users': sum(users for d, users in self.shared.values()),
+			'sets_saved': saved,
+			'writes_saved': saved * len(self.definition)
+		}
+
+	def cleanup(self):
+		"""
+		Destroys every pool, which frees all of the sets handed out
+		"""
+		for pool in self.pools:
+			self.dk.DestroyDescriptorPool(self.dk.device, pool, None)
+
+		self.pools = []
+		self.free = []
+		self.shared = { }
+		self.remaining = 0
+
 class Descriptor(object):
 	"""
 	The :class:`~diskovery_descriptor.Descriptor` class wraps the creation
 	of a VkDescriptorPool_ and an array of VkDescriptorSet_ objects, one for each
 	VkFramebuffer_. It stores data passed from a :class:`~diskovery.RenderedEntity`
-	and builds Vulkan descriptor objects around this data.
+	and builds Vulkan descriptor objects around this data. When it is given a
+	:class:`~diskovery_descriptor.DescriptorAllocator`, the sets are taken
+	from the allocator's shared pools instead, and given back to it by
+	:meth:`cleanup`.
 
 	The implementation of some more advanced graphics programming concepts may 
 	require that multiple descriptor sets are bound for each render pass, but for
@@ -137,7 +374,17 @@ class Descriptor(object):
 	.. py:attribute:: pool
 
 		Stores the VkDescriptorPool_ handle needed to create the
-		VkDescriptorSet_ array.
+		VkDescriptorSet_ array, when there is no :attr:`allocator`.
+
+	.. py:attribute:: allocator
+
+		The :class:`~diskovery_descriptor.DescriptorAllocator` the sets
+		were taken from, or ``None``
+
+	.. py:attribute:: key
+
+		The key of a descriptor shared through
+		:meth:`~diskovery_descriptor.DescriptorAllocator.share`, or ``None``
 
 	.. py:attribute:: sets
 
@@ -176,34 +423,7 @@ class Descriptor(object):
 		determine the sizes of each individual pool the VkDescriptorPool_
 		will handle.
 		"""
-		sizes = (vk.DescriptorPoolSize*len(self.definition))()
-
-		for index, defn in enumerate(self.definition):
-			size = vk.DescriptorPoolSize()
-
-			if defn == BindingType.UNIFORM_BUFFER:
-				size.type = vk.DESCRIPTOR_TYPE_UNIFORM_BUFFER
-
-			if defn == BindingType.TEXTURE_SAMPLER:
-				size.type = vk.DESCRIPTOR_TYPE_COMBINED_IMAGE_SAMPLER
-
-			size.descriptor_count = self.dk.image_data['count']
-
-			sizes[index] = size
-
-		pool_info = vk.DescriptorPoolCreateInfo(
-			s_type=vk.STRUCTURE_TYPE_DESCRIPTOR_POOL_CREATE_INFO,
-			pool_size_count=len(sizes),
-			pool_sizes=cast(sizes, POINTER(vk.DescriptorPoolSize)),
-			max_sets=self.dk.image_data['count']
-		)
-
-		self.dk.CreateDescriptorPool(
-			self.dk.device, 
-			byref(pool_info), 
-			None, 
-			byref(self.pool)
-		)
+		self.pool = make_pool(self.dk, self.definition, self.dk.image_data['count'])
 
 	def create_sets(self):
 		"""
@@ -216,25 +436,14 @@ class Descriptor(object):
 
 		.. _VkWriteDescriptorSet: https://www.khronos.org/registry/vulkan/specs/1.1-extensions/man/html/VkWriteDescriptorSet.html
 		"""
-		layouts = (vk.DescriptorSetLayout*self.dk.image_data['count'])()
-		self.sets = (vk.DescriptorSet * len(layouts))()
-		for i in range(0, len(layouts)):
-			layouts[i] = self.layout
-
-		alloc_info = vk.DescriptorSetAllocateInfo(
-			s_type=vk.STRUCTURE_TYPE_DESCRIPTOR_SET_ALLOCATE_INFO,
-			descriptor_pool=self.pool,
-			descriptor_set_count=len(layouts),
-			set_layouts=cast(layouts, POINTER(vk.DescriptorSetLayout))
-		)
+		count = self.dk.image_data['count']
 
-		self.dk.AllocateDescriptorSets(
-			self.dk.device, 
-			byref(alloc_info), 
-			cast(self.sets, POINTER(vk.DescriptorSet))
-		)
+		if self.allocator is not None:
+			self.sets = self.allocator.allocate(count)
+		else:
+			self.sets = allocate_sets(self.dk, self.pool, self.layout, count)
 
-		for i in range(0, len(layouts)):
+		for i in range(0, count):
 
 			u_ptr = 0
 			t_ptr = 0
@@ -251,7 +460,7 @@ class Descriptor(object):
 				if self.definition[j] == BindingType.UNIFORM_BUFFER:
 					buffer_info = vk.DescriptorBufferInfo(
 						buffer=self.uniforms[u_ptr].buffer(i),
-						offset=0,
+						offset=self.uniforms[u_ptr].offset,
 						range=self.uniforms[u_ptr].u_type.get_size()
 					)
 
@@ -280,7 +489,7 @@ class Descriptor(object):
 				None
 			)
 
-	def __init__(self, dk, definition, layout, uniforms, textures):
+	def __init__(self, dk, definition, layout, uniforms, textures, allocator=None):
 		self.dk = dk
 
 		self.pool = vk.DescriptorPool(0)
@@ -289,8 +498,11 @@ class Descriptor(object):
 		self.layout = layout
 		self.uniforms = uniforms
 		self.textures = textures
+		self.allocator = allocator
+		self.key = None
 
-		self.create_pool()
+		if allocator is None:
+			self.create_pool()
 		self.create_sets()
 
 	def get_set(self, index):
@@ -307,4 +519,133 @@ class Descriptor(object):
 		Handles necessary Destroy methods for all the Vulkan components 
 		contained inside the :class:`~diskovery_buffer.Buffer`
 		"""
-		self.dk.DestroyDescriptorPool(self.dk.device, self.pool, None)
\ No newline at end of file
+		if self.key is not None:
+			self.allocator.unshare(self)
+			return
+
+		if self.allocator is not None:
+			self.allocator.release(self.sets)
+			self.sets = None
+			return
+
+		self.dk.DestroyDescriptorPool(self.dk.device, self.pool, None)
+
+#: The bindings of the frame set, shared by every pipeline as set 0
+FRAME_DEFINITION = (BindingType.UNIFORM_BUFFER, BindingType.UNIFORM_BUFFER)
+
+#: The uniform types of each binding of the frame set
+FRAME_UNIFORMS = (CameraData, SceneLighting)
+
+class FrameDescriptor(object):
+	"""
+	Owns the frame set (set 0) bound before any entity is drawn. The camera
+	matrices are written to one :class:`~diskovery_buffer.UniformBuffer`
+	per frame, and each light scene gets a :class:`Descriptor` pairing that
+	buffer with the scene's :class:`~diskovery_ubos.SceneLighting` uniform.
+	Entities without a light scene are drawn with an empty set of lights.
+
+	.. py:attribute:: layout
+
+		The VkDescriptorSetLayout_ of :data:`FRAME_DEFINITION`, used as the
+		first set layout of every :class:`~diskovery_pipeline.Pipeline`
+
+	.. py:attribute:: camera
+
+		The :class:`~diskovery.Camera` whose matrices are copied by :meth:`update`
+
+	.. py:attribute:: scenes
+
+		A dictionary of the :class:`~diskovery_ubos.SceneLighting` objects
+		added with :meth:`add_scene`, keyed by light scene name. The ``None``
+		key holds the empty scene. Their buffers are cleaned up with the
+		frame descriptor, or when the scene is removed.
+	"""
+	def __init__(self, dk, camera=None):
+		self.dk = dk
+		self.camera = camera
+
+		self.layout = make_set_layout(dk, FRAME_DEFINITION)
+
+		self.camera_data = CameraData()
+		self.camera_buffer = UniformBuffer(dk, CameraData)
+
+		self.scenes = { }
+		self.sets = { }
+
+		unlit = SceneLighting()
+		unlit.buffer = UniformBuffer(dk, SceneLighting)
+		unlit.mark_dirty()
+		self.add_scene(None, unlit)
+
+	def add_scene(self, name, lighting):
+		"""
+		Creates the frame set used by entities in the light scene ``name``.
+		A scene already added under that name is removed first, so no frame
+		in flight may still bind its set.
+
+		:param lighting: The scene's :class:`~diskovery_ubos.SceneLighting`, with its ``buffer`` already created
+		"""
+		if name in self.sets:
+			self.remove_scene(name)
+
+		self.scenes[name] = lighting
+		self.sets[name] = Descriptor(
+			self.dk,
+			FRAME_DEFINITION,
+			self.layout,
+			[self.camera_buffer, lighting.buffer],
+			[]
+		)
+
+	def remove_scene(self, name):
+		"""
+		Destroys the frame set of the light scene ``name`` and the buffer
+		of its :class:`~diskovery_ubos.SceneLighting`. Entities in the scene
+		are drawn with the empty set of lights once their command buffers
+		are recorded again. No frame in flight may still bind the set.
+		"""
+		self.sets.pop(name).cleanup()
+		self.scenes.pop(name).buffer.cleanup()
+
+	def clear(self):
+		"""
+		Removes every light scene added with :meth:`add_scene`, keeping the
+		empty one. No frame in flight may still bind their sets.
+		"""
+		for name in [n for n in self.sets if n is not None]:
+			self.remove_scene(name)
+
+	def get_set(self, name, index):
+		"""
+		Retrieves the frame set for the light scene ``name`` at the given
+		index, or the unlit set if there is no such scene
+		"""
+		if name not in self.sets:
+			name = None
+
+		return self.sets[name].get_set(index)
+
+	def update(self, index):
+		"""
+		Writes the camera matrices and any changed lights for the back
+		buffer at ``index``. Called once per frame, after the entities
+		(including the camera) have been updated.
+		"""
+		if self.camera is not None:
+			self.camera_data.view = self.camera.view_matrix
+			self.camera_data.projection = self.camera.proj_matrix
+			self.camera_buffer.update(self.camera_data.get_data(), index)
+
+		for lighting in self.scenes.values():
+			lighting.upload(index)
+
+	def cleanup(self):
+		for d in self.sets.values():
+			d.cleanup()
+
+		self.camera_buffer.cleanup()
+
+		for lighting in self.scenes.values():
+			lighting.buffer.cleanup()
+
+		self.dk.DestroyDescriptorSetLayout(self.dk.device, self.layout, None)
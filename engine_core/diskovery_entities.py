@@ -52,18 +52,10 @@ class SelectableEntity(diskovery.RenderedEntity):
 	def update(self, ind):
 		diskovery.RenderedEntity.update(self, ind)
 
-		lit = Boolean(self.is_lit)
-		self.uniforms[2].update(lit.get_data(), ind)
-
-		tint = Tint(self.tint)
-		self.uniforms[3].update(tint.get_data(), ind)
-
-		selected = Boolean(self.selected)
-		self.uniforms[4].update(selected.get_data(), ind)
-
-
-		col = Color(self.color)
-		self.uniforms[5].update(col.get_data(), ind)
+		# Copied into the instance buffer, see DrawData
+		self.draw_data.is_lit = self.is_lit
+		self.draw_data.selected = self.selected
+		self.draw_data.color = self.color
 
 		if self.selected:
 			diskovery.entity("Cursor").show()
@@ -128,20 +120,11 @@ class SelectableTerrain(diskovery.Terrain):
 	def update(self, ind):
 		diskovery.RenderedEntity.update(self, ind)
 
-		lit = Boolean(self.is_lit)
-		self.uniforms[2].update(lit.get_data(), ind)
-
-		tint = Tint(self.tint)
-		self.uniforms[3].update(tint.get_data(), ind)
-
-		selected = Boolean(self.selected)
-		self.uniforms[4].update(selected.get_data(), ind)
-
-		col = Color(self.color)
-		self.uniforms[5].update(col.get_data(), ind)
-
-		sub = Float(self.sub_div)
-		self.uniforms[6].update(sub.get_data(), ind)
+		# Copied into the instance buffer, see DrawData
+		self.draw_data.is_lit = self.is_lit
+		self.draw_data.selected = self.selected
+		self.draw_data.color = self.color
+		self.draw_data.sub = self.sub_div
 
 		if self.selected:
 			diskovery.entity("Cursor").show()
@@ -354,11 +337,14 @@ class Sprite(diskovery.RenderedEntity):
 			textures_str=textures_str
 		)
 
+		self.screen_size = ScreenSize(0, 0)
+
 	def update(self, ind):
 		diskovery.RenderedEntity.update(self, ind)
 		dim = diskovery.dimensions()
-		s = ScreenSize(dim[0], dim[1])
-		self.uniforms[1].update(s.get_data(), ind)
+		self.screen_size.width.value = dim[0]
+		self.screen_size.height.value = dim[1]
+		self.uniforms[0].update(self.screen_size.get_data(), ind)
 
 class Tree(diskovery.RenderedEntity):
 
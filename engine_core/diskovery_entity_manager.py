@@ -26,9 +26,13 @@ to be used elsewhere.
 
 import vk
 import time
+import numpy as np
 from ctypes import *
+from concurrent.futures import ThreadPoolExecutor
+from diskovery_recorder import SecondaryRecorder
 from diskovery_image import Image, image_to_buffer
-from diskovery_buffer import Buffer
+from diskovery_buffer import Buffer, InstanceBuffer, IndirectBuffer, INSTANCE_WIDTH
+from diskovery_culling import frustum_planes, visible_spheres
 
 MAX_FRAMES_IN_FLIGHT = 2
 UINT64_MAX = 18446744073709551615
@@ -47,6 +51,546 @@ def cleanup_entities():
 	for e in _entities.values():
 		e.cleanup()
 
+#: The counters kept for every recorded command buffer: the number of
+#: draws and of entities they drew (more than one per instanced draw), how
+#: many times the pipeline, the mesh (vertex and index buffer) and the
+#: frame set were bound, how many times the entity set (set 1) was bound
+#: and how many of its binds were skipped because the previous draw
+#: bound the same set, how many draws pushed constants, and how many
+#: indirect draw calls ran the draws read from an
+#: :class:`~diskovery_buffer.IndirectBuffer`. The entities drawn
+#: indirectly change every frame without recording, so they are counted
+#: by the :class:`RenderList` instead of ``instances``.
+DRAW_STATS = ('draws', 'instances', 'pipeline_binds', 'mesh_binds', 'frame_binds',
+	'set_binds', 'set_binds_skipped', 'pushes', 'indirect_draws')
+
+class DrawItem(object):
+	"""
+	One entity's draw call, with the objects it binds looked up once when
+	the :class:`RenderList` is built rather than for every command. Draws
+	whose vertex stage takes per-instance attributes read the
+	:class:`~diskovery_ubos.DrawData` of their entities from an
+	:class:`~diskovery_buffer.InstanceBuffer`, starting at
+	``first_instance``, which the :class:`RenderList` fills in. An
+	instanced draw covers a list of entities, one row each. Culling
+	clears ``visible`` on draws whose entities are all out of view, and
+	keeps the entities of an instanced draw still in view in
+	``visible_instances``, and their positions among ``instances`` in
+	``visible_rows``, which is ``None`` while none are culled. Instanced draws of a list with an
+	:class:`~diskovery_buffer.IndirectBuffer` read their command from its
+	``command`` slot, and the first of ``draw_count`` consecutive commands
+	runs them all in one indirect draw, leaving the others at ``0``.
+
+	:param entity: The :class:`~diskovery.RenderedEntity` to draw, or the first of the instances
+	:param pipeline: Its :class:`~diskovery_pipeline.Pipeline`
+	:param mesh: Its :class:`~diskovery_mesh.Mesh`
+	:param instances: The entities drawn by an instanced draw, all sharing the first one's mesh and descriptor set
+	:param buffer: The :class:`~diskovery_buffer.InstanceBuffer` the draw reads from, if its vertex stage takes per-instance attributes
+	"""
+	__slots__ = ('entity', 'pipeline', 'mesh', 'layout', 'descriptor', 'push_data',
+		'instances', 'buffer', 'first_instance', 'visible', 'visible_instances',
+		'visible_rows', 'commands', 'command', 'draw_count')
+
+	def __init__(self, entity, pipeline, mesh, instances=None, buffer=None):
+		self.entity = entity
+		self.pipeline = pipeline
+		self.mesh = mesh
+		self.layout = pipeline.pipeline_layout
+		self.descriptor = getattr(entity, 'descriptor', None)
+		self.push_data = getattr(entity, 'push_data', None) if instances is None else None
+
+		self.instances = instances
+		self.buffer = buffer
+		self.first_instance = 0
+
+		self.visible = True
+		self.visible_instances = instances
+		self.visible_rows = None
+
+		self.commands = None
+		self.command = 0
+		self.draw_count = 1
+
+class RenderList(object):
+	"""
+	The draws the renderers record, sorted so that entities sharing a
+	pipeline, then a page of the geometry arena, then a mesh, then a light
+	scene are drawn one after the other and the binds between them can be
+	skipped. Adding, removing, hiding or showing entities only marks the
+	list as changed, and it is rebuilt at most once per frame by
+	:meth:`update`. Each rebuild bumps :attr:`version` at the next
+	:meth:`write_frame`, which the renderers compare against the version
+	each of their command buffers was recorded with to know which ones
+	are stale.
+
+	When the list has an :class:`~diskovery_buffer.IndirectBuffer`, every
+	entity that can be instanced is drawn by an instanced draw, even on
+	its own, and the command buffers only hold indirect draws reading the
+	instance counts and offsets from that buffer. The version then only
+	increases when the binds and draw calls that were recorded change, so
+	entities joining or leaving an existing draw, or being culled, only
+	rewrite the buffers filled by :meth:`write_frame`.
+
+	.. py:attribute:: draws
+
+		The list of :class:`DrawItem` objects for the entities with a
+		loaded mesh that aren't hidden. Pipelines, and then meshes, are
+		ordered by when they were first used by an entity, so the order
+		is stable between rebuilds.
+
+		Entities whose shader can be instanced (see
+		:meth:`~diskovery_pipeline.Shader.can_instance`), and that share
+		it with others using the same mesh, textures and light scene, are
+		drawn by a single instanced :class:`DrawItem`.
+
+	.. py:attribute:: instances
+
+		The :class:`~diskovery_buffer.InstanceBuffer` the draws read their
+		model matrices and material values from, filled by
+		:meth:`write_instances` every frame
+
+	.. py:attribute:: block
+
+		A ``(instance_count, INSTANCE_WIDTH)`` array laid out like the
+		instance buffer, holding the :class:`~diskovery_ubos.DrawData`
+		of every entity drawn from it, see
+		:meth:`~diskovery_ubos.DrawData.bind`
+
+	.. py:attribute:: instance_count
+
+		The number of rows of the instance buffer used by the draws
+
+	.. py:attribute:: commands
+
+		The :class:`~diskovery_buffer.IndirectBuffer` holding one draw
+		command per instanced draw, or ``None`` to record every draw
+		directly
+
+	.. py:attribute:: version
+
+		Increases every time the list is rebuilt, or culling changes which
+		entities are drawn, unless the recorded indirect draws stay the same
+
+	.. py:attribute:: visible_count
+
+		The number of entities drawn after the last :meth:`cull`
+
+	.. py:attribute:: culled_count
+
+		The number of entities in the list left out by the last :meth:`cull`
+
+	.. py:attribute:: changed
+
+		Whether the list has to be rebuilt at the next :meth:`update`
+	"""
+	def __init__(self, instances, commands=None):
+		self.draws = []
+		self.batches = []
+		self.instances = instances
+		self.commands = commands
+		self.instance_count = 0
+		self.block = np.zeros((0, INSTANCE_WIDTH), dtype=np.float32)
+		self.version = 0
+		self.changed = True
+
+		# Set when the draws or their visibility changed, and compared
+		# against the recorded layout at the next write_frame
+		self.restructured = False
+		self.layout = None
+
+		# The entities that can be culled, the model space bounding
+		# spheres of their meshes, and the mask of the last cull
+		self.cullable = []
+		self.centers = np.zeros((0, 3), dtype=np.float32)
+		self.radii = np.zeros(0, dtype=np.float32)
+		self.mask = np.ones(0, dtype=bool)
+		# Each cullable draw paired with its range of the cull arrays
+		self.cull_ranges = []
+
+		self.visible_count = 0
+		self.culled_count = 0
+
+		# Entities with a hidden flag, and the value it had at the last
+		# rebuild, so flipping the flag directly also changes the list
+		self.hidable = []
+		self.hidden = []
+
+	def invalidate(self, rerecord=False):
+		"""
+		Marks the list to be rebuilt at the next :meth:`update`. With
+		``rerecord`` set, the rebuild also records the command buffers
+		again, for changes the list can't see, such as a light scene's
+		frame sets being replaced.
+		"""
+		self.changed = True
+
+		if rerecord:
+			self.layout = None
+
+	def update(self):
+		"""
+		Rebuilds the list if it was invalidated or any entity was hidden or
+		shown since the last rebuild.
+
+		:returns: Whether the list was rebuilt
+		"""
+		global _entities
+
+		hidden = [e.hidden for e in self.hidable]
+		if not self.changed and hidden == self.hidden:
+			return False
+
+		draws = []
+		self.hidable = []
+
+		for entity in _entities.values():
+
+			# Skip standard Entity objects
+			if not hasattr(entity, 'mesh'):
+				continue
+
+			if hasattr(entity, 'hidden'):
+				self.hidable.append(entity)
+				if entity.hidden:
+					continue
+
+			# Skip entities whose mesh is still loading
+			mesh = entity.get_mesh()
+			if mesh is None:
+				continue
+
+			pipeline = entity.get_pipeline()
+			buffer = self.instances if pipeline.shader.instanced else None
+			draws.append(DrawItem(entity, pipeline, mesh, buffer=buffer))
+
+		draws = self.batch(draws)
+
+		# Numbered by first use, which keeps the sort stable and
+		# compares handles rather than names
+		order = { }
+		def rank(obj):
+			return order.setdefault(id(obj), len(order))
+
+		# Meshes sharing buffers are kept together, so only moving to
+		# another page of the geometry arena rebinds them
+		draws.sort(key=lambda d: (rank(d.pipeline), rank(d.mesh.vertices), rank(d.mesh), str(getattr(d.entity, 'light_scene', None))))
+		self.draws = draws
+
+		# Each draw reads its own range of the instance buffer, one row
+		# per entity
+		self.batches = [d for d in draws if d.instances is not None]
+		self.instance_count = 0
+		for draw in draws:
+			if draw.buffer is None:
+				continue
+
+			draw.first_instance = self.instance_count
+			self.instance_count += len(draw.instances) if draw.instances is not None else 1
+
+		# The entities fill their rows of the block in place every frame,
+		# so write_instances copies whole ranges of it. A new block is
+		# made each rebuild, as entities may change rows
+		self.block = np.zeros((self.instance_count, INSTANCE_WIDTH), dtype=np.float32)
+		for draw in draws:
+			if draw.buffer is None:
+				continue
+
+			entities = draw.instances if draw.instances is not None else (draw.entity,)
+			for i, e in enumerate(entities):
+				e.draw_data.bind(self.block[draw.first_instance + i])
+
+		if self.commands is not None:
+			self.merge_commands()
+
+		self.gather_bounds()
+
+		self.hidden = [e.hidden for e in self.hidable]
+		self.changed = False
+		self.restructured = True
+
+		return True
+
+	def merge_commands(self):
+		"""
+		Gives each instanced draw its command in the indirect buffer, and
+		runs of consecutive instanced draws that only differ in their
+		offsets into the same vertex and index buffers to the first draw
+		of the run, which draws them all with one indirect draw.
+		"""
+		leader = None
+		command = 0
+
+		for draw in self.draws:
+			if draw.instances is None:
+				# Direct draws go between the runs, keeping the order
+				leader = None
+				continue
+
+			draw.commands = self.commands
+			draw.command = command
+			command += 1
+			draw.draw_count = 1
+
+			if leader is not None and self.commands.multi_draw and \
+					draw.pipeline is leader.pipeline and \
+					draw.mesh.vertices is leader.mesh.vertices and \
+					draw.mesh.indices is leader.mesh.indices and \
+					draw.descriptor is leader.descriptor and \
+					getattr(draw.entity, 'light_scene', None) == getattr(leader.entity, 'light_scene', None):
+				leader.draw_count += 1
+				draw.draw_count = 0
+			else:
+				leader = draw
+
+	def layout_key(self):
+		"""
+		Describes everything the recorded command buffers depend on when
+		drawing indirectly: the objects each draw binds, the commands it
+		runs, the visibility and instance row of direct draws, and the size
+		(and so the handles) of the per-frame buffers.
+		"""
+		key = [self.instances.capacity, self.commands.capacity]
+
+		for draw in self.draws:
+			scene = getattr(draw.entity, 'light_scene', None)
+
+			if draw.commands is None:
+				key.append((draw.entity, draw.pipeline, draw.mesh, scene, draw.visible, draw.first_instance))
+			else:
+				key.append((draw.pipeline, draw.mesh.vertices, draw.mesh.indices,
+					draw.descriptor, scene, draw.command, draw.draw_count))
+
+		return key
+
+	def fits(self):
+		"""
+		Whether the per-frame buffers can hold the current draws
+		"""
+		return self.instances.fits(self.instance_count) and \
+			(self.commands is None or self.commands.fits(len(self.batches)))
+
+	def reserve(self):
+		"""
+		Grows the per-frame buffers to hold the current draws. Like
+		:meth:`~diskovery_buffer.InstanceBuffer.reserve`, this may destroy
+		buffers, so no frame in flight may still read them.
+		"""
+		self.instances.reserve(self.instance_count)
+
+		if self.commands is not None:
+			self.commands.reserve(len(self.batches))
+
+	def batch(self, draws):
+		"""
+		Replaces the draws of entities that can be instanced together with
+		one instanced :class:`DrawItem` per group. Groups of one entity
+		are drawn normally.
+		"""
+		groups = { }
+		batched = []
+
+		# Each group takes the place of its first entity
+		for draw in draws:
+			entity = draw.entity
+
+			if not draw.pipeline.shader.can_instance() or not getattr(entity, 'instancing', False):
+				batched.append(draw)
+				continue
+
+			key = (
+				id(draw.pipeline),
+				id(draw.mesh),
+				tuple(entity.textures),
+				getattr(entity, 'light_scene', None)
+			)
+
+			if key not in groups:
+				groups[key] = []
+				batched.append(groups[key])
+			groups[key].append(draw)
+
+		for i, group in enumerate(batched):
+			if not isinstance(group, list):
+				continue
+
+			first = group[0]
+			if len(group) == 1 and self.commands is None:
+				batched[i] = first
+			else:
+				batched[i] = DrawItem(
+					first.entity,
+					first.pipeline,
+					first.mesh,
+					[d.entity for d in group],
+					self.instances
+				)
+
+		return batched
+
+	def gather_bounds(self):
+		"""
+		Collects the bounding spheres of the entities that can be culled,
+		in draw order, after a rebuild. Only meshes placed by the camera
+		matrices are culled, so screen space sprites, skinned meshes and
+		entities without a ``transform`` are always drawn.
+		"""
+		self.cullable = []
+		self.cull_ranges = []
+		centers = []
+		radii = []
+
+		for draw in self.draws:
+			entities = draw.instances if draw.instances is not None else [draw.entity]
+
+			if not (getattr(draw.mesh, 'cullable', False) and \
+					draw.pipeline.shader.world_space and \
+					hasattr(draw.entity, 'transform')):
+				continue
+
+			start = len(self.cullable)
+			self.cullable.extend(entities)
+			self.cull_ranges.append((draw, start, len(self.cullable)))
+
+			centers.extend([draw.mesh.center] * len(entities))
+			radii.extend([draw.mesh.radius] * len(entities))
+
+		self.centers = np.array(centers, dtype=np.float32).reshape(-1, 3)
+		self.radii = np.array(radii, dtype=np.float32)
+
+		# New draws start out visible
+		self.mask = np.ones(len(self.cullable), dtype=bool)
+
+		total = sum(len(d.instances) if d.instances is not None else 1 for d in self.draws)
+		self.visible_count = total
+		self.culled_count = 0
+
+	def cull(self, camera):
+		"""
+		Tests every cullable entity's bounding sphere against the camera's
+		view frustum, using the ``transform`` of each entity from this
+		frame's update. When the set of visible entities changes, the
+		draws are updated, and :meth:`write_frame` decides whether the
+		renderers have to record them again.
+
+		:param camera: The :class:`~diskovery.Camera` to cull against, or ``None`` to draw every entity
+		"""
+		if len(self.cullable) == 0:
+			return
+
+		if camera is None:
+			mask = np.ones(len(self.cullable), dtype=bool)
+		else:
+			planes = frustum_planes(camera.view_matrix, camera.proj_matrix)
+			models = np.array([e.transform for e in self.cullable], dtype=np.float32)
+			mask = visible_spheres(planes, models, self.centers, self.radii)
+
+		if np.array_equal(mask, self.mask):
+			return
+
+		for draw, start, end in self.cull_ranges:
+			if draw.instances is None:
+				draw.visible = bool(mask[start])
+			else:
+				rows = mask[start:end]
+				draw.visible_instances = [e for e, m in zip(draw.instances, rows) if m]
+				draw.visible_rows = None if rows.all() else np.flatnonzero(rows)
+				draw.visible = len(draw.visible_instances) > 0
+
+		culled = len(mask) - int(np.count_nonzero(mask))
+		self.visible_count += self.culled_count - culled
+		self.culled_count = culled
+
+		self.mask = mask
+		self.restructured = True
+
+	def write_frame(self, index):
+		"""
+		Brings the per-frame data of the back buffer at ``index`` up to
+		date, once the list is rebuilt and culled for this frame.
+		:attr:`version` increases first if anything the command buffers
+		recorded changed, which without an indirect buffer is any change
+		to the draws at all.
+		"""
+		if self.restructured:
+			layout = self.layout_key() if self.commands is not None else None
+
+			if layout is None or layout != self.layout:
+				self.version += 1
+
+			self.layout = layout
+			self.restructured = False
+
+		self.write_instances(index)
+
+		if self.commands is not None:
+			self.write_commands(index)
+
+	def write_commands(self, index):
+		"""
+		Writes the draw command of every instanced draw into the indirect
+		buffer of the given back buffer. Culled draws are left in place
+		with no instances.
+		"""
+		if len(self.batches) == 0:
+			return
+
+		self.commands.views[index][:len(self.batches)] = [
+			(
+				draw.mesh.count,
+				len(draw.visible_instances),
+				draw.mesh.first_index,
+				draw.mesh.vertex_offset,
+				draw.first_instance
+			)
+			for draw in self.batches
+		]
+
+	def write_instances(self, index):
+		"""
+		Fills the :class:`~diskovery_ubos.DrawData` of every drawn entity
+		in :attr:`block`, and copies the block into the instance buffer of
+		the given back buffer, in one ``numpy`` copy when nothing is culled
+		and one per draw otherwise. Only the instances left by culling are
+		written, from the start of each draw's range. Called every frame
+		after the entities are updated, so the command buffers never hold
+		values that change between frames.
+		"""
+		if self.instance_count == 0:
+			return
+
+		rows = self.instances.views[index]
+
+		for draw in self.draws:
+			if draw.buffer is None or not draw.visible:
+				continue
+
+			if draw.instances is None:
+				draw.entity.draw_data.get_data()
+				continue
+
+			for e in draw.visible_instances:
+				e.draw_data.get_data()
+
+		if self.culled_count == 0:
+			rows[:self.instance_count] = self.block
+			return
+
+		for draw in self.draws:
+			if draw.buffer is None or not draw.visible:
+				continue
+
+			first = draw.first_instance
+
+			if draw.visible_rows is None:
+				last = first + (len(draw.instances) if draw.instances is not None else 1)
+				rows[first:last] = self.block[first:last]
+				continue
+
+			# Packed to the start of the range, as the draw reads them
+			last = first + len(draw.visible_rows)
+			np.take(self.block[first:first + len(draw.instances)], draw.visible_rows,
+				axis=0, out=rows[first:last], mode='clip')
+
 class Renderer(object):
 
 	def add_color_attachment(self):
@@ -151,13 +695,10 @@ class Renderer(object):
 
 	def create_command_buffers(self):
 		"""
-		Any time a new Entity is added or an Entity is removed from the scene,
-		the VkCommandBuffer_ objects need to be updated to reflect the new
-		number of draw calls that need to be executed. This method handles
-		the creation and recreation of the list of VkCommandBuffer_ objects.
+		Allocates one VkCommandBuffer_ per framebuffer. They are left empty
+		and marked stale, and each one is recorded by
+		:meth:`EntityManager.draw` the first time its image is acquired.
 		"""
-		global _entities
-
 		# Make sure no other command buffers exist
 		self.destroy_command_buffers()
 
@@ -177,100 +718,266 @@ class Renderer(object):
 			cast(self.command_buffers, POINTER(vk.CommandBuffer))
 		)
 
-		for index, buff in enumerate(self.command_buffers):
+		self.recorded = [None] * self.buffer_count
 
-			begin_info = vk.CommandBufferBeginInfo(
-				s_type=vk.STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
-				flags=vk.COMMAND_BUFFER_USAGE_SIMULTANEOUS_USE_BIT
-			)
+	def binds_saved(self):
+		"""
+		The number of pipeline, vertex buffer, index buffer, frame set and
+		entity set binds the last recorded command buffer skipped compared
+		to binding all of them for every draw
 
-			self.dk.BeginCommandBuffer(buff, byref(begin_info))
+		:returns: The number of binds saved per frame
+		"""
+		draws = self.stats['draws']
+		return (4 * draws) - (self.stats['pipeline_binds'] +
+			2 * self.stats['mesh_binds'] + self.stats['frame_binds']) + \
+			self.stats['set_binds_skipped']
 
-			render_area = vk.Rect2D()
-			render_area.offset = vk.Offset2D(0, 0)
+	def is_stale(self, index, render_list):
+		"""
+		Whether the VkCommandBuffer_ at the given index has to be recorded
+		again before it is submitted, because the render list changed since
+		it was recorded. The values that change every frame are read from
+		the per-frame buffers of the list, so nothing else makes it stale.
+		"""
+		return self.recorded[index] != render_list.version
 
-			# TODO: adjust to renderer.size
-			render_area.extent = self.size
+	def record(self, index, render_list):
+		"""
+		Records the draws of the :class:`RenderList` into the
+		VkCommandBuffer_ at the given index, and keeps count of them in
+		:attr:`stats`.
+		Entities whose shader has a push constant block have the push data
+		they hold now recorded inline, and keep it until the list changes.
+
+		When the renderer has a :attr:`recorder` and the list is large
+		enough, the draws are recorded into secondary command buffers on
+		the recorder's threads, and this buffer only executes them.
+		"""
+		buff = self.command_buffers[index]
+		draws = render_list.draws
 
-			# Set the color the screen will reset to when redrawn
-			clear_values = (vk.ClearValue*(self.dk.max_color_attachments + 1))()
+		parallel = self.recorder is not None and self.recorder.should_split(len(draws))
 
-			for i in range(0, len(clear_values)):
-				clear_values[i] = vk.ClearValue()
+		begin_info = vk.CommandBufferBeginInfo(
+			s_type=vk.STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
+			flags=vk.COMMAND_BUFFER_USAGE_SIMULTANEOUS_USE_BIT
+		)
 
-				if i <  len(clear_values) - 1:
-					if i == 0:
-						clear_values[i].color = vk.ClearColorValue(
-							float32=(c_float*4)(
-								self.bg_color[0],
-								self.bg_color[1],
-								self.bg_color[2],
-								1.
-							)
-						)
+		self.dk.BeginCommandBuffer(buff, byref(begin_info))
 
-					else:
-						clear_values[i].color = vk.ClearColorValue(float32=(c_float*4)(0.0,0.0,0.0,1.))
+		render_area = vk.Rect2D()
+		render_area.offset = vk.Offset2D(0, 0)
 
-				else:
-					clear_values[i].depth_stencil = vk.ClearDepthStencilValue(
-						depth=1.,
-						stencil=0
+		# TODO: adjust to renderer.size
+		render_area.extent = self.size
+
+		# Set the color the screen will reset to when redrawn
+		clear_values = (vk.ClearValue*(self.dk.max_color_attachments + 1))()
+
+		for i in range(0, len(clear_values)):
+			clear_values[i] = vk.ClearValue()
+
+			if i <  len(clear_values) - 1:
+				if i == 0:
+					clear_values[i].color = vk.ClearColorValue(
+						float32=(c_float*4)(
+							self.bg_color[0],
+							self.bg_color[1],
+							self.bg_color[2],
+							1.
+						)
 					)
 
-			renderpass_info = vk.RenderPassBeginInfo(
-				s_type=vk.STRUCTURE_TYPE_RENDER_PASS_BEGIN_INFO,
-				render_pass=self.render_pass,
-				framebuffer=self.framebuffers[index],
-				render_area=render_area,
-				clear_value_count=len(clear_values),
-				clear_values=cast(clear_values, POINTER(vk.ClearValue))
-			)
+				else:
+					clear_values[i].color = vk.ClearColorValue(float32=(c_float*4)(0.0,0.0,0.0,1.))
 
+			else:
+				clear_values[i].depth_stencil = vk.ClearDepthStencilValue(
+					depth=1.,
+					stencil=0
+				)
+
+		renderpass_info = vk.RenderPassBeginInfo(
+			s_type=vk.STRUCTURE_TYPE_RENDER_PASS_BEGIN_INFO,
+			render_pass=self.render_pass,
+			framebuffer=self.framebuffers[index],
+			render_area=render_area,
+			clear_value_count=len(clear_values),
+			clear_values=cast(clear_values, POINTER(vk.ClearValue))
+		)
+
+		if parallel:
+			self.dk.CmdBeginRenderPass(buff, byref(renderpass_info), vk.SUBPASS_CONTENTS_SECONDARY_COMMAND_BUFFERS)
+
+			secondary, self.stats = self.recorder.record(self, index, draws)
+			self.dk.CmdExecuteCommands(buff, len(secondary), secondary)
+		else:
 			self.dk.CmdBeginRenderPass(buff, byref(renderpass_info), vk.SUBPASS_CONTENTS_INLINE)
+			self.stats = self.record_draws(buff, index, draws)
 
-			for entity in _entities.values():
+		self.dk.CmdEndRenderPass(buff)
 
-				# Skip standard Entity objects
-				if not hasattr(entity, 'mesh') or (hasattr(entity, 'hidden') and entity.hidden):
-					continue
+		if self.dk.EndCommandBuffer(buff) != vk.SUCCESS:
+			raise RuntimeError("Unable to write command buffer")
+
+		self.recorded[index] = render_list.version
+
+	def record_draws(self, buff, index, draws):
+		"""
+		Records a list of :class:`DrawItem` objects into a command buffer
+		that is inside the render pass. The pipeline, the vertex and index
+		buffers and the frame set are only bound when they differ from
+		the previous draw, which the sorted order of the
+		:class:`RenderList` makes rare. Called from the recorder's threads
+		for secondary command buffers, so it only reads renderer state.
+
+		:param buff: The primary or secondary VkCommandBuffer_ to record into
+		:param index: The index of the framebuffer being drawn
+		:param draws: The draws to record, in order
+		:returns: A dictionary counting the draws, binds and pushes recorded, see :data:`DRAW_STATS`
+		"""
+		stats = dict.fromkeys(DRAW_STATS, 0)
 
+		# Every pipeline layout starts with the same frame set layout and
+		# has the same push constant range, so set 0 stays bound across
+		# pipeline changes until an entity needs another light scene
+		bound_pipeline = None
+		bound_vertices = None
+		bound_indices = None
+		bound_frame = None
+		bound_descriptor = None
+		bound_instances = False
+
+		offset = c_ulonglong(0)
+
+		for draw in draws:
+
+			# Left out by culling, but kept in the list so the order and
+			# instance ranges don't change as the camera moves. Indirect
+			# draws are culled through their command instead
+			if not draw.visible and draw.commands is None:
+				continue
+
+			# Drawn by the first command of its run
+			if draw.draw_count == 0:
+				continue
+
+			if draw.pipeline is not bound_pipeline:
 				self.dk.CmdBindPipeline(buff,
 					vk.PIPELINE_BIND_POINT_GRAPHICS,
-					entity.get_pipeline().pipeline_ref
+					draw.pipeline.pipeline_ref
 				)
+				bound_pipeline = draw.pipeline
+				stats['pipeline_binds'] += 1
 
-				offset = c_ulonglong(0)
+			# Meshes in the same page of the geometry arena share buffers
+			# and only differ in where their draws start
+			if draw.mesh.vertices is not bound_vertices or draw.mesh.indices is not bound_indices:
 				self.dk.CmdBindVertexBuffers(
 					buff,
 					0,
 					1,
-					byref(entity.get_mesh().vertices.buffer),
+					byref(draw.mesh.vertices.buffer),
 					byref(offset)
 				)
 
 				self.dk.CmdBindIndexBuffer(
 					buff,
-					entity.get_mesh().indices.buffer,
+					draw.mesh.indices.buffer,
 					0,
 					vk.INDEX_TYPE_UINT32
 				)
+				bound_vertices = draw.mesh.vertices
+				bound_indices = draw.mesh.indices
+				stats['mesh_binds'] += 1
+
+			frame_set = draw.entity.get_frame_set(index)
+			if frame_set != bound_frame:
+				d_set = vk.DescriptorSet(frame_set)
+				self.dk.CmdBindDescriptorSets(
+					buff,
+					vk.PIPELINE_BIND_POINT_GRAPHICS,
+					draw.layout,
+					0, 1, byref(d_set), 0, None
+				)
+				bound_frame = frame_set
+				stats['frame_binds'] += 1
+
+				# Binding set 0 through a layout made for another entity
+				# set layout disturbs set 1
+				bound_descriptor = None
+
+			# Entities with the same textures share their descriptor, see
+			# DescriptorAllocator.share, and set 1 has the same layout in
+			# every pipeline using it, so it stays bound across them
+			if draw.descriptor is not None and draw.descriptor is bound_descriptor:
+				stats['set_binds_skipped'] += 1
+			elif draw.descriptor is not None:
+				d_set = vk.DescriptorSet(draw.descriptor.get_set(index))
+				self.dk.CmdBindDescriptorSets(
+					buff,
+					vk.PIPELINE_BIND_POINT_GRAPHICS,
+					draw.layout,
+					1, 1, byref(d_set), 0, None
+				)
+				bound_descriptor = draw.descriptor
+				stats['set_binds'] += 1
 
-				if hasattr(entity, "descriptor"):
-					d_set = vk.DescriptorSet(entity.descriptor.get_set(index))
-					self.dk.CmdBindDescriptorSets(
-						buff,
-						vk.PIPELINE_BIND_POINT_GRAPHICS,
-						entity.get_pipeline().pipeline_layout,
-						0, 1, byref(d_set), 0, None
-					)
+			# The bytes are copied into the command buffer when recorded
+			if draw.push_data is not None:
+				self.dk.CmdPushConstants(
+					buff,
+					draw.layout,
+					draw.pipeline.push_constant_range.stage_flags,
+					0,
+					draw.push_data.get_size(),
+					draw.push_data.get_data()
+				)
+				stats['pushes'] += 1
 
-				self.dk.CmdDrawIndexed(buff, entity.get_mesh().count, 1, 0, 0, 1)
+			# Binding 1 isn't touched by pipeline or mesh changes, so the
+			# instance buffer is bound once for every draw reading it
+			if draw.buffer is not None and not bound_instances:
+				self.dk.CmdBindVertexBuffers(
+					buff,
+					1,
+					1,
+					byref(draw.buffer.buffer(index)),
+					byref(offset)
+				)
+				bound_instances = True
 
-			self.dk.CmdEndRenderPass(buff)
+			stats['draws'] += draw.draw_count
 
-			if self.dk.EndCommandBuffer(buff) != vk.SUCCESS:
-				raise RuntimeError("Unable to write command buffer")
+			if draw.instances is None:
+				self.dk.CmdDrawIndexed(buff, draw.mesh.count, 1, draw.mesh.first_index, draw.mesh.vertex_offset, draw.first_instance)
+				stats['instances'] += 1
+				continue
+
+			if draw.commands is not None:
+				stride = sizeof(vk.DrawIndexedIndirectCommand)
+				self.dk.CmdDrawIndexedIndirect(
+					buff,
+					draw.commands.buffer(index),
+					draw.command * stride,
+					draw.draw_count,
+					stride
+				)
+				stats['indirect_draws'] += 1
+				continue
+
+			self.dk.CmdDrawIndexed(
+				buff,
+				draw.mesh.count,
+				len(draw.visible_instances),
+				draw.mesh.first_index,
+				draw.mesh.vertex_offset,
+				draw.first_instance
+			)
+			stats['instances'] += len(draw.visible_instances)
+
+		return stats
 
 	def destroy_command_buffers(self):
 		"""
@@ -320,6 +1027,16 @@ class Renderer(object):
 
 		self.framebuffers = None
 		self.command_buffers = (vk.CommandBuffer * self.buffer_count)()
+
+		# The RenderList version each command buffer was recorded with
+		self.recorded = [None] * self.buffer_count
+		# The SecondaryRecorder used for large scenes, set by the EntityManager
+		self.recorder = None
+		# What the last recorded command buffer held, see DRAW_STATS
+		self.stats = dict.fromkeys(DRAW_STATS, 0)
+		# The frame in flight (fence index) each command buffer was last
+		# submitted with, so it isn't re-recorded while still executing
+		self.submitted = [None] * self.buffer_count
 		self.done_rendering = (vk.Semaphore * MAX_FRAMES_IN_FLIGHT)()
 
 		self.create_attachments(samples)
@@ -340,6 +1057,9 @@ class Renderer(object):
 
 		self.destroy_command_buffers()
 
+		if self.recorder is not None:
+			self.recorder.cleanup()
+
 		for i in range(0, MAX_FRAMES_IN_FLIGHT):
 			self.dk.DestroySemaphore(self.dk.device, self.done_rendering[i], None)
 
@@ -378,6 +1098,39 @@ class EntityManager(object):
 		The dictionary in which all entities in the game world at a given time
 		are stored.
 
+	.. py:attribute:: render_list
+
+		The :class:`RenderList` of entities drawn by every renderer. Changes
+		to the scene invalidate it, and only the command buffer of the
+		image being drawn is recorded again each frame.
+
+	.. py:attribute:: record_threads
+
+		The number of threads command buffers are recorded on. When it is
+		more than one, every renderer gets a
+		:class:`~diskovery_recorder.SecondaryRecorder` sharing one thread
+		pool, and large scenes are recorded in parallel. Set with the
+		'record_threads' value of the config dictionary.
+
+	.. py:attribute:: culling
+
+		Whether entities outside the camera's view frustum are left out of
+		the command buffers, see :meth:`RenderList.cull`. Enabled unless
+		the config dictionary has a 'culling' value of ``False``.
+
+	.. py:attribute:: indirect
+
+		Whether instanced draws are recorded as indirect draws, so changes
+		to which entities they draw don't record the command buffers
+		again, see :class:`RenderList`. Enabled with the 'indirect_draws'
+		value of the config dictionary, on devices supporting the
+		``drawIndirectFirstInstance`` feature.
+
+	.. py:attribute:: removed
+
+		Entities removed since the last frame, cleaned up once the frames
+		in flight that may still draw them are done.
+
 	.. py:attribute:: command_buffers
 
 		Stores the list of VkCommandBuffer_ objects used to store the draw calls
@@ -429,9 +1182,8 @@ class EntityManager(object):
 	def add_entity(self, entity, name):
 		"""
 		Adds an entity to the dictionary of entities. If the entity
-		given is a :class:`~diskovery.RenderedEntity`, this method
-		will also refresh the command buffers to include the draw
-		calls for this new entity.
+		given is a :class:`~diskovery.RenderedEntity`, its draw calls
+		are included in the command buffers from the next frame on.
 
 		:param entity: The :class:`~diskovery.Entity` to be added
 		:param name: A name to address the entity with
@@ -447,23 +1199,49 @@ class EntityManager(object):
 		Given the name by which an :class:`~diskovery.Entity` in the
 		dictionary of entities is addressed, remove it from the
 		dictionary, and if it was a :class:`~diskovery.RenderedEntity`,
-		update the command buffers to not include this Entity in the
-		draw calls.
+		stop drawing it from the next frame on. The entity is cleaned up
+		during that frame, once the GPU is done with it.
 
 		:param name: The name of the entity to remove
 		"""
 		global _entities
 
-		ent = _entities[name]
-		ent.cleanup()
-
+		self.removed.append(_entities[name])
 		del _entities[name]
 
 		self.refresh()
 
-	def refresh(self):
-		for renderer in self.renderers:
-			renderer.create_command_buffers()
+	def refresh(self, rerecord=False):
+		"""
+		Marks the render list as changed. The list is rebuilt once at the
+		start of the next frame, however many times this is called before.
+
+		:param rerecord: Whether the command buffers have to be recorded again even if the draws stay the same, see :meth:`RenderList.invalidate`
+		"""
+		self.render_list.invalidate(rerecord)
+
+	def wait_in_flight(self):
+		"""
+		Waits until every frame submitted so far is done executing
+		"""
+		self.dk.WaitForFences(
+			self.dk.device,
+			MAX_FRAMES_IN_FLIGHT,
+			cast(self.in_flight_fences, POINTER(vk.Fence)),
+			vk.TRUE,
+			UINT64_MAX
+		)
+
+	def release_removed(self):
+		"""
+		Cleans up the entities removed since the last frame. Once the
+		render list no longer holds them, no command buffer drawing them is
+		submitted again, but the frames still in flight may be using them,
+		so :meth:`wait_in_flight` has to be called first.
+		"""
+		for ent in self.removed:
+			ent.cleanup()
+		self.removed = []
 
 	def create_sync_objects(self):
 		"""
@@ -560,6 +1338,47 @@ class EntityManager(object):
 
 		update_entities(image_index)
 
+		# After the camera has moved, so the shared matrices are current
+		if self.frame is not None:
+			self.frame.update(image_index)
+
+		# Every change made since the last frame is applied at once. The
+		# fences are only reset below, so waiting on them here can't block
+		if self.render_list.update():
+
+			# Removed entities and outgrown per-frame buffers may still be
+			# read by the frames in flight
+			if len(self.removed) > 0 or not self.render_list.fits():
+				self.wait_in_flight()
+				self.release_removed()
+				self.render_list.reserve()
+
+		# Entities have moved this frame, so this runs even when the list
+		# itself didn't change
+		camera = self.frame.camera if self.culling and self.frame is not None else None
+		self.render_list.cull(camera)
+
+		self.render_list.write_frame(image_index)
+
+		# Only the command buffer for this image is recorded, and only if
+		# the render list changed since
+		for renderer in self.renderers:
+			buffer_index = image_index if renderer.buffer_count > 1 else 0
+			if not renderer.is_stale(buffer_index, self.render_list):
+				continue
+
+			slot = renderer.submitted[buffer_index]
+			if slot != None:
+				self.dk.WaitForFences(
+					self.dk.device,
+					1,
+					pointer(vk.Fence(self.in_flight_fences[slot])),
+					vk.TRUE,
+					UINT64_MAX
+				)
+
+			renderer.record(buffer_index, self.render_list)
+
 		self.dk.ResetFences(
 			self.dk.device,
 			1,
@@ -570,10 +1389,9 @@ class EntityManager(object):
 			is_first = (i == 0)
 			is_last = (i == (len(self.renderers) - 1))
 
-			if renderer.buffer_count > 1:
-				cmd = vk.CommandBuffer(renderer.command_buffers[image_index])
-			else:
-				cmd = vk.CommandBuffer(renderer.command_buffers[0])
+			buffer_index = image_index if renderer.buffer_count > 1 else 0
+			cmd = vk.CommandBuffer(renderer.command_buffers[buffer_index])
+			renderer.submitted[buffer_index] = self.current_frame
 
 			submit_info = vk.SubmitInfo(
 				s_type=vk.STRUCTURE_TYPE_SUBMIT_INFO,
@@ -623,11 +1441,21 @@ class EntityManager(object):
 
 		self.current_frame = (self.current_frame + 1) % MAX_FRAMES_IN_FLIGHT
 
-	def __init__(self, dk):
+	def __init__(self, dk, record_threads=1, culling=True, indirect=False):
 		self.dk = dk
+		self.culling = culling
+
+		features = getattr(dk, 'features', None)
+		self.indirect = indirect and features is not None and \
+			features.draw_indirect_first_instance == vk.TRUE
 
 		self.renderers = []
 
+		self.record_threads = record_threads
+		self.executor = None
+		if record_threads > 1:
+			self.executor = ThreadPoolExecutor(max_workers=record_threads)
+
 		self.image_available = (vk.Semaphore*MAX_FRAMES_IN_FLIGHT)()
 		self.renders_finished = (vk.Semaphore*MAX_FRAMES_IN_FLIGHT)()
 		self.in_flight_fences = (vk.Fence*MAX_FRAMES_IN_FLIGHT)()
@@ -635,6 +1463,15 @@ class EntityManager(object):
 		self.current_frame = 0
 		self.quitting = False
 
+		# The FrameDescriptor holding set 0, set by diskovery.init
+		self.frame = None
+
+		self.render_list = RenderList(
+			InstanceBuffer(dk),
+			IndirectBuffer(dk) if self.indirect else None
+		)
+		self.removed = []
+
 		self.TIME_VAL = time.perf_counter()
 
 		self.create_sync_objects()
@@ -644,6 +1481,14 @@ class EntityManager(object):
 		return _entities
 
 	def add_renderer(self, renderer):
+		if self.executor is not None:
+			renderer.recorder = SecondaryRecorder(
+				self.dk,
+				renderer.buffer_count,
+				self.executor,
+				self.record_threads
+			)
+
 		self.renderers.insert(0, renderer)
 
 
@@ -671,18 +1516,7 @@ class EntityManager(object):
 		image_to_buffer(self.dk, img, buff.buffer, region)
 
 		dst = (c_ubyte * size)()
-		src = vk.c_void_p(0)
-
-		self.dk.MapMemory(
-			self.dk.device,
-			buff.memory,
-			0,
-			buff.mem_req.size,
-			0,
-			byref(src)
-		)
-		memmove(dst, src, size)
-		self.dk.UnmapMemory(self.dk.device, buff.memory)
+		memmove(dst, buff.mapped, size)
 
 		buff.cleanup()
 
@@ -697,11 +1531,22 @@ class EntityManager(object):
 		for r in self.renderers:
 			r.cleanup()
 
+		if self.executor is not None:
+			self.executor.shutdown()
+
+		self.render_list.instances.cleanup()
+		if self.render_list.commands is not None:
+			self.render_list.commands.cleanup()
+
 		for i in range(0, MAX_FRAMES_IN_FLIGHT):
 			self.dk.DestroySemaphore(self.dk.device, self.image_available[i], None)
 			self.dk.DestroySemaphore(self.dk.device, self.renders_finished[i], None)
 			self.dk.DestroyFence(self.dk.device, self.in_flight_fences[i], None)
 
+		for ent in self.removed:
+			ent.cleanup()
+		self.removed = []
+
 		cleanup_entities()
 
 	def deselect(self):
@@ -737,6 +1582,10 @@ class EntityManager(object):
 	def side_effect(self, asset, old, new):
 		global _entities
 
+		# Entities refilling their descriptors give their sets back to be
+		# rewritten, so nothing in flight may still bind them
+		self.wait_in_flight()
+
 		if asset == 'mesh':
 			for name, ent in _entities.items():
 				if hasattr(ent, asset) and getattr(ent, asset) == old:
@@ -755,6 +1604,8 @@ class EntityManager(object):
 					new_textures[old_index] = new
 					ent.fill_descriptor(ent.pipeline, new_textures)
 
+		self.refresh()
+
 	def uses_mesh(self, name):
 		global _entities
 
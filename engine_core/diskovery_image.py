@@ -4,7 +4,6 @@ import vk
 import math
 import pygame
 from ctypes import *
-from diskovery_buffer import Buffer
 
 class Image(object):
 	def create_image(self, extent, mip, samp, form, use, props):
@@ -27,21 +26,16 @@ class Image(object):
 		mem_req = vk.MemoryRequirements()
 		self.dk.GetImageMemoryRequirements(self.dk.device, self.image, byref(mem_req))
 
-		mem_alloc_info = vk.MemoryAllocateInfo(
-			s_type=vk.STRUCTURE_TYPE_MEMORY_ALLOCATE_INFO,
-			next=None,
-			allocation_size=mem_req.size,
-			memory_type_index=self.dk.get_memory_type(
-				mem_req.memory_type_bits,
-				props
-			)
-		)
-
-		self.dk.AllocateMemory(self.dk.device, byref(mem_alloc_info), None, byref(self.memory))
-		self.dk.BindImageMemory(self.dk.device, self.image, self.memory, 0)
+		# Optimally tiled images are kept apart from buffers by the allocator
+		self.allocation = self.dk.allocator.allocate(mem_req, props, linear=False)
+		self.memory = self.allocation.memory
+		self.dk.BindImageMemory(self.dk.device, self.image, self.memory, self.allocation.offset)
 
 	def set_layout(self, image, form, old, new, mip):
-		cmd = self.dk.start_command()
+		with self.dk.uploads as batch:
+			self._record_layout(batch.begin(), image, form, old, new, mip)
+
+	def _record_layout(self, cmd, image, form, old, new, mip):
 
 		if new == vk.IMAGE_LAYOUT_DEPTH_STENCIL_ATTACHMENT_OPTIMAL:
 			aspect_mask = vk.IMAGE_ASPECT_DEPTH_BIT
@@ -114,8 +108,6 @@ class Image(object):
 			byref(barrier)
 		)
 
-		self.dk.end_command(cmd)
-
 		self.access_mask = dst_access_mask
 		self.stage = dst_stage
 
@@ -213,8 +205,10 @@ class Image(object):
 		self.image = vk.Image(0)
 		# The Vulkan image view (VkImageView) that will allow acces to the image
 		self.image_view = vk.ImageView(0)
-		# The allocated memory (VkDeviceMemory) that will store the image
+		# The block of memory (VkDeviceMemory) that will store the image
 		self.memory = vk.DeviceMemory(0)
+		# The range of that block given to this image (Allocation)
+		self.allocation = None
 
 		self.create_image(extent, mip, samp, form, use, props)
 		# Newly created images have an undefined layout. This method
@@ -224,9 +218,12 @@ class Image(object):
 		self.create_image_view(form, aspects, mip)
 
 	def cleanup(self):
+		# A recorded transfer may still refer to this image
+		self.dk.uploads.flush()
+
 		self.dk.DestroyImageView(self.dk.device, self.image_view, None)
 		self.dk.DestroyImage(self.dk.device, self.image, None)
-		self.dk.FreeMemory(self.dk.device, self.memory, None)
+		self.dk.allocator.free(self.allocation)
 
 def make_texture_sampler(dk, mip):
 	sampler = vk.Sampler(0)
@@ -253,9 +250,7 @@ def make_texture_sampler(dk, mip):
 	dk.CreateSampler(dk.device, byref(create_info), None, byref(sampler))
 	return sampler
 
-def buffer_to_image(dk, buff, image, width, height):
-	cmd = dk.start_command()
-
+def buffer_to_image(dk, buff, image, width, height, offset=0):
 	sub = vk.ImageSubresourceLayers(
 		aspect_mask=vk.IMAGE_ASPECT_COLOR_BIT,
 		mip_level=0,
@@ -264,21 +259,21 @@ def buffer_to_image(dk, buff, image, width, height):
 	)
 
 	region = vk.BufferImageCopy(
+		buffer_offset=offset,
 		image_subresource=sub,
 		image_offset=vk.Offset3D(0, 0, 0),
 		image_extent=vk.Extent3D(width, height, 1)
 	)
 
-	dk.CmdCopyBufferToImage(
-		cmd,
-		buff,
-		image,
-		vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
-		1,
-		byref(region)
-	)
-
-	dk.end_command(cmd)
+	with dk.uploads as batch:
+		dk.CmdCopyBufferToImage(
+			batch.begin(),
+			buff,
+			image,
+			vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+			1,
+			byref(region)
+		)
 
 def image_to_buffer(dk, image, buff, region):
 	cmd = dk.start_command()
@@ -294,13 +289,29 @@ def image_to_buffer(dk, image, buff, region):
 
 	dk.end_command(cmd)
 
+def decode_image(filename):
+	"""
+	Reads an image file into tightly packed RGBA bytes. This only touches
+	the CPU, so it is safe to call from a worker thread.
+
+	:returns: A tuple of the width, height and pixel data of the image
+	"""
+	img = pygame.image.load(filename)
+	return (img.get_width(), img.get_height(), pygame.image.tostring(img, 'RGBA'))
+
+#: Pixels used for textures that are still loading, a single white texel
+PLACEHOLDER_PIXELS = (1, 1, b'\xff\xff\xff\xff')
+
 class Texture(Image):
 
 	def _generate_mipmaps(self, wid, hei, mip):
 		props = vk.FormatProperties()
 		self.dk.GetPhysicalDeviceFormatProperties(self.dk.gpu, vk.FORMAT_R8G8B8A8_UNORM, byref(props))
 
-		cmd = self.dk.start_command()
+		with self.dk.uploads as batch:
+			self._record_mipmaps(batch.begin(), wid, hei, mip)
+
+	def _record_mipmaps(self, cmd, wid, hei, mip):
 
 		sub = vk.ImageSubresourceRange(
 			aspect_mask=vk.IMAGE_ASPECT_COLOR_BIT,
@@ -414,54 +425,45 @@ class Texture(Image):
 			1, byref(barrier)
 		)
 
-		self.dk.end_command(cmd)
-
-	def __init__(self, dk, filename):
+	def __init__(self, dk, filename, pixels=None):
 		self.dk = dk
-		img = pygame.image.load(filename).convert_alpha()
 
-		extent = vk.Extent2D(width=img.get_width(), height=img.get_height())
-		size = extent.width * extent.height * 4
+		if pixels is None:
+			pixels = decode_image(filename)
+
+		width, height, data = pixels
 
-		arr = pygame.PixelArray(img)
+		extent = vk.Extent2D(width=width, height=height)
+		size = extent.width * extent.height * 4
 
 		self.mip = int(math.floor(math.log2(max(extent.width, extent.height))) + 1)
 
-		data = (c_ubyte*size)()
-
-		for i in range(0, extent.height):
-			for j in range(0, extent.width):
-				channels = img.unmap_rgb(arr[j, i])
-				ind = i * extent.width * 4 + j * 4
-				data[ind] = channels[0]
-				data[ind + 1] = channels[1]
-				data[ind + 2] = channels[2]
-				data[ind + 3] = channels[3]
-
-		Image.__init__(
-			self,
-			dk,
-			extent,
-			vk.FORMAT_R8G8B8A8_UNORM,
-			self.mip,
-			vk.SAMPLE_COUNT_1_BIT,
-			vk.IMAGE_USAGE_TRANSFER_SRC_BIT |
-			vk.IMAGE_USAGE_TRANSFER_DST_BIT |
-			vk.IMAGE_USAGE_SAMPLED_BIT,
-			vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT,
-			vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
-			vk.IMAGE_ASPECT_COLOR_BIT
-		)
+		# The layout change, copy and mipmap blits are submitted together
+		with dk.uploads as batch:
+			Image.__init__(
+				self,
+				dk,
+				extent,
+				vk.FORMAT_R8G8B8A8_UNORM,
+				self.mip,
+				vk.SAMPLE_COUNT_1_BIT,
+				vk.IMAGE_USAGE_TRANSFER_SRC_BIT |
+				vk.IMAGE_USAGE_TRANSFER_DST_BIT |
+				vk.IMAGE_USAGE_SAMPLED_BIT,
+				vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT,
+				vk.IMAGE_LAYOUT_TRANSFER_DST_OPTIMAL,
+				vk.IMAGE_ASPECT_COLOR_BIT
+			)
 
-		staging_buffer = Buffer(dk, size, data)
-		buffer_to_image(
-			dk,
-			staging_buffer.buffer,
-			self.image,
-			extent.width,
-			extent.height
-		)
-		staging_buffer.cleanup()
+			staging, offset = batch.stage(data, size)
+			buffer_to_image(
+				dk,
+				staging,
+				self.image,
+				extent.width,
+				extent.height,
+				offset
+			)
 
-		self.filename = filename
-		self._generate_mipmaps(extent.width, extent.height, self.mip)
+			self.filename = filename
+			self._generate_mipmaps(extent.width, extent.height, self.mip)
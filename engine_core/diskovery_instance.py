@@ -1,9 +1,11 @@
 #!/bin/env/python
 
 import vk, pygame, platform
+import diskovery_pipeline_cache
 from ctypes import *
 from itertools import chain
 from diskovery_image import make_texture_sampler
+from diskovery_buffer import UploadBatch, MemoryAllocator, UniformArena, GeometryArena
 from diskovery_entity_manager import Renderer
 from diskovery_window import Window
 
@@ -149,9 +151,16 @@ class DkInstance(object):
 			layers = (b'VK_LAYER_LUNARG_standard_validation',)
 			_layers = cast((c_char_p*1)(*layers), POINTER(c_char_p))
 
+		# Indirect draws are only merged and offset when the device allows it
+		supported = vk.PhysicalDeviceFeatures()
+		self.GetPhysicalDeviceFeatures(self.gpu, byref(supported))
+
 		features = vk.PhysicalDeviceFeatures(
-			sampler_anisotropy=vk.TRUE
+			sampler_anisotropy=vk.TRUE,
+			multi_draw_indirect=supported.multi_draw_indirect,
+			draw_indirect_first_instance=supported.draw_indirect_first_instance
 		)
+		self.features = features
 
 		create_info = vk.DeviceCreateInfo(
 			s_type=vk.STRUCTURE_TYPE_DEVICE_CREATE_INFO,
@@ -328,15 +337,42 @@ class DkInstance(object):
 			self.sc_image_views[index] = view
 
 	def create_pipeline_cache(self):
+		# Pipelines built by an earlier run are handed back to the driver
+		props = vk.PhysicalDeviceProperties(0)
+		self.GetPhysicalDeviceProperties(self.gpu, byref(props))
+
+		data = diskovery_pipeline_cache.load(props)
+		initial = None if data is None else create_string_buffer(data, len(data))
+
 		create_info = vk.PipelineCacheCreateInfo(
 			s_type=vk.STRUCTURE_TYPE_PIPELINE_CACHE_CREATE_INFO,
 			next=None,
 			flags=0,
-			initial_data_size=0,
-			initial_data=None
+			initial_data_size=0 if data is None else len(data),
+			initial_data=None if initial is None else cast(initial, c_void_p)
 		)
 
 		assert(self.CreatePipelineCache(self.device, byref(create_info), None, byref(self.pipeline_cache)) == vk.SUCCESS)
+		self.pipeline_stats['cache_loaded'] = 0 if data is None else len(data)
+
+	def save_pipeline_cache(self):
+		"""
+		Writes the contents of the VkPipelineCache_ to disk through
+		:mod:`diskovery_pipeline_cache`, so the next run can skip
+		compiling the same pipelines again
+		"""
+		size = c_size_t(0)
+		if self.GetPipelineCacheData(self.device, self.pipeline_cache, byref(size), None) != vk.SUCCESS or size.value == 0:
+			return
+
+		data = create_string_buffer(size.value)
+		if self.GetPipelineCacheData(self.device, self.pipeline_cache, byref(size), data) != vk.SUCCESS:
+			return
+
+		props = vk.PhysicalDeviceProperties(0)
+		self.GetPhysicalDeviceProperties(self.gpu, byref(props))
+
+		diskovery_pipeline_cache.store(props, data.raw[:size.value])
 
 	def create_pool(self):
 		create_info = vk.CommandPoolCreateInfo(
@@ -398,8 +434,21 @@ class DkInstance(object):
 		self.sc_image_views = None
 		# A Vulkan data structure to hold all the necessary pipelines
 		self.pipeline_cache = vk.PipelineCache(0)
+		# The number of pipelines created, the seconds spent creating them
+		# and the bytes of pipeline cache data loaded from the last run
+		self.pipeline_stats = {'pipelines': 0, 'create_time': 0.0, 'cache_loaded': 0}
 		# The pool that will store buffers containing draw calls (VkCommandPool)
 		self.pool = vk.CommandPool(0)
+		# Hands out device memory for buffers and images (MemoryAllocator)
+		self.allocator = None
+		# Records buffer and image transfers to be submitted together (UploadBatch)
+		self.uploads = None
+		# Shared, mapped buffers holding every entity's uniforms (UniformArena)
+		self.uniform_arena = None
+		# Shared buffers holding the vertices and indices of every mesh (GeometryArena)
+		self.geometry = None
+		# The optional features enabled on the device (VkPhysicalDeviceFeatures)
+		self.features = None
 		# The color format to be used across all renderers (VkFormat)
 		self.color_format = None
 		# The depth format to be used across all renderers (VkFormat)
@@ -423,14 +472,22 @@ class DkInstance(object):
 		self.depth_format = self._find_depth_format()
 		self.create_device(debug)
 		self.fill_queues()
+		self.allocator = MemoryAllocator(self)
 		self.create_pipeline_cache()
 
 		self.create_swap_chain()
 		self.create_sc_views()
 		self.create_pool()
+		self.uploads = UploadBatch(self)
+		self.uniform_arena = UniformArena(self)
+		self.geometry = GeometryArena(self)
 
 	def cleanup(self):
 
+		self.uploads.cleanup()
+		self.uniform_arena.cleanup()
+		self.geometry.cleanup()
+		self.allocator.cleanup()
 		self.cleanup_swap_chain()
 
 		for s in self.samplers.values():
@@ -476,6 +533,9 @@ class DkInstance(object):
 		return None
 
 	def start_command(self):
+		# Pending uploads have to land before anything recorded here runs
+		self.uploads.flush()
+
 		b_allocate_info = vk.CommandBufferAllocateInfo(
 			s_type=vk.STRUCTURE_TYPE_COMMAND_BUFFER_ALLOCATE_INFO,
 			level=vk.COMMAND_BUFFER_LEVEL_PRIMARY,
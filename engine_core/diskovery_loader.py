@@ -0,0 +1,110 @@
+#!/bin/env/python
+
+"""
+The :mod:`diskovery_loader` module loads assets in the background. The
+slow CPU side of loading an asset (parsing a model, decoding an image)
+runs on a pool of worker threads, while everything that talks to Vulkan
+stays on the render thread:
+
+1. :meth:`AssetLoader.submit` runs the CPU work on a worker thread
+2. When it finishes, its result is queued along with an upload function
+3. :meth:`AssetLoader.upload`, called once per frame by :func:`diskovery.run`,
+   runs the upload functions of every finished job (creating buffers and
+   images) and resolves the job's future with the uploaded asset
+
+A job that fails, in either step, resolves its future with the exception
+and prints it. The remaining jobs keep loading, so one missing or broken
+file never stops the game loop.
+
+The :mod:`diskovery` module uses this to register placeholder assets that
+entities can refer to while the real ones are still loading.
+"""
+
+import os
+import time
+import queue
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+
+class AssetLoader(object):
+	"""
+	A worker pool plus the queue of finished jobs waiting to be uploaded
+
+	:param workers: Number of worker threads, defaults to the number of CPUs (up to 4)
+	"""
+	def __init__(self, workers=None):
+		if workers is None:
+			workers = min(4, os.cpu_count() or 1)
+
+		self.pool = ThreadPoolExecutor(max_workers=workers)
+		self.finished = queue.Queue()
+
+		# Only touched from the render thread
+		self.pending = 0
+
+	def submit(self, work, upload, *args):
+		"""
+		Calls ``work(*args)`` on a worker thread. Once it is done,
+		``upload`` is called with its result on the render thread during
+		the next :meth:`upload`.
+
+		:returns: A Future that resolves to the return value of ``upload``
+		"""
+		future = Future()
+		job = self.pool.submit(work, *args)
+		job.add_done_callback(lambda j: self.finished.put((j, upload, future)))
+
+		self.pending += 1
+		return future
+
+	def _finish(self, item):
+		job, upload, future = item
+		self.pending -= 1
+
+		try:
+			future.set_result(upload(job.result()))
+		except Exception as e:
+			future.set_exception(e)
+			print("DisKovery: unable to load asset: {}".format(e))
+			traceback.print_exception(type(e), e, e.__traceback__)
+
+	def ready(self):
+		"""
+		Whether any finished job is waiting for :meth:`upload`
+		"""
+		return not self.finished.empty()
+
+	def upload(self, budget=None):
+		"""
+		Runs the upload step of finished jobs on the calling thread.
+
+		:param budget: Optional number of seconds after which remaining jobs are left for the next call
+		:returns: The number of jobs uploaded
+		"""
+		start = time.perf_counter()
+		count = 0
+
+		while budget is None or time.perf_counter() - start < budget:
+			try:
+				item = self.finished.get_nowait()
+			except queue.Empty:
+				break
+
+			self._finish(item)
+			count += 1
+
+		return count
+
+	def wait(self):
+		"""
+		Blocks until every submitted job has been uploaded
+		"""
+		count = 0
+		while self.pending > 0:
+			self._finish(self.finished.get())
+			count += 1
+
+		return count
+
+	def shutdown(self):
+		self.pool.shutdown(wait=False)
@@ -3,12 +3,14 @@
 import vk
 import sys
 import glm
-import xml.etree.ElementTree as xml
+import numpy as np
 from enum import Enum
 from ctypes import *
-from diskovery_buffer import Buffer
+import diskovery_collada as collada
+import diskovery_mesh_cache as mesh_cache
+from diskovery_buffer import INSTANCE_WIDTH
 from diskovery_entity_manager import EntityManager
-from diskovery_ubos import JointData, get_matrix_data
+from diskovery_ubos import JointData
 
 def bindings():
 	b = (vk.VertexInputBindingDescription*1)()
@@ -67,6 +69,41 @@ def animated_attributes():
 
 	return a
 
+#: The first location of the per-instance attributes, after the ones an
+#: animated vertex uses. Shaders with an input at or past it read their
+#: per-draw values from the :class:`~diskovery_buffer.InstanceBuffer`
+INSTANCE_LOCATION = 6
+
+def instance_bindings():
+	b = (vk.VertexInputBindingDescription*2)(*bindings())
+
+	# Binding 1 advances once per instance rather than once per vertex,
+	# see diskovery_buffer.InstanceBuffer
+	b[1].binding = 1
+	b[1].stride = sizeof(c_float) * INSTANCE_WIDTH
+	b[1].input_rate = vk.VERTEX_INPUT_RATE_INSTANCE
+
+	return b
+
+def instance_attributes(animated=False):
+	vertex = animated_attributes() if animated else attributes()
+	start = len(vertex)
+	a = (vk.VertexInputAttributeDescription*(start + 7))(*vertex)
+
+	# (location = 6 to 12): One vec4 per four floats of the instance's row,
+	# see diskovery_ubos.DrawData
+	# 6 to 9 - the columns of the model matrix
+	# 10 - Tint (an RGBA color the default fragment stage multiplies its output by)
+	# 11 - Color (the entity's color in the editor's picking attachment)
+	# 12 - x: lit, y: selected, z: texture subdivisions
+	for i in range(0, 7):
+		a[start + i].binding = 1
+		a[start + i].location = INSTANCE_LOCATION + i
+		a[start + i].format = vk.FORMAT_R32G32B32A32_SFLOAT
+		a[start + i].offset = sizeof(c_float) * 4 * i
+
+	return a
+
 
 
 class ParseType(Enum):
@@ -75,6 +112,57 @@ class ParseType(Enum):
 	DAE_RIGGED_MODEL = 2
 	DAE_RIG = 3
 	DAE_ANIMATIONS = 4
+	PACKED_OBJ_MODEL = 5
+
+def _bulk_floats(lines, width):
+	"""
+	Converts a list of whitespace separated number strings (the contents
+	of every ``v``, ``vt`` or ``vn`` line, prefix removed) into a
+	``float64`` array of shape ``(len(lines), width)`` in a single pass.
+	Trailing components beyond ``width`` (such as the optional ``w`` of
+	a texture coordinate) are dropped, mirroring :meth:`Parser.load_obj`.
+	"""
+	if len(lines) == 0:
+		return np.zeros((0, width))
+
+	values = np.array(' '.join(lines).split(), dtype=np.float64)
+	per_line = len(lines[0].split())
+
+	if per_line >= width and len(values) == per_line * len(lines):
+		return values.reshape(-1, per_line)[:, :width]
+
+	# Lines do not share a component count, so fall back to trimming each one
+	return np.array([l.split()[:width] for l in lines], dtype=np.float64)
+
+def deduplicate(corners):
+	"""
+	Assigns one output vertex to every distinct face corner. Each corner
+	is a hashable key, normally a (position, texture, normal) index triple,
+	and is looked up in a dictionary, so every corner costs amortised O(1)
+	no matter how many corners share the same position.
+
+	Corners given as a ``numpy`` array of integer keys are deduplicated by
+	sorting instead, without a Python loop over the corners, and the
+	results are arrays rather than lists.
+
+	:param corners: An iterable of hashable corner keys, in face order
+	:returns: A tuple of the list of unique keys, in order of first use,
+		and the list of indices into that list for every corner given
+	"""
+	if isinstance(corners, np.ndarray) and np.issubdtype(corners.dtype, np.integer):
+		unique, first, inverse = np.unique(corners,
+			return_index=True, return_inverse=True)
+
+		# np.unique sorts the keys, but vertices are kept in order of
+		# first use, as the dictionary below keeps them
+		order = np.argsort(first, kind='stable')
+		rank = np.empty_like(order)
+		rank[order] = np.arange(len(order))
+		return (unique[order], rank[inverse.reshape(-1)])
+
+	lookup = { }
+	indices = [lookup.setdefault(key, len(lookup)) for key in corners]
+	return (list(lookup), indices)
 
 class Parser(object):
 
@@ -84,10 +172,7 @@ class Parser(object):
 		normals = []
 		textures = []
 
-		new_norm = None
-		new_tex = None
-
-		vertex_loader_list = []
+		positions = []
 		input_list = []
 		vertex_list = []
 		index_list = []
@@ -100,13 +185,10 @@ class Parser(object):
 					continue
 
 				if line[:2] == 'v ':
-					vertex_loader_list.append(VertexLoader(
-						len(vertex_loader_list),
-						(c_float * 3)(
-							float(contents[1]),
-							float(contents[2]),
-							float(contents[3])
-						)
+					positions.append((
+						float(contents[1]),
+						float(contents[2]),
+						float(contents[3])
 					))
 				elif line[:3] == 'vt ':
 					textures.append((float(contents[1]), 1 - float(contents[2])))
@@ -135,92 +217,98 @@ class Parser(object):
 						for value in contents[4].split('/'):
 							input_list.append(int(value) - 1)
 
-		for i in range(0, int(len(input_list)/3)):
-			pos_ind = int(input_list[i * 3])
-			tex_ind = int(input_list[i * 3 + 1])
-			norm_ind = int(input_list[i * 3 + 2])
-
-			vert = vertex_loader_list[pos_ind]
-			if vert.norm_ind == None:
-				vert.tex_ind = tex_ind
-				vert.norm_ind = norm_ind
-				index_list.append(pos_ind)
-			else:
-				self.duplicate_handler(vertex_loader_list, index_list, vert, tex_ind, norm_ind, False)
-
-		for vert in vertex_loader_list:
-			if vert.norm_ind == None:
-				vert.norm_ind = 0
-				vert.tex_ind = 0
+		corners, index_list = deduplicate(zip(
+			input_list[0::3],
+			input_list[1::3],
+			input_list[2::3]
+		))
 
+		for pos_ind, tex_ind, norm_ind in corners:
 			v = Vertex()
-			v.position = vert.position
-			v.tex_coord = textures[vert.tex_ind]
-			v.normal = normals[vert.norm_ind]
+			v.position = positions[pos_ind]
+			v.tex_coord = textures[tex_ind]
+			v.normal = normals[norm_ind]
 
 			vertex_list.append(v)
 
 		return (vertex_list, index_list)
 
-	# DAE Model Parsing #
-	def get_child_with_attribute(self, node, tag, attribute, value):
-		for child in node:
-			if child.tag == tag and child.attrib[attribute] == value:
-				return child
-
-	def fill_from_source(self, parent, src_id, lis, dim, correction):
-		src_data_loc = self.get_child_with_attribute(
-			parent,
-			'source',
-			'id',
-			src_id
-		).find('float_array')
-
-		count = int(src_data_loc.attrib['count'])
-		src_data = [x for x in src_data_loc.text.split(' ') if x != '']
-
-		for i in range(0, int(count/dim)):
-			x = float(src_data[i * dim])
-			y = float(src_data[i * dim + 1])
-
-			if dim == 3:
-				z = float(src_data[i * dim + 2])
-				vec = glm.vec4(x, y, z, 1.0)
-
-				if correction:
-					corr = glm.rotate(glm.mat4(1.0), glm.radians(90), glm.vec3(1, 0, 0))
-				else:
-					corr = glm.mat4(1.0)
-				vec = corr * vec
-
-				lis.append((c_float*3)(vec.x, vec.y, vec.z))
-
-			elif dim == 2:
-				lis.append((c_float*2)(x, 1 - y))
-
-	def duplicate_handler(self, vll, il, vert, tex_ind, norm_ind, rig):
-		if vert.norm_ind == norm_ind and vert.tex_ind == tex_ind:
-			il.append(vert.index)
-			return
-		else:
-			if vert.duplicate == None:
-				vert.duplicate = VertexLoader(len(vll), vert.position)
-				vert.duplicate.tex_ind = tex_ind
-				vert.duplicate.norm_ind = norm_ind
-				if rig:
-					vert.duplicate.joints = vert.joints
-					vert.duplicate.weights = vert.weights
-
-				vll.append(vert.duplicate)
-				il.append(vert.duplicate.index)
-				return
-			else:
-				self.duplicate_handler(vll, il, vert.duplicate, tex_ind, norm_ind, rig)
+	def load_obj_packed(self, file):
+		"""
+		Loads the same data as :meth:`Parser.load_obj`, but returns a
+		structured ``numpy`` array of vertices laid out exactly like
+		:class:`Vertex` and a ``uint32`` array of indices, so the result
+		can be handed to a :class:`~diskovery_buffer.Buffer` without
+		building a Python object per vertex.
+
+		Lines are only sorted by their prefix in Python; every group of
+		numbers is then tokenized by ``numpy`` in one call.
+		"""
+		positions = []
+		textures = []
+		normals = []
+		triangles = []
+		quads = []
+
+		with open(file, 'r') as f:
+			for line in f.read().split('\n'):
+				prefix = line[:3]
+
+				if prefix == 'vt ':
+					textures.append(line[3:])
+				elif prefix == 'vn ':
+					normals.append(line[3:])
+				elif prefix[:2] == 'v ':
+					positions.append(line[2:])
+				elif prefix[:2] == 'f ':
+					corner_count = len(line[2:].split())
+					if corner_count == 3:
+						triangles.append(line[2:])
+					elif corner_count == 4:
+						quads.append(line[2:])
+
+		positions = _bulk_floats(positions, 3)
+		textures = _bulk_floats(textures, 2)
+		normals = _bulk_floats(normals, 3)
+		textures[:, 1] = 1 - textures[:, 1]
+
+		# Each face corner is a (position, texture, normal) index triple
+		tri_corners = np.array(
+			' '.join(triangles).replace('/', ' ').split(),
+			dtype=np.int64
+		).reshape(-1, 3) - 1
+
+		quad_corners = np.array(
+			' '.join(quads).replace('/', ' ').split(),
+			dtype=np.int64
+		).reshape(-1, 4, 3) - 1
+
+		# Quads are split into the same two triangles load_obj produces
+		quad_corners = quad_corners[:, (0, 1, 3, 1, 2, 3)].reshape(-1, 3)
+		corners = np.concatenate((tri_corners, quad_corners))
+
+		# Fold every triple into one integer, so the corners are
+		# deduplicated as an array
+		tex_count = max(len(textures), 1)
+		norm_count = max(len(normals), 1)
+		keys = (corners[:, 0] * tex_count + corners[:, 1]) * norm_count + corners[:, 2]
+
+		unique, indices = deduplicate(keys)
+
+		vertices = np.zeros(len(unique), dtype=vertex_dtype)
+		vertices['position'] = positions[unique // (tex_count * norm_count)]
+		vertices['tex_coord'] = textures[(unique // norm_count) % tex_count]
+		vertices['normal'] = normals[unique % norm_count]
+
+		indices = indices.astype(np.uint32)
+
+		return (vertices, indices)
 
+	# DAE Model Parsing #
 	def load_dae(self, file, correction, rigged=False):
 
 		MAX_JOINTS = 3
-		root = xml.parse(file).getroot()
+		doc = collada.document(file)
 
 		if correction:
 			corr = glm.rotate(glm.mat4(1.0), glm.radians(90), glm.vec3(1, 0, 0))
@@ -228,147 +316,71 @@ class Parser(object):
 			corr = glm.mat4(1.0)
 
 		if rigged:
-			skin = root.find('library_controllers').find('controller').find('skin')
-
-			joints_id = self.get_child_with_attribute(
-				skin.find('vertex_weights'),
-				'input',
-				'semantic',
-				'JOINT'
-			).attrib['source'][1:]
-			joints_loc = self.get_child_with_attribute(
-				skin,
-				'source',
-				'id',
-				joints_id
-			).find('Name_array')
-			joint_list = [x for x in ' '.join(joints_loc.text.split('\n')).split(' ') if x != '']
-
-			weights_id = self.get_child_with_attribute(
-				skin.find('vertex_weights'),
-				'input',
-				'semantic',
-				'WEIGHT'
-			).attrib['source'][1:]
-			weights_loc = self.get_child_with_attribute(
-				skin,
-				'source',
-				'id',
-				weights_id
-			).find('float_array')
-
-			formatted_weights = ' '.join(weights_loc.text.split('\n'))
-			weights = [float(x) for x in formatted_weights.split(' ') if x != '']
-
-			joint_counts_loc = skin.find('vertex_weights').find('vcount')
-			joint_counts = [int(x) for x in joint_counts_loc.text.split(' ') if x != '']
+			skin_data = doc.skin
+			joint_list = list(skin_data['joints'])
+			weights = skin_data['weights'].tolist()
+			v_data = skin_data['v'].tolist()
 
 			p = 0
 			skin_values = []
-			skin_data = skin.find('vertex_weights').find('v').text.split(' ')
 
-			for count in joint_counts:
+			for count in skin_data['vcount'].tolist():
 				skin = VertexSkin()
 				for i in range(0, count):
-					joint = skin_data[p]
-					weight = weights[int(skin_data[p + 1])]
+					joint = v_data[p]
+					weight = weights[v_data[p + 1]]
 					p += 2
-					skin.add_effect(int(joint), float(weight))
+					skin.add_effect(joint, weight)
 				skin.scale(MAX_JOINTS)
 				skin_values.append(skin)
 
-		normals = []
-		textures = []
-
-		vertex_loader_list = []
-		vertex_list = []
-		index_list = []
-
-		mesh = root.find('library_geometries').find('geometry').find('mesh')
-
-		pos_id = mesh.find('vertices').find('input').attrib['source'][1:]
-		pos_data_loc = self.get_child_with_attribute(
-			mesh,
-			'source',
-			'id',
-			pos_id
-		).find('float_array')
+		geometry = doc.geometry
+		pos_data = geometry['positions'].tolist()
+		norm_data = geometry['normals'].tolist()
+		tex_data = geometry['texcoords'].tolist()
 
-		count = int(pos_data_loc.attrib['count'])
-		pos_data = [x for x in ' '.join(pos_data_loc.text.split('\n')).split(' ') if x != '']
-
-		for i in range(0, int(count/3)):
-			x = float(pos_data[i * 3])
-			y = float(pos_data[i * 3 + 1])
-			z = float(pos_data[i * 3 + 2])
-			vec = glm.vec4(x, y, z, 1.0)
-
-			if correction:
-				corr = glm.rotate(glm.mat4(1.0), glm.radians(90), glm.vec3(1, 0, 0))
-			else:
-				corr = glm.mat4(1.0)
-			vec = corr * vec
+		positions = []
+		for i in range(0, len(pos_data) // 3):
+			vec = corr * glm.vec4(pos_data[i*3], pos_data[i*3 + 1], pos_data[i*3 + 2], 1.0)
+			positions.append((c_float*3)(vec.x, vec.y, vec.z))
 
-			if rigged:
-				v = VertexLoader(
-					len(vertex_loader_list),
-					(c_float*3)(vec.x, vec.y, vec.z),
-					(c_float*MAX_JOINTS)(*skin_values[len(vertex_loader_list)].joints),
-					(c_float*MAX_JOINTS)(*skin_values[len(vertex_loader_list)].weights)
-				)
-			else:
-				v = VertexLoader(len(vertex_loader_list), (c_float*3)(vec.x, vec.y, vec.z))
-			vertex_loader_list.append(v)
-
-		norm_id = self.get_child_with_attribute(
-			mesh.find('polylist'),
-			'input',
-			'semantic',
-			'NORMAL'
-		).attrib['source'][1:]
-		self.fill_from_source(mesh, norm_id, normals, 3, correction)
-
-		tex_id = self.get_child_with_attribute(
-			mesh.find('polylist'),
-			'input',
-			'semantic',
-			'TEXCOORD'
-		).attrib['source'][1:]
-		self.fill_from_source(mesh, tex_id, textures, 2, correction)
-
-		poly = mesh.find('polylist')
-		type_count = len(poly.findall('input'))
-		full_data = [x for x in poly.find('p').text.split(' ') if x != '']
-
-		new_norm = ((c_float*3)*int(len(full_data)/type_count))()
-		new_tex = ((c_float*2)*int(len(full_data)/type_count))()
-
-		for i in range(0, int(len(full_data)/type_count)):
-			pos_ind = int(full_data[i * type_count])
-			norm_ind = int(full_data[i * type_count + 1])
-			tex_ind = int(full_data[i * type_count + 2])
-
-			vert = vertex_loader_list[pos_ind]
-			if vert.norm_ind == None:
-				vert.tex_ind = tex_ind
-				vert.norm_ind = norm_ind
-				index_list.append(pos_ind)
-			else:
-				self.duplicate_handler(vertex_loader_list, index_list, vert, tex_ind, norm_ind, rigged)
+		normals = []
+		for i in range(0, len(norm_data) // 3):
+			vec = corr * glm.vec4(norm_data[i*3], norm_data[i*3 + 1], norm_data[i*3 + 2], 1.0)
+			normals.append((c_float*3)(vec.x, vec.y, vec.z))
 
-		for vert in vertex_loader_list:
-			if vert.norm_ind == None:
-				vert.norm_ind = 0
-				vert.tex_ind = 0
+		textures = []
+		for i in range(0, len(tex_data) // 2):
+			textures.append((c_float*2)(tex_data[i*2], 1 - tex_data[i*2 + 1]))
+
+		full_data = geometry['p']
+		type_count = geometry['inputs']
+		offsets = geometry['offsets']
+
+		# Folded into one integer per corner, as in load_obj_packed
+		tex_count = max(len(textures), 1)
+		norm_count = max(len(normals), 1)
+		keys = (full_data[offsets['VERTEX']::type_count] * tex_count +
+			full_data[offsets['TEXCOORD']::type_count]) * norm_count + \
+			full_data[offsets['NORMAL']::type_count]
+
+		unique, index_list = deduplicate(keys)
+		corners = zip(
+			(unique // (tex_count * norm_count)).tolist(),
+			((unique // norm_count) % tex_count).tolist(),
+			(unique % norm_count).tolist()
+		)
 
+		vertex_list = []
+		for pos_ind, tex_ind, norm_ind in corners:
 			v = Vertex()
-			v.position = vert.position
-			v.tex_coord = textures[vert.tex_ind]
-			v.normal = normals[vert.norm_ind]
+			v.position = positions[pos_ind]
+			v.tex_coord = textures[tex_ind]
+			v.normal = normals[norm_ind]
 
 			if rigged:
-				v.joint_ids = vert.joints
-				v.weights = vert.weights
+				v.joint_ids = (c_float*MAX_JOINTS)(*skin_values[pos_ind].joints)
+				v.weights = (c_float*MAX_JOINTS)(*skin_values[pos_ind].weights)
 
 			vertex_list.append(v)
 
@@ -382,7 +394,7 @@ class Parser(object):
 		name_id = node.attrib['id']
 		index = joints.index(name_id)
 
-		matrix_data = [float(x) for x in node.find('matrix').text.split(' ')]
+		matrix_data = [float(x) for x in node.find('matrix').text.split()]
 
 		matrix = glm.mat4(matrix_data)
 		matrix = glm.transpose(matrix)
@@ -402,65 +414,25 @@ class Parser(object):
 		return j
 
 	def load_rig(self, file, joints, correction):
-		root = xml.parse(file).getroot()
-
-		rig = self.get_child_with_attribute(
-				root.find('library_visual_scenes').find('visual_scene'),
-				'node',
-				'id',
-				'Armature'
-			)	
-		
-		if rig == None:
-			rig = root.find('library_visual_scenes').find('visual_scene')
-
-		root_joint = self.load_joint(rig.find('node'), joints, correction, True, '')
+		root_joint = self.load_joint(collada.document(file).skeleton, joints, correction, True, '')
 		return Rig(root_joint, self.joint_count)
 
 	# DAE Animation Parsing #
 	def load_animations(self, file, correction):
-		root = xml.parse(file).getroot()
-
-		anim = root.find('library_animations').find('animation')
-		root_ptr = self.get_child_with_attribute(
-			root.find('library_visual_scenes').find('visual_scene'),
-			'node',
-			'id',
-			'Armature'
-		)
+		doc = collada.document(file)
+		anim_data = doc.animations
 
-		if root_ptr != None:
-			root_joint = root_ptr.find('node').attrib['id']
-		else:
-			root_joint = root.find('library_visual_scenes').find('visual_scene').find('node').attrib['id']
-
-		times = [float(x) for x in ' '.join(anim.find('source').find('float_array').text.split('\n')).split(' ') if x != '']
+		root_joint = doc.skeleton.attrib['id']
+		times = anim_data['times'].tolist()
 		duration = times[len(times) - 1]
 
 		keyframes = []
 		for time in times:
 			keyframes.append(KeyFrame(time))
 
-		for joint_node in root.find('library_animations').findall('animation'):
-
-			joint_name_id = joint_node.find('channel').attrib['target'].split('/')[0]
-
-			data_id = self.get_child_with_attribute(
-				joint_node.find('sampler'),
-				'input',
-				'semantic',
-				'OUTPUT'
-			).attrib['source'][1:]
-
-			transforms = [float(x) for x in ' '.join(self.get_child_with_attribute(
-				joint_node,
-				'source',
-				'id',
-				data_id
-			).find('float_array').text.split('\n')).split(' ') if x != '']
-
+		for joint_name_id, transforms in anim_data['transforms'].items():
 			for i, time in enumerate(times):
-				matrix = glm.mat4(transforms[i*16:(i+1)*16])
+				matrix = glm.mat4(transforms[i].tolist())
 				matrix = glm.transpose(matrix)
 
 				if joint_name_id == root_joint:
@@ -480,6 +452,9 @@ class Parser(object):
 		if parse_type == ParseType.OBJ_MODEL:
 			self.data = self.load_obj(file)
 
+		if parse_type == ParseType.PACKED_OBJ_MODEL:
+			self.data = self.load_obj_packed(file)
+
 		if parse_type == ParseType.DAE_MODEL:
 			self.data = self.load_dae(file, correction)
 
@@ -493,51 +468,121 @@ class Parser(object):
 		if parse_type == ParseType.DAE_ANIMATIONS:
 			self.data = self.load_animations(file, correction)
 
+def load_model(file, rigged=False, correction=False):
+	"""
+	Returns the vertex and index arrays for a model file, memory-mapped
+	from the :mod:`diskovery_mesh_cache` when a valid entry exists and
+	parsed (then stored in the cache) otherwise. Rigged models also return
+	the list of joint names and the :class:`Rig` template.
+
+	:param file: A .obj or .dae file
+	:param rigged: Whether joint and rig data should be loaded as well
+	:param correction: Whether the axis correction should be applied to the model
+	"""
+	kind = mesh_cache.RIGGED_MODEL if rigged else mesh_cache.MODEL
+	entry = mesh_cache.load(file, kind, correction, vertex_dtype)
+
+	if entry != None:
+		if rigged:
+			return (entry.vertices, entry.indices, entry.meta['joints'],
+				Rig.deserialize(entry.meta['rig']))
+		return (entry.vertices, entry.indices)
+
+	if rigged:
+		vertex_list, index_list, joint_list = Parser(file, ParseType.DAE_RIGGED_MODEL, correction).data
+		rig = Parser(file, ParseType.DAE_RIG, correction, joint_list).data
+		vertices, indices = pack_vertices(vertex_list, index_list)
+
+		mesh_cache.store(file, kind, correction, vertices, indices,
+			{ 'joints': joint_list, 'rig': rig.serialize() })
+		return (vertices, indices, joint_list, rig)
+
+	if file.split('.')[1] == 'obj':
+		vertices, indices = Parser(file, ParseType.PACKED_OBJ_MODEL).data
+	else:
+		vertices, indices = pack_vertices(*Parser(file, ParseType.DAE_MODEL, correction).data)
+
+	mesh_cache.store(file, kind, correction, vertices, indices)
+	return (vertices, indices)
+
+def load_animation(file, correction=False):
+	"""
+	Returns the :class:`Animation` stored in a .dae file, from the
+	:mod:`diskovery_mesh_cache` when possible
+	"""
+	entry = mesh_cache.load(file, mesh_cache.ANIMATION, correction)
+
+	if entry != None:
+		return Animation.deserialize(entry.meta['animation'])
+
+	anim = Parser(file, ParseType.DAE_ANIMATIONS, correction).data
+	mesh_cache.store(file, mesh_cache.ANIMATION, correction,
+		meta={ 'animation': anim.serialize() })
+	return anim
+
 class Mesh():
-	def __init__(self, dk, file):
+	def __init__(self, dk, file, data=None):
 
-		if file.split('.')[1] == 'obj':
-			vertex_list, index_list = Parser(file, ParseType.OBJ_MODEL).data
+		if file.split('.')[1] not in ('obj', 'dae'):
+			raise RuntimeError("Unsupported file type for 3D model data")
 
-		if file.split('.')[1] == 'dae':
-			vertex_list, index_list = Parser(file, ParseType.DAE_MODEL).data
+		# Data already returned by load_model, e.g. on a loader thread
+		if data is None:
+			data = load_model(file)
 
-		v_size = sizeof(Vertex) * len(vertex_list)
-		i_size = sizeof(c_uint) * len(index_list)
+		vertices, indices = data
 
-		vertex_array = (Vertex*v_size)(*vertex_list)
-		index_array = (c_uint*len(index_list))(*index_list)
+		self.create_buffers(dk, vertices, indices)
+		self.filename = file
 
-		self.vertices = Buffer(
-			dk,
-			v_size,
-			vertex_array,
-			vk.BUFFER_USAGE_VERTEX_BUFFER_BIT
-		)
+	def create_buffers(self, dk, vertices, indices):
+		"""
+		Uploads a structured vertex array (see :data:`vertex_dtype`) and a
+		``uint32`` index array into a range of the vertex and index
+		buffers shared through ``dk.geometry`` (see
+		:class:`~diskovery_buffer.GeometryArena`). Both copies go through
+		``dk.uploads`` and are submitted together, or with the rest of the
+		batch if one is open.
+		"""
+		self.arena = dk.geometry
+		self.geometry = self.arena.allocate(vertices, indices)
+
+		# The shared Buffer objects, bound by every mesh in the same page
+		self.vertices = self.geometry.page.vertices
+		self.indices = self.geometry.page.indices
+
+		# The number of unique vertices and index buffer entries, after
+		# deduplication, kept for reporting
+		self.vertex_count = len(vertices)
+		self.count = len(indices)
 
-		self.indices = Buffer(
-			dk,
-			i_size,
-			index_array,
-			vk.BUFFER_USAGE_INDEX_BUFFER_BIT
-		)
+		# Where the mesh starts within the shared buffers, read by
+		# indexed draws
+		self.first_index = self.geometry.first_index
+		self.vertex_offset = self.geometry.vertex_offset
 
-		self.filename = file
-		self.count = len(index_array)
+		self.compute_bounds(vertices['position'])
 
-	def cleanup(self):
-		self.vertices.cleanup()
-		self.indices.cleanup()
+	def compute_bounds(self, positions):
+		"""
+		Stores the model space bounds of the mesh, used by
+		:mod:`diskovery_culling`: the corners of its axis aligned bounding
+		box in ``bounds`` (a ``(2, 3)`` array of the minimum and maximum),
+		and the ``center`` and ``radius`` of the sphere around that box's
+		center holding every vertex.
+		"""
+		if len(positions) == 0:
+			positions = np.zeros((1, 3), dtype=np.float32)
 
-class VertexLoader:
-	def __init__(self, index, position, joints=None, weights=None):
-		self.index = index
-		self.position = position
-		self.tex_ind = None
-		self.norm_ind = None
-		self.joints = joints
-		self.weights = weights
-		self.duplicate = None
+		self.bounds = np.array([positions.min(axis=0), positions.max(axis=0)], dtype=np.float32)
+		self.center = self.bounds.mean(axis=0)
+		self.radius = float(np.sqrt(((positions - self.center) ** 2).sum(axis=1).max()))
+
+		# Skinned meshes move away from their bind pose, see AnimatedMesh
+		self.cullable = True
+
+	def cleanup(self):
+		self.arena.free(self.geometry)
 
 class Vertex(Structure):
 	_fields_ = (
@@ -557,6 +602,28 @@ class Vertex(Structure):
 			self.normal[0], self.normal[1], self.normal[2]
 		)
 
+# A numpy mirror of the Vertex structure above, so that arrays of this
+# dtype can be copied into vertex buffers byte for byte
+vertex_dtype = np.dtype([
+	('position', np.float32, 3),
+	('color', np.float32, 3),
+	('tex_coord', np.float32, 2),
+	('normal', np.float32, 3),
+	('joint_ids', np.float32, 3),
+	('weights', np.float32, 3)
+])
+
+assert vertex_dtype.itemsize == sizeof(Vertex)
+
+def pack_vertices(vertex_list, index_list):
+	"""
+	Converts the lists of :class:`Vertex` objects and indices produced
+	by the DAE parsers into the arrays used by :meth:`Mesh.create_buffers`
+	"""
+	vertices = np.frombuffer((Vertex*len(vertex_list))(*vertex_list), dtype=vertex_dtype)
+	indices = np.array(index_list, dtype=np.uint32)
+	return (vertices, indices)
+
 class VertexSkin:
 	def scale(self, num_weights):
 		if len(self.joints) > num_weights:
@@ -605,76 +672,37 @@ class Joint:
 
 class TerrainMesh(Mesh):
 	def __init__(self, dk, positions, normals, uvs, indices):
-		v_size = sizeof(Vertex) * len(positions)
-		i_size = sizeof(c_uint) * len(indices)
+		vertices = np.zeros(len(positions), dtype=vertex_dtype)
+		vertices['position'] = positions
+		vertices['normal'] = normals
+		vertices['tex_coord'] = uvs
 
-		vertex_list = []
-		for i, pos in enumerate(positions):
-			v = Vertex()
-			v.position = (c_float * 3)(*pos)
-			v.normal = (c_float * 3)(*normals[i])
-			v.tex_coord = (c_float * 2)(*uvs[i])
-			vertex_list.append(v)
-
-		vertex_array = (Vertex * len(positions))(*vertex_list)
-		index_array = (c_uint * len(indices))(*indices)
-
-		self.vertices = Buffer(
-			dk,
-			v_size,
-			vertex_array,
-			vk.BUFFER_USAGE_VERTEX_BUFFER_BIT
-		)
-
-		self.indices = Buffer(
-			dk,
-			i_size,
-			index_array,
-			vk.BUFFER_USAGE_INDEX_BUFFER_BIT
-		)
-
-		self.count = len(indices)
+		self.create_buffers(dk, vertices, np.array(indices, dtype=np.uint32))
 
 
 class AnimatedMesh(Mesh):
-	def __init__(self, dk, file, correction=False, extract_anim=False):
+	def __init__(self, dk, file, correction=False, extract_anim=False, data=None):
 
 		if file.split('.')[1] == 'obj':
 			raise RuntimeError("`AnimatedMesh` cannot accept data from a .obj file." \
 							   " Use a `Mesh` object instead.")
 		elif file.split('.')[1] == 'dae':
-			vertex_list, index_list, joint_list = Parser(file, ParseType.DAE_RIGGED_MODEL, correction).data
-			self.rig = Parser(file, ParseType.DAE_RIG, correction, joint_list).data
-
 			if extract_anim:
-				self.anim = Parser(file, ParseType.DAE_ANIMATIONS, correction).data
+				self.anim = load_animation(file, correction)
 				return
-		else:
-			raise RuntimeError("Unsupported file type for 3D model and animation data")
-
-		v_size = sizeof(Vertex) * len(vertex_list)
-		i_size = sizeof(c_uint) * len(index_list)
-
-		vertex_array = (Vertex*v_size)(*vertex_list)
-		index_array = (c_uint*len(index_list))(*index_list)
 
-		self.vertices = Buffer(
-			dk,
-			v_size,
-			vertex_array,
-			vk.BUFFER_USAGE_VERTEX_BUFFER_BIT
-		)
+			if data is None:
+				data = load_model(file, True, correction)
 
-		self.indices = Buffer(
-			dk,
-			i_size,
-			index_array,
-			vk.BUFFER_USAGE_INDEX_BUFFER_BIT
-		)
+			vertices, indices, joint_list, self.rig = data
+		else:
+			raise RuntimeError("Unsupported file type for 3D model and animation data")
 
+		self.create_buffers(dk, vertices, indices)
 		self.filename = file
 
-		self.count = len(index_array)
+		# The joints can move vertices outside the bind pose bounds
+		self.cullable = False
 
 class Rig(object):
 
@@ -692,25 +720,57 @@ class Rig(object):
 
 		return Rig(root, count)
 
+	@staticmethod
+	def deserialize(data):
+		"""
+		Rebuilds a :class:`Rig` from the list made by :meth:`serialize`
+		"""
+		joints = []
+		for entry in data:
+			joint = Joint(entry['index'], entry['name'], glm.mat4(*entry['transform']))
+			if entry['parent'] >= 0:
+				joints[entry['parent']].children.append(joint)
+			joints.append(joint)
+
+		return Rig(joints[0], len(joints))
+
+	def serialize(self):
+		"""
+		Flattens the joint hierarchy into a JSON friendly list. Each joint
+		refers to its parent by position in the list, the root comes first.
+		"""
+		data = []
+		stack = [(self.root, -1)]
+		while len(stack) > 0:
+			joint, parent = stack.pop()
+			data.append({
+				'index': joint.index,
+				'name': joint.name,
+				'parent': parent,
+				'transform': [v for column in joint.local_transform for v in column]
+			})
+			position = len(data) - 1
+			for child in reversed(joint.children):
+				stack.append((child, position))
+		return data
+
 	def __init__(self, root, joint_count):
 		# The root of the Joint hierarchy
 		self.root = root
 		self.joint_count = joint_count
+		# Uniform data refilled in place by get_joint_data
+		self.joint_data = JointData()
 
 		self.root.set_inverse_transform(glm.mat4(1.0))
 
-	def fill_joints(self, head, arr, names):
-		arr[head.index] = get_matrix_data(head.anim_transform)
-		names[head.index] = head.name
+	def fill_joints(self, head):
+		self.joint_data.set(head.index, head.anim_transform)
 		for child in head.children:
-			self.fill_joints(child, arr, names)
+			self.fill_joints(child)
 
 	def get_joint_data(self):
-		matrix_type = (c_float*4)*4
-		joint_data = (matrix_type*self.joint_count)()
-		joint_names = [None] * self.joint_count
-		self.fill_joints(self.root, joint_data, joint_names)
-		return joint_data
+		self.fill_joints(self.root)
+		return self.joint_data.get_data()
 
 class JointTransform(object):
 
@@ -742,6 +802,37 @@ class KeyFrame(object):
 		self.pose = { }
 
 class Animation(object):
+
+	@staticmethod
+	def deserialize(data):
+		"""
+		Rebuilds an :class:`Animation` from the dictionary made by :meth:`serialize`
+		"""
+		keys = []
+		for timestamp, pose in zip(data['times'], data['poses']):
+			key = KeyFrame(timestamp)
+			for name, t in pose.items():
+				key.pose[name] = JointTransform(glm.vec3(*t[:3]), glm.quat(*t[3:]))
+			keys.append(key)
+
+		return Animation(data['length'], keys)
+
+	def serialize(self):
+		"""
+		Returns the keyframes as a JSON friendly dictionary. Every joint
+		transform is stored as its position followed by its rotation (w, x, y, z).
+		"""
+		poses = []
+		for key in self.keys:
+			poses.append({ name: list(t.position) + [t.rotation.w, t.rotation.x, t.rotation.y, t.rotation.z]
+				for name, t in key.pose.items() })
+
+		return {
+			'length': self.length,
+			'times': [key.timestamp for key in self.keys],
+			'poses': poses
+		}
+
 	def __init__(self, length, keys):
 		self.length = length
 		self.keys = keys
@@ -800,6 +891,10 @@ class Animator(object):
 		if self.current_anim not in self.animations:
 			return
 
+		# The animation may still be loading in the background
+		if self.current_anim not in self.anim_dict:
+			return
+
 		self.anim_time += self.em.get_frame_time()
 		if self.anim_time > self.anim_dict[self.current_anim].length:
 			self.anim_time %= self.anim_dict[self.current_anim].length
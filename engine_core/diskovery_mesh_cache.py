@@ -0,0 +1,298 @@
+#!/bin/env/python
+
+"""
+The :mod:`diskovery_mesh_cache` module stores compiled meshes in a cache
+directory so that models only have to be parsed once. Every entry is a
+single ``.dkmesh`` file laid out as::
+
+	header | vertex bytes | index bytes | metadata
+
+The header records the size, modification time and SHA-256 hash of the
+source file the entry was compiled from. The vertex and index bytes are
+exactly what gets copied into the Vulkan buffers, so they are memory
+mapped straight from disk. The metadata is a small JSON block holding the
+joint names, the rig hierarchy and any animation keyframes.
+
+An entry is reused while its source keeps the same size and modification
+time. When either changes, the source is hashed again, and the entry is
+only thrown away if the contents actually differ.
+
+Every asset referenced by a ``.dk`` scene can be compiled ahead of time
+from the ``engine_core`` directory with::
+
+	python diskovery_mesh_cache.py scene.dk [scene.dk ...]
+	python diskovery_mesh_cache.py --clear
+"""
+
+import os
+import sys
+import json
+import struct
+import hashlib
+import threading
+import numpy as np
+
+#: Whether :mod:`diskovery_mesh` should read and write the cache at all
+enabled = True
+
+#: Directory next to this module that holds the entries
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mesh_cache")
+
+# Entry kinds, a single source file can be compiled into more than one
+MODEL = "model"
+RIGGED_MODEL = "rigged"
+ANIMATION = "anim"
+
+MAGIC = b"DKMESH"
+VERSION = 1
+
+# magic, version, vertex stride, source size, source mtime, source sha256,
+# vertex count, index count, then offset and length of the metadata block
+_header = struct.Struct("<6sHIQd32sQQQQ")
+
+class CacheEntry(object):
+	"""
+	A loaded ``.dkmesh`` file. ``vertices`` and ``indices`` are read-only
+	``numpy`` views onto the mapped file, and are ``None`` for entries
+	that only hold animation data.
+	"""
+	def __init__(self, vertices, indices, meta):
+		self.vertices = vertices
+		self.indices = indices
+		self.meta = meta
+
+def _entry_name(file):
+	# The absolute path is hashed, so the same file has one entry wherever
+	# the engine is started from and no two files share one. The file
+	# name is only kept to make the cache directory readable
+	path = os.path.abspath(file)
+	digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+	return "{}-{}".format(os.path.basename(path), digest)
+
+def entry_path(file, kind, correction=False):
+	"""
+	Returns the path of the ``.dkmesh`` file for a source file compiled
+	as ``kind``.
+	"""
+	name = _entry_name(file)
+	suffix = "-c" if correction else ""
+	return os.path.join(cache_dir, "{}.{}{}.dkmesh".format(name, kind, suffix))
+
+def file_hash(file):
+	"""
+	Returns the SHA-256 digest of the contents of ``file``
+	"""
+	digest = hashlib.sha256()
+	with open(file, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			digest.update(chunk)
+	return digest.digest()
+
+def _read_header(path):
+	with open(path, "rb") as f:
+		raw = f.read(_header.size)
+
+	if len(raw) != _header.size:
+		return None
+
+	header = _header.unpack(raw)
+	if header[0] != MAGIC or header[1] != VERSION:
+		return None
+
+	return header
+
+def is_valid(file, kind, correction=False, vertex_dtype=None):
+	"""
+	Checks whether the entry for ``file`` exists and still matches the
+	source. When only the modification time has changed (for example after
+	a fresh checkout), the source is hashed and, if it is unchanged, the
+	new time is written back to the header so the next check is cheap.
+	"""
+	path = entry_path(file, kind, correction)
+	if not os.path.exists(path) or not os.path.exists(file):
+		return False
+
+	header = _read_header(path)
+	if header is None:
+		return False
+
+	_, _, stride, size, mtime, digest = header[:6]
+	if vertex_dtype is not None and header[6] and stride != vertex_dtype.itemsize:
+		return False
+
+	stat = os.stat(file)
+	if stat.st_size == size and stat.st_mtime == mtime:
+		return True
+
+	if stat.st_size != size or file_hash(file) != digest:
+		return False
+
+	with open(path, "r+b") as f:
+		f.write(_header.pack(*(header[:4] + (stat.st_mtime,) + header[5:])))
+
+	return True
+
+def load(file, kind, correction=False, vertex_dtype=None):
+	"""
+	Memory-maps the cached entry for ``file``, or returns ``None`` if there
+	is no valid entry.
+
+	:param file: Path of the source model or animation file
+	:param kind: One of :data:`MODEL`, :data:`RIGGED_MODEL` or :data:`ANIMATION`
+	:param correction: Whether the entry was compiled with the axis correction applied
+	:param vertex_dtype: ``numpy`` dtype of a single vertex
+	"""
+	if not enabled or not is_valid(file, kind, correction, vertex_dtype):
+		return None
+
+	path = entry_path(file, kind, correction)
+	header = _read_header(path)
+	vertex_count, index_count, meta_offset, meta_size = header[6:]
+
+	vertices = indices = None
+	offset = _header.size
+
+	if vertex_count:
+		vertices = np.memmap(path, dtype=vertex_dtype, mode="r",
+			offset=offset, shape=(vertex_count,))
+		offset += vertex_count * vertex_dtype.itemsize
+
+	if index_count:
+		indices = np.memmap(path, dtype=np.uint32, mode="r",
+			offset=offset, shape=(index_count,))
+
+	with open(path, "rb") as f:
+		f.seek(meta_offset)
+		meta = json.loads(f.read(meta_size).decode("utf-8"))
+
+	return CacheEntry(vertices, indices, meta)
+
+def store(file, kind, correction=False, vertices=None, indices=None, meta=None):
+	"""
+	Writes a new entry for ``file``. The entry is written to a temporary
+	file first and then moved into place, so a reader never sees a half
+	written entry.
+
+	:param vertices: A structured ``numpy`` array of vertices, or ``None``
+	:param indices: An array of indices, stored as ``uint32``
+	:param meta: A JSON serializable dictionary of extra data (rig, joints, animations)
+	"""
+	if not enabled:
+		return
+
+	os.makedirs(cache_dir, exist_ok=True)
+	path = entry_path(file, kind, correction)
+
+	stat = os.stat(file)
+	digest = file_hash(file)
+
+	vertex_bytes = b"" if vertices is None else np.ascontiguousarray(vertices).tobytes()
+	index_bytes = b"" if indices is None else np.ascontiguousarray(indices, dtype=np.uint32).tobytes()
+	meta_bytes = json.dumps(meta if meta is not None else { }).encode("utf-8")
+
+	stride = 0 if vertices is None else vertices.dtype.itemsize
+	vertex_count = 0 if vertices is None else len(vertices)
+	index_count = 0 if indices is None else len(indices)
+	meta_offset = _header.size + len(vertex_bytes) + len(index_bytes)
+
+	header = _header.pack(MAGIC, VERSION, stride, stat.st_size, stat.st_mtime,
+		digest, vertex_count, index_count, meta_offset, len(meta_bytes))
+
+	# Several loader threads can store the same mesh at once, so each
+	# writes under a name of its own
+	temp = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+	with open(temp, "wb") as f:
+		f.write(header)
+		f.write(vertex_bytes)
+		f.write(index_bytes)
+		f.write(meta_bytes)
+
+	os.replace(temp, path)
+
+def invalidate(file=None):
+	"""
+	Removes every cached entry compiled from ``file``, or the whole cache
+	when no file is given.
+	"""
+	if not os.path.isdir(cache_dir):
+		return
+
+	prefix = None
+	if file is not None:
+		prefix = _entry_name(file) + "."
+
+	for name in os.listdir(cache_dir):
+		if not name.endswith(".dkmesh"):
+			continue
+		if prefix is None or name.startswith(prefix):
+			os.remove(os.path.join(cache_dir, name))
+
+def scene_assets(filename):
+	"""
+	Reads a ``.dk`` scene file and returns the ``(meshes, animations)``
+	it references. ``meshes`` is a list of ``(file, animated)`` tuples and
+	``animations`` a list of files.
+	"""
+	sections = ('Meshes', 'Textures', 'Shaders', 'Animations', 'Camera',
+		'LightScenes', 'Entities')
+
+	meshes = []
+	animations = []
+
+	with open(filename, 'r') as f:
+		lines = f.read().splitlines()
+
+	current = None
+	for line in lines[1:]:
+		if line in sections:
+			current = line
+			continue
+
+		args = line.split(' ')
+		if current == 'Meshes' and len(args) >= 2:
+			meshes.append((args[0], len(args) > 2 and args[2] == 'T'))
+		elif current == 'Animations' and args[0]:
+			animations.append(args[0])
+
+	return (meshes, animations)
+
+def precompile(filename, force=False):
+	"""
+	Compiles every mesh and animation referenced by the ``.dk`` scene
+	``filename`` into the cache. Entries that are still valid are skipped
+	unless ``force`` is set.
+	"""
+	import diskovery_mesh
+
+	meshes, animations = scene_assets(filename)
+
+	if force:
+		for file, animated in meshes:
+			invalidate(file)
+		for file in animations:
+			invalidate(file)
+
+	for file, animated in meshes:
+		if animated:
+			diskovery_mesh.load_model(file, True, True)
+		else:
+			diskovery_mesh.load_model(file)
+		print("{} -> {}".format(file, entry_path(file,
+			RIGGED_MODEL if animated else MODEL, animated)))
+
+	for file in animations:
+		diskovery_mesh.load_animation(file, True)
+		print("{} -> {}".format(file, entry_path(file, ANIMATION, True)))
+
+if __name__ == '__main__':
+	args = sys.argv[1:]
+
+	if not args:
+		print(__doc__)
+	elif args[0] == '--clear':
+		invalidate()
+	else:
+		force = '--force' in args
+		for scene in args:
+			if scene != '--force':
+				precompile(scene, force)
@@ -1,17 +1,52 @@
 #!/bin/env/python
 
 import vk
-import os
-import subprocess
+import time
 from ctypes import *
+import diskovery_ubos
+import diskovery_shader_cache as shader_cache
 from diskovery_ubos import *
-from diskovery_descriptor import BindingType
-from diskovery_mesh import Vertex, bindings, attributes, animated_attributes
+from diskovery_descriptor import BindingType, FRAME_UNIFORMS
+from diskovery_mesh import Vertex, bindings, attributes, animated_attributes, \
+	instance_bindings, instance_attributes, INSTANCE_LOCATION
+
+#: Size in bytes of the push constant range shared by every pipeline, the
+#: smallest maxPushConstantsSize a Vulkan device may report
+PUSH_CONSTANT_SIZE = 128
+
+#: Stages that can read the push constant range
+PUSH_CONSTANT_STAGES = vk.SHADER_STAGE_VERTEX_BIT | vk.SHADER_STAGE_FRAGMENT_BIT
+
+def uniform_type(name):
+	"""
+	Returns the :class:`~diskovery_ubos.UniformBufferObject` type used for
+	a uniform block. Blocks whose names start with an underscore are
+	filled with a :class:`~diskovery_ubos.Boolean`.
+	"""
+	if name and name[0] == '_':
+		return Boolean
+
+	ubo = getattr(diskovery_ubos, name or '', None)
+	if not isinstance(ubo, type) or not issubclass(ubo, UniformBufferObject):
+		raise ValueError("No uniform buffer type named {} in diskovery_ubos".format(name))
+
+	return ubo
+
+def _check_frame_binding(binding, type_name):
+	# Set 0 is shared by every pipeline, so shaders may only read it
+	if binding >= len(FRAME_UNIFORMS) or type_name != FRAME_UNIFORMS[binding].__name__:
+		raise ValueError(
+			"Set 0, binding {} is reserved for {}. Per-entity uniforms "
+			"must be declared with set = 1".format(
+				binding,
+				FRAME_UNIFORMS[binding].__name__ if binding < len(FRAME_UNIFORMS) else "frame data"
+			)
+		)
 
 class Shader(object):
 	def __init__(self, sources):
 		# A tuple defining the order of the descriptor sets as uniforms and samplers
-		self.definition = [None] * 100
+		self.definition = ()
 		# A breakdown of what each of the above uniforms contains
 		self.uniforms = []
 		# A dictionary of the filenames of each stage of the shader
@@ -19,7 +54,22 @@ class Shader(object):
 
 		self.color_attachments = 1
 
-		def_uni_map = []
+		# The UniformBufferObject type filled for the push constant block
+		# and the stages that declare one. When both stages declare a block,
+		# the larger one is used, and the other must match its first members.
+		# Push constants are recorded into the command buffers, so they only
+		# suit values that stay the same until the render list changes
+		self.push_constant = None
+		self.push_stages = 0
+		# The [offset, type] of each member of the larger block
+		self.push_members = None
+
+		# Whether the vertex stage reads the per-draw values (model matrix,
+		# tint and material) from the per-instance attributes
+		self.instanced = False
+		# Whether the vertex stage places vertices with the camera
+		# matrices, rather than in screen space, so it can be culled
+		self.world_space = False
 
 		"""
 		Shaders are typically written in a C-style language called GLSL.
@@ -27,91 +77,124 @@ class Shader(object):
 		format called SPIR-V. Thankfully, included in the Vulkan SDK is an
 		executable that allows GLSL shaders to be converted into SPIR-V format.
 
-		The following searches the directory where the shaders are located and
-		formats the newly created SPIR-V shaders into a dictionary where they
-		can be referenced by calling their stage in the shader.
+		Both stages are compiled at once through :mod:`diskovery_shader_cache`,
+		which only runs the compiler when a source has changed. Everything
+		below is read from the interface :mod:`diskovery_spirv` reflected
+		from the SPIR-V, which the cache keeps next to it. The SPIR-V files
+		are kept in a dictionary where they can be referenced by calling
+		their stage in the shader.
 
 		This functionality requires that the GLSL shaders use file endings that
 		correspond to their stages (e.g. *.vert, *.frag)
 		"""
-		os.chdir("Shaders")
+		stages = shader_cache.compile_all(sources)
+		vert = stages[sources[0]].reflection
+		frag = stages[sources[1]].reflection
 
-		max_binding = 0
+		# Locations from INSTANCE_LOCATION up hold per-instance attributes,
+		# the skinned vertex format adds joints and weights after the normal
+		vertex_inputs = [l for l in vert['inputs'] if l < INSTANCE_LOCATION]
+		self.instanced = len(vertex_inputs) < len(vert['inputs'])
+		self.animated = len(vertex_inputs) > 0 and max(vertex_inputs) > 4
 
-		with open(sources[0], 'r') as f:
-			num_attribs = 0
-			for line in f:
-				if line[:7] != 'layout(':
-					continue
+		# One color attachment per fragment output
+		if frag['outputs']:
+			self.color_attachments = max(frag['outputs']) + 1
 
-				# If the variable describes the attribute definitions
-				if line.split('(')[1][:1] == 'l' and line.split(' ')[3] == 'in':
-					num_attribs = int(line.split(' ')[2][:-1])
+		for reflection, stage in ((vert, vk.SHADER_STAGE_VERTEX_BIT), (frag, vk.SHADER_STAGE_FRAGMENT_BIT)):
+			if reflection['push_constant'] is not None:
+				self.add_push_constant(uniform_type(reflection['push_constant']), stage,
+					reflection['push_members'])
 
-				# If the variable descripes a uniform buffer object
-				if line.split('(')[1][:1] == 'b':
-					binding = int(line.split(' ')[2][:-1])
+		# Bindings of set 1, the per-entity set, by binding number
+		entity_set = { }
 
-					if binding > max_binding:
-						max_binding = binding
+		for reflection in (vert, frag):
+			for set_index, binding, kind, type_name in reflection['bindings']:
+				# Camera and lighting data shared through the frame set
+				if set_index == 0:
+					_check_frame_binding(binding, type_name)
 
-					self.definition[binding] = BindingType.UNIFORM_BUFFER
-					def_uni_map.append(binding) 
-					self.uniforms.append(eval(line.split(' ')[4]))
+					if type_name == 'CameraData' and reflection is vert:
+						self.world_space = True
+				else:
+					entity_set[binding] = (kind, type_name)
 
-			self.animated = num_attribs > 4
+		definition = [None] * (max(entity_set) + 1 if entity_set else 0)
 
-		with open(sources[1], 'r') as f:
-			num_attribs = 0
-			for line in f:
-				if line[:7] != 'layout(':
-					continue
+		# Uniforms are filled in the order of their bindings
+		for binding in sorted(entity_set):
+			kind, type_name = entity_set[binding]
 
-				# If the variable describes the number of color attachments
-				if line.split('(')[1][:1] == 'l' and line.split(' ')[3] == 'out':
-					self.color_attachments = int(line.split(' ')[2][:-1]) + 1
+			if kind == 'sampler':
+				definition[binding] = BindingType.TEXTURE_SAMPLER
+			else:
+				definition[binding] = BindingType.UNIFORM_BUFFER
+				self.uniforms.append(uniform_type(type_name))
 
-				if line.split('(')[1][:1] == 'b':
-					binding = int(line.split(' ')[2][:-1])
+		self.definition = tuple(definition)
 
-					if binding > max_binding:
-							max_binding = binding
+		for src in sources:
+			self.filenames[src.split('.')[1]] = stages[src].spirv
 
-					if line.split(' ')[4] == 'sampler2D':
-						self.definition[binding] = BindingType.TEXTURE_SAMPLER
-					else:
-						self.definition[binding] = BindingType.UNIFORM_BUFFER
-						
-						slots_back = sum(i > binding for i in def_uni_map)
-						def_uni_map.insert(len(def_uni_map) - slots_back, binding)
-						if line.split(' ')[4][0] != '_':
-							self.uniforms.insert(len(self.uniforms) - slots_back, eval(line.split(' ')[4]))
-						else:
-							self.uniforms.insert(len(self.uniforms) - slots_back, Boolean)
+		self.sources = sources
 
-		self.definition = tuple(self.definition[:(max_binding+1)])
+	def can_instance(self):
+		"""
+		Whether entities using this shader can be drawn together by one
+		instanced draw. Every value that differs between them has to come
+		from the per-instance attributes, so the shader may not push
+		constants or skin its vertices, and their descriptor sets may only
+		hold textures.
+		"""
+		return self.instanced and not self.animated and \
+			self.push_constant is None and \
+			all(b == BindingType.TEXTURE_SAMPLER for b in self.definition)
 
-		for src in sources:
-			if os.path.isfile("{}.spv".format(src)):
-				subprocess.call("rm {}.spv".format(src))
-			subprocess.call("glslangValidator.exe -V {} -o {}.spv".format(src, src))
-			# subprocess.call("compile.bat {}".format(src))
+	def add_push_constant(self, push_type, stage, members=None):
+		"""
+		Adds the push constant block of one stage. Both stages read the
+		same bytes, so when the other stage already declared a block, the
+		smaller of the two has to start with the same members, at the same
+		offsets, as the larger one.
+
+		:param push_type: The :class:`~diskovery_ubos.UniformBufferObject` type filling the block
+		:param stage: The ``vk.SHADER_STAGE_*`` bit of the stage declaring it
+		:param members: The ``[offset, type]`` of each member, as reflected by :mod:`diskovery_spirv`
+		"""
+		if push_type.get_size() > PUSH_CONSTANT_SIZE:
+			raise ValueError("Push constant block {} is {} bytes, the limit is {}".format(
+				push_type.__name__, push_type.get_size(), PUSH_CONSTANT_SIZE
+			))
 
-			self.filenames[src.split('.')[1]] = "shaders/{}.spv".format(src)
+		if self.push_members is not None and members is not None:
+			smaller, larger = sorted((self.push_members, members), key=len)
+			if larger[:len(smaller)] != smaller:
+				raise ValueError("Push constant blocks {} and {} don't match, the smaller "
+					"one has to repeat the first members of the larger one".format(
+						self.push_constant.__name__, push_type.__name__
+					))
 
-		os.chdir("..")
-		
-		self.sources = sources
+		if self.push_constant is None or push_type.get_size() > self.push_constant.get_size():
+			self.push_constant = push_type
+
+		if self.push_members is None or (members is not None and len(members) > len(self.push_members)):
+			self.push_members = members
+
+		self.push_stages |= stage
 
 class Pipeline(object):
 
-	def make_pipeline_layout(self, set_layout):
+	def make_pipeline_layout(self, set_layouts):
+		layouts = (vk.DescriptorSetLayout*len(set_layouts))(*set_layouts)
+
 		create_info = vk.PipelineLayoutCreateInfo(
 			s_type=vk.STRUCTURE_TYPE_PIPELINE_LAYOUT_CREATE_INFO,
 			flags=0,
-			set_layout_count=1,
-			set_layouts=pointer(set_layout),
-			push_constant_range_count=0
+			set_layout_count=len(set_layouts),
+			set_layouts=cast(layouts, POINTER(vk.DescriptorSetLayout)),
+			push_constant_range_count=1,
+			push_constant_ranges=pointer(self.push_constant_range)
 		)
 
 		self.dk.CreatePipelineLayout(
@@ -142,10 +225,9 @@ class Pipeline(object):
 		return module
 
 	def make_pipeline(self, animated, samples):
-		path = os.path.dirname(os.path.abspath(__file__))
-		with open(os.path.join(path, self.shader.filenames['vert']), 'rb') as f:
+		with open(self.shader.filenames['vert'], 'rb') as f:
 			vert_shader_src = f.read()
-		with open(os.path.join(path, self.shader.filenames['frag']), 'rb') as f:
+		with open(self.shader.filenames['frag'], 'rb') as f:
 			frag_shader_src = f.read()
 
 		vertex_shader = self.get_shader_module(vert_shader_src)
@@ -179,7 +261,19 @@ class Pipeline(object):
 		    )
 		)
 
-		if animated:
+		if self.shader.instanced:
+			vertex_input_create.vertex_binding_description_count = len(instance_bindings())
+			vertex_input_create.vertex_binding_descriptions=cast(
+				instance_bindings(),
+				POINTER(vk.VertexInputBindingDescription)
+			)
+			vertex_input_create.vertex_attribute_description_count = len(instance_attributes(animated))
+			vertex_input_create.vertex_attribute_descriptions=cast(
+				instance_attributes(animated),
+				POINTER(vk.VertexInputAttributeDescription)
+			)
+
+		elif animated:
 			vertex_input_create.vertex_attribute_description_count = len(animated_attributes())
 			vertex_input_create.vertex_attribute_descriptions=cast(
 				animated_attributes(),
@@ -276,14 +370,17 @@ class Pipeline(object):
 		)
 
 		pipeline = vk.Pipeline(0)
+		start = time.perf_counter()
 		result = self.dk.CreateGraphicsPipelines(
 			self.dk.device,
-			vk.PipelineCache(0),
+			self.dk.pipeline_cache,
 			1,
 			byref(pipeline_create),
 			None,
 			byref(pipeline)
 		)
+		self.dk.pipeline_stats['create_time'] += time.perf_counter() - start
+		self.dk.pipeline_stats['pipelines'] += 1
 
 		self.pipeline_ref = pipeline
 
@@ -291,7 +388,7 @@ class Pipeline(object):
 		self.dk.DestroyShaderModule(self.dk.device, fragment_shader, None)
 
 
-	def __init__(self, dk, shader, set_layout, animated, samples=None):
+	def __init__(self, dk, shader, set_layouts, animated, samples=None):
 		self.dk = dk
 
 		if samples == None:
@@ -300,12 +397,19 @@ class Pipeline(object):
 		# A reference to the Shader (Shader) this pipeline is being built around
 		self.shader = shader
 		# A restructuring of the definition of the above shader for
-		# compatibility with Vulkan's Descriptor sets (VkPipelineLayout)
+		# compatibility with Vulkan's Descriptor sets (VkPipelineLayout).
+		# set_layouts is ordered by set number, the frame set comes first
 		self.pipeline_layout = vk.PipelineLayout(0)
 		# A reference to the Vulkan pipeline (VkPipeline) itself
 		self.pipeline_ref = vk.Pipeline(0)
-
-		self.make_pipeline_layout(set_layout)
+		# Every layout gets the same range, whether the shader pushes anything
+		# or not, so the frame set stays compatible between pipelines
+		self.push_constant_range = vk.PushConstantRange(
+			stage_flags=PUSH_CONSTANT_STAGES,
+			offset=0,
+			size=PUSH_CONSTANT_SIZE
+		)
+		self.make_pipeline_layout(set_layouts)
 		self.make_pipeline(animated, samples)
 
 	def cleanup(self):
@@ -0,0 +1,115 @@
+#!/bin/env/python
+
+"""
+The :mod:`diskovery_pipeline_cache` module keeps the contents of the
+VkPipelineCache_ of a :class:`~diskovery_instance.DkInstance` on disk
+between runs, so the driver can skip compiling pipelines it has already
+built. The data is saved by :func:`~diskovery.quit` and handed back to
+``vkCreatePipelineCache`` at startup.
+
+The file is laid out as::
+
+	header | pipeline cache data
+
+The header records the vendor ID, device ID, driver version and pipeline
+cache UUID of the device the data came from, along with the SHA-256 hash
+of the data. The data itself starts with the header Vulkan defines for
+it, holding the same IDs and UUID. Data is only loaded when both headers
+match the current device and the hash matches, so a driver update, a
+different GPU or a truncated file all start from an empty cache instead
+of handing a stale blob to the driver.
+"""
+
+import os
+import struct
+import hashlib
+import vk
+
+#: Whether :class:`~diskovery_instance.DkInstance` should load and save the cache
+enabled = True
+
+#: Path of the saved pipeline cache
+cache_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline_cache.bin")
+
+MAGIC = b"DKPIPE"
+VERSION = 1
+
+# magic, version, vendor ID, device ID, driver version, pipeline cache
+# UUID, data size, data sha256
+_header = struct.Struct("<6sHIII16sQ32s")
+
+# header length, header version, vendor ID, device ID, pipeline cache UUID
+_vk_header = struct.Struct("<IIII16s")
+
+def _device(props):
+	return (props.vendor_ID, props.device_ID, props.driver_version,
+		bytes(bytearray(props.pipeline_cache_UUID)))
+
+def is_valid(data, props):
+	"""
+	Checks the header Vulkan puts at the start of pipeline cache data
+	against the device described by ``props``
+
+	:param data: Pipeline cache data, as returned by ``vkGetPipelineCacheData``
+	:param props: The VkPhysicalDeviceProperties_ of the device
+	"""
+	if len(data) < _vk_header.size:
+		return False
+
+	length, version, vendor, device, uuid = _vk_header.unpack_from(data)
+	vendor_id, device_id, driver, cache_uuid = _device(props)
+
+	return length >= _vk_header.size and \
+		version == vk.PIPELINE_CACHE_HEADER_VERSION_ONE and \
+		(vendor, device, uuid) == (vendor_id, device_id, cache_uuid)
+
+def load(props):
+	"""
+	Returns the saved pipeline cache data for the device described by
+	``props``, or ``None`` if there is none or it was saved by another
+	device or driver version
+	"""
+	if not enabled or not os.path.isfile(cache_file):
+		return None
+
+	with open(cache_file, "rb") as f:
+		raw = f.read()
+
+	if len(raw) < _header.size:
+		return None
+
+	magic, version, vendor, device, driver, uuid, size, digest = _header.unpack_from(raw)
+	data = raw[_header.size:]
+
+	if magic != MAGIC or version != VERSION or \
+		(vendor, device, driver, uuid) != _device(props) or \
+		size != len(data) or hashlib.sha256(data).digest() != digest:
+		return None
+
+	return data if is_valid(data, props) else None
+
+def store(props, data):
+	"""
+	Saves pipeline cache data for the device described by ``props``. The
+	file is written to a temporary file first and then moved into place,
+	so a reader never sees a half written cache.
+	"""
+	if not enabled or not is_valid(data, props):
+		return
+
+	header = _header.pack(MAGIC, VERSION, *(_device(props) +
+		(len(data), hashlib.sha256(data).digest())))
+
+	temp = cache_file + ".tmp"
+	with open(temp, "wb") as f:
+		f.write(header)
+		f.write(data)
+
+	os.replace(temp, cache_file)
+
+def invalidate():
+	"""
+	Removes the saved pipeline cache
+	"""
+	if os.path.isfile(cache_file):
+		os.remove(cache_file)
@@ -0,0 +1,153 @@
+#!/bin/env/python
+
+"""
+The :mod:`diskovery_recorder` module records the draw calls of a
+:class:`~diskovery_entity_manager.Renderer` on several threads at once.
+The entities are split into chunks, and each chunk is recorded into its
+own secondary VkCommandBuffer_ by a worker thread. The renderer's primary
+command buffer then begins the render pass and runs them in order with
+``vkCmdExecuteCommands``.
+
+Vulkan requires a VkCommandPool_ to only be used by one thread at a time,
+so every recording lane gets its own pools, one per framebuffer. A lane
+is only ever recorded by one job at a time, and before a framebuffer is
+recorded again its pools are reset in one call, which is safe because
+:meth:`~diskovery_entity_manager.EntityManager.draw` waits for the
+frame that last used its command buffer first.
+
+``ctypes`` releases the GIL while a Vulkan function runs, so the time
+spent in the driver overlaps between threads, while the Python side of
+each draw still runs one thread at a time.
+"""
+
+import vk
+from ctypes import *
+
+#: Scenes with fewer entities than this per lane are recorded inline
+MIN_CHUNK = 64
+
+class SecondaryRecorder(object):
+	"""
+	The secondary command buffers of one renderer
+
+	:param dk: The :class:`~diskovery_instance.DkInstance` of the renderer
+	:param buffer_count: Number of framebuffers (primary command buffers) of the renderer
+	:param executor: The thread pool the chunks are recorded on
+	:param lanes: The most chunks a frame is split into, usually the number of threads
+	:param min_chunk: The fewest entities recorded by a single lane
+	"""
+	def __init__(self, dk, buffer_count, executor, lanes, min_chunk=MIN_CHUNK):
+		self.dk = dk
+		self.executor = executor
+		self.lanes = lanes
+		self.min_chunk = min_chunk
+
+		# pools[lane][index] holds the one secondary buffer in buffers[lane][index]
+		self.pools = []
+		self.buffers = []
+
+		for lane in range(0, lanes):
+			self.pools.append([])
+			self.buffers.append([])
+
+			for index in range(0, buffer_count):
+				pool, buff = self.create_lane(dk)
+				self.pools[lane].append(pool)
+				self.buffers[lane].append(buff)
+
+	def create_lane(self, dk):
+		create_info = vk.CommandPoolCreateInfo(
+			s_type=vk.STRUCTURE_TYPE_COMMAND_POOL_CREATE_INFO,
+			flags=0,
+			queue_family_index=dk.graphics['index']
+		)
+
+		pool = vk.CommandPool(0)
+		if dk.CreateCommandPool(dk.device, byref(create_info), None, byref(pool)) != vk.SUCCESS:
+			raise RuntimeError("Unable to create command pool")
+
+		alloc_info = vk.CommandBufferAllocateInfo(
+			s_type=vk.STRUCTURE_TYPE_COMMAND_BUFFER_ALLOCATE_INFO,
+			command_pool=pool,
+			level=vk.COMMAND_BUFFER_LEVEL_SECONDARY,
+			command_buffer_count=1
+		)
+
+		buff = vk.CommandBuffer(0)
+		dk.AllocateCommandBuffers(dk.device, byref(alloc_info), byref(buff))
+
+		return (pool, buff)
+
+	def should_split(self, count):
+		"""
+		Whether ``count`` draws are enough to be worth recording on
+		more than one lane
+		"""
+		return self.lanes > 1 and count >= 2 * self.min_chunk
+
+	def chunks(self, draws):
+		"""
+		Splits the list of draws into at most :attr:`lanes` chunks of
+		consecutive draws, keeping the order they are drawn in
+		"""
+		count = min(self.lanes, max(1, len(draws) // self.min_chunk))
+		size = -(-len(draws) // count)
+
+		return [draws[i:i + size] for i in range(0, len(draws), size)]
+
+	def record_chunk(self, renderer, lane, index, draws):
+		self.dk.ResetCommandPool(self.dk.device, self.pools[lane][index], 0)
+		buff = self.buffers[lane][index]
+
+		inheritance = vk.CommandBufferInheritanceInfo(
+			s_type=vk.STRUCTURE_TYPE_COMMAND_BUFFER_INHERITANCE_INFO,
+			render_pass=renderer.render_pass,
+			subpass=0,
+			framebuffer=renderer.framebuffers[index]
+		)
+
+		begin_info = vk.CommandBufferBeginInfo(
+			s_type=vk.STRUCTURE_TYPE_COMMAND_BUFFER_BEGIN_INFO,
+			flags=vk.COMMAND_BUFFER_USAGE_RENDER_PASS_CONTINUE_BIT |
+				vk.COMMAND_BUFFER_USAGE_SIMULTANEOUS_USE_BIT,
+			inheritance_info=pointer(inheritance)
+		)
+
+		self.dk.BeginCommandBuffer(buff, byref(begin_info))
+		stats = renderer.record_draws(buff, index, draws)
+
+		if self.dk.EndCommandBuffer(buff) != vk.SUCCESS:
+			raise RuntimeError("Unable to write secondary command buffer")
+
+		return stats
+
+	def record(self, renderer, index, draws):
+		"""
+		Records the draws into the secondary command buffers of the
+		given framebuffer, one chunk per lane, and waits for every lane to
+		finish. Each chunk starts with nothing bound, so binds are only
+		skipped within a chunk.
+
+		:returns: A tuple of the array of recorded VkCommandBuffer_ objects, in draw order, and the sum of their :data:`~diskovery_entity_manager.DRAW_STATS` counters
+		"""
+		chunks = self.chunks(draws)
+
+		jobs = [
+			self.executor.submit(self.record_chunk, renderer, lane, index, chunk)
+			for lane, chunk in enumerate(chunks)
+		]
+		results = [job.result() for job in jobs]
+
+		recorded = (vk.CommandBuffer * len(chunks))(
+			*[self.buffers[lane][index] for lane in range(0, len(chunks))]
+		)
+
+		stats = dict((key, sum(r[key] for r in results)) for key in results[0])
+
+		return (recorded, stats)
+
+	def cleanup(self):
+		# Destroying a pool frees the command buffers allocated from it
+		for lane in self.pools:
+			for pool in lane:
+				self.dk.DestroyCommandPool(self.dk.device, pool, None)
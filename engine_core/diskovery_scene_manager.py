@@ -3,7 +3,10 @@ import glm
 import inspect
 import pygame
 import random
+from functools import partial
 import diskovery
+import diskovery_collada
+import diskovery_shader_cache
 from diskovery import Camera, Entity, RenderedEntity, AnimatedEntity, Light, Terrain
 from diskovery_entities import *
 
@@ -12,6 +15,13 @@ _shader_configs = { }
 _animation_configs = { }
 _color = 1
 
+# The shaders the editor adds before loading a scene
+_editor_shaders = (
+	("default.vert", "selection.frag", "Selection"),
+	("basic.vert", "basic.frag", "Basic"),
+	("default.vert", "terrain_selection.frag", "Terrain")
+)
+
 class ShaderRep():
 	def __init__(self, vert, frag):
 		self.sources = (vert, frag)
@@ -23,14 +33,19 @@ class AnimationRep():
 def save_scene(filename, scene_name):
 	diskovery._save_scene(filename, scene_name)
 
-def load_scene(filename):
+def load_scene(filename, background=True):
+	"""
+	Loads a .dk scene file. With ``background`` set, meshes, textures and
+	animations are loaded on the :class:`~diskovery_loader.AssetLoader` and
+	appear as they finish, while the entities are created straight away.
+	"""
 
 	diskovery.clear_environment()
 
-	func_map = { 'Meshes': diskovery.add_mesh,
-	 'Textures': diskovery.add_texture,
+	func_map = { 'Meshes': partial(diskovery.add_mesh, background=background),
+	 'Textures': partial(diskovery.add_texture, background=background),
 	 'Shaders': diskovery.add_shader,
-	 'Animations': diskovery.add_animation,
+	 'Animations': partial(diskovery.add_animation, background=background),
 	 'Camera': diskovery.set_camera_settings,
 	 'LightScenes': diskovery.add_light_scene,
 	 'Entities': diskovery.add_entity }
@@ -117,6 +132,11 @@ def load_scene(filename):
 
 			diskovery.add_entity(p, "plant" + str(p))
 
+	# Every asset is loaded, so the parsed COLLADA documents can go.
+	# Background loads drop them in diskovery.upload_assets instead
+	if not background:
+		diskovery_collada.clear_cache()
+
 def edit_scene(filename, context):
 
 	global _entity_configs, _color
@@ -125,9 +145,10 @@ def edit_scene(filename, context):
 	diskovery.edit_mode(True)
 	_entity_configs.clear()
 
-	diskovery.add_shader("default.vert", "selection.frag", "Selection")
-	diskovery.add_shader("basic.vert", "basic.frag", "Basic")
-	diskovery.add_shader("default.vert", "terrain_selection.frag", "Terrain")
+	# Compile every stage at once, add_shader then finds them in the cache
+	diskovery_shader_cache.compile_all([f for s in _editor_shaders for f in s[:2]])
+	for vert, frag, name in _editor_shaders:
+		diskovery.add_shader(vert, frag, name)
 
 	diskovery.add_texture("blank.png", "Blank")
 	diskovery.add_mesh("cursor.obj", "Cursor", False)
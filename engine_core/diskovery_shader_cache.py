@@ -0,0 +1,245 @@
+#!/bin/env/python
+
+"""
+The :mod:`diskovery_shader_cache` module compiles GLSL shaders to SPIR-V
+with ``glslangValidator`` and keeps the results in a cache directory, so a
+shader is only compiled again when its source or the compiler changes.
+
+Every entry is named after the SHA-256 hash of the shader stage and the
+GLSL source, and is made of two files side by side::
+
+	Shaders/cache/<hash>.spv	the compiled SPIR-V
+	Shaders/cache/<hash>.json	the reflected interface of the SPIR-V
+
+The JSON file holds the inputs, outputs, bindings and push constant block
+read from the SPIR-V by :func:`diskovery_spirv.reflect` right after it was
+compiled. A :class:`~diskovery_pipeline.Shader` built from a cached entry
+takes its definition from there, so the GLSL source is only read to hash
+it and is never parsed.
+
+The JSON file also records the version of the compiler that built the
+entry. Asking the compiler for its version starts a process, so it is
+only done once a stage has to be compiled. Entries are checked against
+it from then on, and one built by another compiler is compiled again.
+A run that finds every stage in the cache never starts the compiler,
+and doesn't need it installed.
+
+All paths are built from the Shaders directory next to this module rather
+than the working directory, so any number of stages can be compiled at
+once from different threads. :func:`compile_all` compiles a list of
+stages on a small thread pool.
+
+Every shader in the Shaders directory can be compiled ahead of time from
+the ``engine_core`` directory with::
+
+	python diskovery_shader_cache.py [file ...]
+	python diskovery_shader_cache.py --clear
+"""
+
+import os
+import sys
+import json
+import hashlib
+import threading
+import subprocess
+import diskovery_spirv
+from concurrent.futures import ThreadPoolExecutor
+
+#: Whether compiled shaders should be read from and written to the cache
+enabled = True
+
+#: The compiler run on every stage, looked up on the ``PATH``
+compiler = "glslangValidator"
+
+#: Directory holding the GLSL sources
+source_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Shaders")
+
+#: Directory holding the compiled entries
+cache_dir = os.path.join(source_dir, "cache")
+
+#: File endings of the stages the compiler recognizes
+STAGES = ('.vert', '.frag', '.geom', '.tesc', '.tese', '.comp')
+
+#: Most stages compiled at once by :func:`compile_all`
+COMPILE_THREADS = 4
+
+#: Hashed into every entry name, raised whenever the contents of an entry change
+VERSION = 4
+
+_version = None
+_version_lock = threading.Lock()
+
+class CompiledStage(object):
+	"""
+	One compiled stage of a shader
+
+	.. py:attribute:: source
+
+		Path of the GLSL source
+
+	.. py:attribute:: spirv
+
+		Path of the compiled SPIR-V in the cache directory
+
+	.. py:attribute:: reflection
+
+		The interface of the stage, as returned by :func:`diskovery_spirv.reflect`
+
+	.. py:attribute:: cached
+
+		Whether the stage was found in the cache rather than compiled
+	"""
+	def __init__(self, source, spirv, reflection, cached):
+		self.source = source
+		self.spirv = spirv
+		self.reflection = reflection
+		self.cached = cached
+
+def source_path(file):
+	"""
+	Returns the path of a GLSL source given relative to the Shaders
+	directory. Absolute paths are returned unchanged.
+	"""
+	return os.path.join(source_dir, file)
+
+def compiler_version():
+	"""
+	Returns the version reported by :data:`compiler`. It is only asked
+	once per run, the first time a stage has to be compiled.
+	"""
+	global _version
+
+	with _version_lock:
+		if _version is None:
+			try:
+				result = subprocess.run([compiler, "--version"],
+					stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+			except OSError:
+				raise RuntimeError("{} was not found, it is included in the "
+					"Vulkan SDK and has to be on the PATH".format(compiler))
+
+			_version = result.stdout.decode("utf-8", "replace").strip()
+
+	return _version
+
+def source_key(file, text):
+	"""
+	Returns the hex digest naming the entry of a stage
+
+	:param file: Name of the GLSL source, only its file ending (the stage) is hashed
+	:param text: The contents of the source, as bytes
+	"""
+	digest = hashlib.sha256()
+	digest.update(str(VERSION).encode("utf-8"))
+	digest.update(b"\0")
+	digest.update(os.path.splitext(file)[1].encode("utf-8"))
+	digest.update(b"\0")
+	digest.update(text)
+	return digest.hexdigest()
+
+def _temp_path(path):
+	# A name only this thread of this process uses, so stages compiled at
+	# once, even by two runs, never write to the same file
+	return "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+
+def _write(path, data):
+	# Written under a temporary name, then moved into place, so a reader
+	# never sees a half written file
+	temp = _temp_path(path)
+	with open(temp, "wb") as f:
+		f.write(data)
+	os.replace(temp, path)
+
+def compile_stage(file):
+	"""
+	Returns the :class:`CompiledStage` of a GLSL source, compiling it
+	only if the cache has no entry for its current contents.
+
+	:param file: Path of the GLSL source, relative to the Shaders directory
+	"""
+	source = source_path(file)
+	with open(source, "rb") as f:
+		text = f.read()
+
+	key = source_key(file, text)
+	spirv = os.path.join(cache_dir, key + ".spv")
+	reflection = os.path.join(cache_dir, key + ".json")
+
+	if enabled and os.path.isfile(spirv) and os.path.isfile(reflection):
+		with open(reflection, "r") as f:
+			entry = json.load(f)
+
+		# Only checked once the version is known, see the module docs
+		if _version is None or entry.get('compiler') == _version:
+			return CompiledStage(source, spirv, entry['reflection'], True)
+
+	version = compiler_version()
+	os.makedirs(cache_dir, exist_ok=True)
+
+	# The compiler picks the stage from the file ending of its input
+	temp = _temp_path(spirv)
+	result = subprocess.run([compiler, "-V", source, "-o", temp],
+		stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+	if result.returncode != 0:
+		if os.path.isfile(temp):
+			os.remove(temp)
+		raise RuntimeError("Unable to compile {}:\n{}".format(
+			file, result.stdout.decode("utf-8", "replace")))
+
+	interface = diskovery_spirv.reflect_file(temp)
+	os.replace(temp, spirv)
+
+	_write(reflection, json.dumps({
+		'source': os.path.basename(file),
+		'compiler': version,
+		'reflection': interface
+	}).encode("utf-8"))
+
+	return CompiledStage(source, spirv, interface, False)
+
+def compile_all(files, threads=None):
+	"""
+	Compiles several GLSL sources at once on a thread pool. Each file is
+	compiled once, however often it is listed.
+
+	:param files: Paths of the GLSL sources, relative to the Shaders directory
+	:param threads: Most sources compiled at the same time, :data:`COMPILE_THREADS` by default
+	:returns: A dictionary of :class:`CompiledStage` objects keyed by file
+	"""
+	unique = list(dict.fromkeys(files))
+	threads = COMPILE_THREADS if threads is None else threads
+
+	if len(unique) < 2 or threads < 2:
+		return dict((file, compile_stage(file)) for file in unique)
+
+	with ThreadPoolExecutor(max_workers=min(threads, len(unique))) as executor:
+		return dict(zip(unique, executor.map(compile_stage, unique)))
+
+def invalidate():
+	"""
+	Removes every compiled entry from the cache
+	"""
+	if not os.path.isdir(cache_dir):
+		return
+
+	for name in os.listdir(cache_dir):
+		if name.endswith(".spv") or name.endswith(".json") or name.endswith(".tmp"):
+			os.remove(os.path.join(cache_dir, name))
+
+def shader_sources():
+	"""
+	Returns the name of every GLSL source in the Shaders directory
+	"""
+	return sorted(name for name in os.listdir(source_dir)
+		if os.path.splitext(name)[1] in STAGES)
+
+if __name__ == '__main__':
+	args = sys.argv[1:]
+
+	if args and args[0] == '--clear':
+		invalidate()
+	else:
+		for file, stage in compile_all(args or shader_sources()).items():
+			print("{} -> {}{}".format(file, os.path.relpath(stage.spirv),
+				" (cached)" if stage.cached else ""))
@@ -0,0 +1,255 @@
+#!/bin/env/python
+
+"""
+The :mod:`diskovery_spirv` module reads the interface of a shader straight
+from its compiled SPIR-V, so nothing has to be guessed from the GLSL text.
+
+A SPIR-V module is a five word header followed by a flat list of
+instructions. The first word of every instruction holds its length in
+words (upper 16 bits) and its opcode (lower 16 bits). :func:`reflect`
+walks the list once and only looks at the few instructions describing
+the interface:
+
+- ``OpEntryPoint`` - the stage of the shader
+- ``OpName`` - the names of variables and block types
+- ``OpDecorate`` - ``Location``, ``Binding``, ``DescriptorSet`` and ``BuiltIn``
+- ``OpMemberDecorate`` - the ``Offset`` of each member of a block
+- ``OpTypePointer``, ``OpTypeArray``, ``OpTypeImage`` and ``OpTypeSampledImage`` - what a variable points at
+- ``OpTypeStruct`` and the scalar, vector and matrix types - the members of a block
+- ``OpConstant`` - the lengths of arrays
+- ``OpVariable`` - every global variable and its storage class
+
+The result is a small dictionary of plain lists and strings, which
+:mod:`diskovery_shader_cache` stores as JSON next to the SPIR-V::
+
+	{
+		'stage': 'vert',
+		'inputs': [0, 1, 2, 3],
+		'outputs': [0, 1, 2, 3],
+		'bindings': [[0, 0, 'uniform', 'CameraData']],
+		'push_constant': 'ModelMatrix',
+		'push_members': [[0, 'mat4']]
+	}
+
+``bindings`` lists ``[set, binding, kind, type name]`` sorted by set and
+binding, where ``kind`` is ``'uniform'`` for uniform blocks and
+``'sampler'`` for combined image samplers. The type name of a uniform
+block is the name of its block, which has to match a
+:class:`~diskovery_ubos.UniformBufferObject` type.
+
+``push_members`` lists the ``[offset, type]`` of every member of the
+push constant block in order, where ``type`` is written like its GLSL
+declaration (``'float'``, ``'vec4'``, ``'mat4'``, ``'vec4[2]'``), or is
+``None`` when the stage has no push constant block.
+"""
+
+import struct
+
+MAGIC = 0x07230203
+
+# Opcodes
+_OP_NAME = 5
+_OP_ENTRY_POINT = 15
+_OP_TYPE_BOOL = 20
+_OP_TYPE_INT = 21
+_OP_TYPE_FLOAT = 22
+_OP_TYPE_VECTOR = 23
+_OP_TYPE_MATRIX = 24
+_OP_TYPE_IMAGE = 25
+_OP_TYPE_SAMPLED_IMAGE = 27
+_OP_TYPE_ARRAY = 28
+_OP_TYPE_RUNTIME_ARRAY = 29
+_OP_TYPE_STRUCT = 30
+_OP_TYPE_POINTER = 32
+_OP_CONSTANT = 43
+_OP_VARIABLE = 59
+_OP_DECORATE = 71
+_OP_MEMBER_DECORATE = 72
+
+# Decorations
+_BUILT_IN = 11
+_LOCATION = 30
+_BINDING = 33
+_DESCRIPTOR_SET = 34
+_OFFSET = 35
+
+# Storage classes
+_UNIFORM_CONSTANT = 0
+_INPUT = 1
+_UNIFORM = 2
+_OUTPUT = 3
+_PUSH_CONSTANT = 9
+
+#: File endings of each execution model of an ``OpEntryPoint``
+STAGES = { 0: 'vert', 1: 'tesc', 2: 'tese', 3: 'geom', 4: 'frag', 5: 'comp' }
+
+# GLSL sampler type of each OpTypeImage dimension
+_SAMPLERS = { 0: 'sampler1D', 1: 'sampler2D', 2: 'sampler3D', 3: 'samplerCube' }
+
+# Prefix of the GLSL vector and matrix types of each component type
+_PREFIXES = { 'float': '', 'double': 'd', 'int': 'i', 'uint': 'u', 'bool': 'b' }
+
+_TYPES = (_OP_TYPE_BOOL, _OP_TYPE_INT, _OP_TYPE_FLOAT, _OP_TYPE_VECTOR, _OP_TYPE_MATRIX,
+	_OP_TYPE_IMAGE, _OP_TYPE_SAMPLED_IMAGE, _OP_TYPE_ARRAY, _OP_TYPE_RUNTIME_ARRAY,
+	_OP_TYPE_STRUCT, _OP_TYPE_POINTER)
+
+def _string(words):
+	# Literal strings are packed four bytes to a word and null terminated
+	raw = struct.pack("<{}I".format(len(words)), *words)
+	return raw[:raw.index(b"\0")].decode("utf-8")
+
+def instructions(data):
+	"""
+	Yields the ``(opcode, operands)`` of every instruction of a SPIR-V
+	module, where ``operands`` is a tuple of words
+
+	:param data: The contents of a ``.spv`` file
+	"""
+	if len(data) < 20 or len(data) % 4:
+		raise ValueError("Not a SPIR-V module, the size is not a multiple of 4 bytes")
+
+	endian = "<"
+	if struct.unpack_from("<I", data)[0] != MAGIC:
+		endian = ">"
+		if struct.unpack_from(">I", data)[0] != MAGIC:
+			raise ValueError("Not a SPIR-V module, the magic number does not match")
+
+	words = struct.unpack("{}{}I".format(endian, len(data) // 4), data)
+
+	index = 5
+	while index < len(words):
+		count = words[index] >> 16
+		if count == 0:
+			raise ValueError("Malformed SPIR-V instruction at word {}".format(index))
+
+		yield (words[index] & 0xFFFF, words[index + 1:index + count])
+		index += count
+
+def _type_name(type_id, types, constants, offsets):
+	# The GLSL spelling of a member type, structs are spelled out as their
+	# members so two blocks only compare equal if their layouts do
+	opcode, operands = types[type_id]
+
+	if opcode == _OP_TYPE_BOOL:
+		return 'bool'
+	elif opcode == _OP_TYPE_INT:
+		name = 'int' if operands[1] else 'uint'
+		return name if operands[0] == 32 else "{}{}".format(name, operands[0])
+	elif opcode == _OP_TYPE_FLOAT:
+		return { 32: 'float', 64: 'double' }.get(operands[0], "float{}".format(operands[0]))
+	elif opcode == _OP_TYPE_VECTOR:
+		component = _type_name(operands[0], types, constants, offsets)
+		prefix = _PREFIXES.get(component, component + '_')
+		return "{}vec{}".format(prefix, operands[1])
+	elif opcode == _OP_TYPE_MATRIX:
+		column = _type_name(operands[0], types, constants, offsets)
+		prefix, rows = column[:column.index('vec')], int(column[column.index('vec') + 3:])
+		size = str(operands[1]) if operands[1] == rows else "{}x{}".format(operands[1], rows)
+		return "{}mat{}".format(prefix, size)
+	elif opcode == _OP_TYPE_ARRAY:
+		return "{}[{}]".format(_type_name(operands[0], types, constants, offsets), constants.get(operands[1], ''))
+	elif opcode == _OP_TYPE_RUNTIME_ARRAY:
+		return "{}[]".format(_type_name(operands[0], types, constants, offsets))
+	elif opcode == _OP_TYPE_STRUCT:
+		return "struct {{ {} }}".format("; ".join("{} {}".format(offset, name)
+			for offset, name in _members(type_id, types, constants, offsets)))
+
+	raise ValueError("Unexpected type in a push constant block")
+
+def _members(struct_id, types, constants, offsets):
+	# The [offset, type] of every member of a struct, in order
+	member_offsets = offsets.get(struct_id, { })
+	return [[member_offsets.get(index), _type_name(member, types, constants, offsets)]
+		for index, member in enumerate(types[struct_id][1])]
+
+def reflect(data):
+	"""
+	Returns the interface of a compiled shader stage, as described at the
+	top of this module
+
+	:param data: The contents of a ``.spv`` file
+	"""
+	stage = None
+	names = { }
+	decorations = { }
+	types = { }
+	constants = { }
+	offsets = { }
+	variables = []
+
+	for opcode, operands in instructions(data):
+		if opcode == _OP_ENTRY_POINT and stage is None:
+			stage = STAGES.get(operands[0])
+		elif opcode == _OP_NAME:
+			names[operands[0]] = _string(operands[1:])
+		elif opcode == _OP_DECORATE:
+			target, decoration = operands[:2]
+			decorations.setdefault(target, { })[decoration] = operands[2] if len(operands) > 2 else True
+		elif opcode == _OP_MEMBER_DECORATE and operands[2] == _OFFSET:
+			offsets.setdefault(operands[0], { })[operands[1]] = operands[3]
+		elif opcode in _TYPES:
+			types[operands[0]] = (opcode, operands[1:])
+		elif opcode == _OP_CONSTANT:
+			constants[operands[1]] = operands[2]
+		elif opcode == _OP_VARIABLE:
+			variables.append((operands[0], operands[1], operands[2]))
+
+	def pointee(type_id):
+		# What a pointer points at, looking through arrays
+		opcode, operands = types[type_id]
+		type_id = operands[1]
+		while types.get(type_id, (None,))[0] in (_OP_TYPE_ARRAY, _OP_TYPE_RUNTIME_ARRAY):
+			type_id = types[type_id][1][0]
+		return type_id
+
+	inputs = []
+	outputs = []
+	bindings = []
+	push_constant = None
+	push_members = None
+
+	for type_id, var_id, storage in variables:
+		decorated = decorations.get(var_id, { })
+		if _BUILT_IN in decorated:
+			continue
+
+		if storage in (_INPUT, _OUTPUT):
+			if _LOCATION in decorated:
+				(inputs if storage == _INPUT else outputs).append(decorated[_LOCATION])
+			continue
+
+		target = pointee(type_id)
+
+		if storage == _PUSH_CONSTANT:
+			push_constant = names.get(target)
+			push_members = _members(target, types, constants, offsets)
+
+		elif storage in (_UNIFORM, _UNIFORM_CONSTANT) and _BINDING in decorated:
+			opcode, operands = types.get(target, (None, ()))
+
+			if opcode == _OP_TYPE_SAMPLED_IMAGE:
+				dim = types[operands[0]][1][1]
+				kind, name = 'sampler', _SAMPLERS.get(dim, 'sampler')
+			elif opcode == _OP_TYPE_STRUCT:
+				kind, name = 'uniform', names.get(target)
+			else:
+				raise ValueError("Binding {} of {} is not a uniform block or a combined "
+					"image sampler".format(decorated[_BINDING], names.get(var_id, "a variable")))
+
+			bindings.append([decorated.get(_DESCRIPTOR_SET, 0), decorated[_BINDING], kind, name])
+
+	return {
+		'stage': stage,
+		'inputs': sorted(inputs),
+		'outputs': sorted(outputs),
+		'bindings': sorted(bindings),
+		'push_constant': push_constant,
+		'push_members': push_members
+	}
+
+def reflect_file(file):
+	"""
+	Reads a ``.spv`` file and returns its :func:`reflect` result
+	"""
+	with open(file, "rb") as f:
+		return reflect(f.read())
@@ -1,5 +1,6 @@
 
 import glm
+import numpy as np
 from ctypes import c_float, sizeof
 from abc import ABC, abstractmethod
 
@@ -14,13 +15,19 @@ class UniformBufferObject(ABC):
 	def get_size():
 		pass
 
-def get_matrix_data(matrix):
-	m_data = ((c_float*4)*4)()
-
-	for i, row in enumerate(matrix):
-		row_data = (c_float*4)(*row)
-		m_data[i] = row_data
+def matrix_view(data, count=1):
+	"""
+	Returns a ``numpy`` view of a ``ctypes`` array of ``count`` matrices.
+	Assigning a ``glm.mat4`` to an element of the view copies it into the
+	array in place, column by column, which is the layout the shaders
+	expect. Nothing is allocated by the copy, so views are made once and
+	kept for as long as the array.
+	"""
+	return np.frombuffer(data, dtype=np.float32).reshape(count, 4, 4).transpose(0, 2, 1)
 
+def get_matrix_data(matrix):
+	m_data = _matrix_type()
+	matrix_view(m_data)[0] = matrix
 	return m_data
 
 class MVPMatrix(UniformBufferObject):
@@ -63,29 +70,94 @@ class MVPMatrix(UniformBufferObject):
 		self.view = glm.mat4()
 		self.projection = glm.mat4()
 
+		# Filled in place by every call to get_data
+		self.data = (_matrix_type*3)()
+		self.matrices = matrix_view(self.data, 3)
+
 	def get_data(self):
 		"""
 		Takes the information stored in the matrices of this class and 
 		condenses them into a ``ctypes`` array for passing through a
-		:class:`~diskovery_buffer.UniformBuffer`.
+		:class:`~diskovery_buffer.UniformBuffer`. The same array is
+		reused every time, so it should be copied before the matrices change.
 
 		:returns: The data stored in the matrices of this class as a ``Mat4_Array_3``
 		"""
-		matrices = (_matrix_type*3)(
-			get_matrix_data(self.model),
-			get_matrix_data(self.view),
-			get_matrix_data(self.projection)
-		)
-		return matrices
+		self.matrices[0] = self.model
+		self.matrices[1] = self.view
+		self.matrices[2] = self.projection
+		return self.data
 
 	@staticmethod
 	def get_size():
 		return sizeof(_matrix_type) * 3
 
+class ModelMatrix(UniformBufferObject):
+	"""
+	A uniform filler that holds only the model matrix of an entity. The
+	view and projection matrices are shared by every entity through
+	:class:`CameraData` in the frame descriptor set.
+
+	.. py:attribute:: model
+
+		A 4x4 Matrix that stores the position, rotation, and scale of an Entity
+		within the game world.
+	"""
+	def __init__(self):
+		self.model = glm.mat4()
+
+		self.data = _matrix_type()
+		self.matrices = matrix_view(self.data)
+
+	def get_data(self):
+		self.matrices[0] = self.model
+		return self.data
+
+	@staticmethod
+	def get_size():
+		return sizeof(_matrix_type)
+
+class CameraData(UniformBufferObject):
+	"""
+	A uniform filler for the view and projection matrices of the camera.
+	It is written once per frame into the frame descriptor set (set 0)
+	that every pipeline binds, see :class:`~diskovery_descriptor.FrameDescriptor`.
+
+	.. py:attribute:: view
+
+		The view matrix of the Camera
+
+	.. py:attribute:: projection
+
+		The projection matrix of the Camera
+	"""
+	def __init__(self):
+		self.view = glm.mat4()
+		self.projection = glm.mat4()
+
+		self.data = (_matrix_type*2)()
+		self.matrices = matrix_view(self.data, 2)
+
+	def get_data(self):
+		self.matrices[0] = self.view
+		self.matrices[1] = self.projection
+		return self.data
+
+	@staticmethod
+	def get_size():
+		return sizeof(_matrix_type) * 2
+
 MAX_JOINTS = 100
 class JointData(UniformBufferObject):
 	def __init__(self):
 		self.joint_data = (_matrix_type * MAX_JOINTS)()
+		self.matrices = matrix_view(self.joint_data, MAX_JOINTS)
+
+	def set(self, index, matrix):
+		"""
+		Writes the transform of the joint at ``index``
+		"""
+		self.matrices[index] = matrix
 
 	def get_data(self):
 		return self.joint_data
@@ -98,9 +170,12 @@ class ScreenSize(UniformBufferObject):
 	def __init__(self, width, height):
 		self.width = c_float(width)
 		self.height = c_float(height)
+		self.data = (c_float*2)()
 
 	def get_data(self):
-		return (c_float*2)(self.width, self.height)
+		self.data[0] = self.width.value
+		self.data[1] = self.height.value
+		return self.data
 
 	@staticmethod
 	def get_size():
@@ -109,9 +184,11 @@ class ScreenSize(UniformBufferObject):
 class Boolean(UniformBufferObject):
 	def __init__(self, value=True):
 		self.value = value
+		self.data = (c_float * 1)()
 
 	def get_data(self):
-		return (c_float * 1)(1) if self.value else (c_float * 1)(0)
+		self.data[0] = 1 if self.value else 0
+		return self.data
 
 	@staticmethod
 	def get_size():
@@ -120,9 +197,11 @@ class Boolean(UniformBufferObject):
 class Float(UniformBufferObject):
 	def __init__(self, value):
 		self.value = value
+		self.data = (c_float * 1)()
 
 	def get_data(self):
-		return (c_float * 1)(self.value)
+		self.data[0] = self.value
+		return self.data
 
 	@staticmethod
 	def get_size():
@@ -131,9 +210,11 @@ class Float(UniformBufferObject):
 class Tint(UniformBufferObject):
 	def __init__(self, value=(1, 1, 1, 1)):
 		self.value = value
+		self.data = (c_float * 4)()
 
 	def get_data(self):
-		return (c_float * 4)(*(self.value))
+		self.data[:len(self.value)] = self.value
+		return self.data
 
 	@staticmethod
 	def get_size():
@@ -143,49 +224,145 @@ class Color(Tint):
 	def __init__(self, value=(1, 1, 1, 1)):
 		Tint.__init__(self, value)
 
+class DrawData(UniformBufferObject):
+	"""
+	The per-draw values of every entity, copied into its row of the
+	:class:`~diskovery_buffer.InstanceBuffer` each frame rather than
+	recorded into the command buffers. Laid out as::
+
+		mat4 model; vec4 tint; vec4 color; float isLit; float isSelected; float sub;
+
+	The vertex stage reads the row as the per-instance attributes
+	starting at :data:`~diskovery_mesh.INSTANCE_LOCATION`, and hands the
+	values the fragment stage needs on as flat outputs.
+	"""
+	def __init__(self):
+		self.model = glm.mat4()
+		self.tint = (1, 1, 1, 1)
+		self.color = (0, 0, 0, 1)
+		self.is_lit = True
+		self.selected = False
+		self.sub = 1
+
+		self.data = (c_float * 28)()
+		self.values = np.frombuffer(self.data, dtype=np.float32)
+		self.matrices = self.values[:16].reshape(1, 4, 4).transpose(0, 2, 1)
+
+	def get_data(self):
+		self.matrices[0] = self.model
+		self.values[16:16 + len(self.tint)] = self.tint
+		self.values[20:20 + len(self.color)] = self.color
+		self.values[24] = 1 if self.is_lit else 0
+		self.values[25] = 1 if self.selected else 0
+		self.values[26] = self.sub
+		return self.data
+
+	def get_values(self):
+		"""
+		Fills the block like :meth:`get_data`, and returns it as a
+		``numpy`` array sharing the same memory
+		"""
+		self.get_data()
+		return self.values
+
+	def bind(self, values):
+		"""
+		Moves the block into ``values``, a row of 28 floats of a larger
+		array, so that :meth:`get_data` fills that row in place. Used by
+		:class:`~diskovery_entity_manager.RenderList` to keep the values
+		of every instanced entity in one array, laid out like the
+		instance buffer.
+
+		:param values: A contiguous ``float32`` array of 28 elements
+		"""
+		values[:] = self.values
+		self.data = (c_float * 28).from_buffer(values)
+		self.values = values
+		self.matrices = values[:16].reshape(1, 4, 4).transpose(0, 2, 1)
+
+	@staticmethod
+	def get_size():
+		return sizeof(c_float) * 28
+
 MAX_LIGHTS = 50
 class SceneLighting(UniformBufferObject):
+	"""
+	The lights of one light scene, packed into a single uniform that is
+	bound in the frame descriptor set of every entity using the scene.
+
+	The uniform is stored as four blocks of ``MAX_LIGHTS`` ``vec4`` values
+	(positions, directions, tints and the intensity, distance and spread
+	of each light) in a preallocated array. The array is only repacked
+	after a light is added, removed or changed, which
+	:class:`~diskovery.Light` reports through :meth:`mark_dirty`.
+
+	.. py:attribute:: buffer
+
+		The :class:`~diskovery_buffer.UniformBuffer` holding this scene's
+		lights, set by :func:`~diskovery.add_light_scene`. It is written by
+		:meth:`upload` at most once per back buffer after each change.
+	"""
 	def __init__(self):
 		self.lights = []
+		self.buffer = None
 
-	def get_data(self):
-		position = (c_float * (4 * MAX_LIGHTS))()
-		direction = (c_float * (4 * MAX_LIGHTS))()
-		tint = (c_float * (4 * MAX_LIGHTS))()
-		mods = (c_float * (4 * MAX_LIGHTS))()
+		self.data = (c_float * (16 * MAX_LIGHTS))()
+		# (block, light, component) view onto data
+		self.packed = np.frombuffer(self.data, dtype=np.float32).reshape(4, MAX_LIGHTS, 4)
 
-		for i, light in enumerate(self.lights):
+		self.dirty = True
+		# Indices of the back buffers still holding old data
+		self.stale = set()
 
-			position[i * 4    ] = light.position[0]
-			position[i * 4 + 1] = light.position[1]
-			position[i * 4 + 2] = light.position[2]
-			position[i * 4 + 3] = 0.0
+	def add(self, light):
+		self.lights.append(light)
+		self.mark_dirty()
 
+	def remove(self, light):
+		self.lights.remove(light)
+		self.mark_dirty()
 
-			direction[i * 4    ] = light.rotation[0]
-			direction[i * 4 + 1] = light.rotation[1]
-			direction[i * 4 + 2] = light.rotation[2]
-			direction[i * 4 + 3] = 0.0
+	def mark_dirty(self):
+		"""
+		Flags the packed data as out of date, so it is rebuilt and uploaded
+		to every back buffer again
+		"""
+		self.dirty = True
+		if self.buffer is not None:
+			self.stale = set(range(0, len(self.buffer.buffers)))
 
-			tint[i * 4    ] = light.tint[0]
-			tint[i * 4 + 1] = light.tint[1]
-			tint[i * 4 + 2] = light.tint[2]
-			tint[i * 4 + 3] = 0.0
+	def get_data(self):
+		if self.dirty:
+			self.packed.fill(0)
 
-			mods[i * 4    ] = light.intensity
-			mods[i * 4 + 1] = light.distance
-			mods[i * 4 + 2] = light.spread
-			mods[i * 4 + 3] = 0.0
+			lights = self.lights[:MAX_LIGHTS]
+			if len(lights) > 0:
+				count = len(lights)
+				values = np.array([
+					tuple(light.position) + tuple(light.rotation) + tuple(light.tint)[:3] +
+					(light.intensity, light.distance, light.spread)
+					for light in lights
+				], dtype=np.float32)
 
-		final_list = (c_float * (16 * MAX_LIGHTS))(*(
-			list(position) +
-			list(direction) +
-			list(tint) +
-			list(mods)
-		))
+				self.packed[0, :count, :3] = values[:, 0:3]
+				self.packed[1, :count, :3] = values[:, 3:6]
+				self.packed[2, :count, :3] = values[:, 6:9]
+				self.packed[3, :count, :3] = values[:, 9:12]
 
-		return final_list
+			self.dirty = False
+
+		return self.data
+
+	def upload(self, index):
+		"""
+		Copies the packed lights into :attr:`buffer` for the back buffer at
+		``index`` if it has not been given the latest data yet. Cheap to
+		call every frame, only the first call after a change copies anything.
+		"""
+		if index in self.stale:
+			self.buffer.update(self.get_data(), index)
+			self.stale.discard(index)
 
 	@staticmethod
 	def get_size():
-		return sizeof(c_float) * 16 * MAX_LIGHTS
\ No newline at end of file
+		return sizeof(c_float) * 16 * MAX_LIGHTS
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The engine modules are imported from engine_core, like the game does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,162 @@
+"""
+Tests for the memory bookkeeping of :mod:`diskovery_buffer`. Only the
+Vulkan loader is needed to import the module, the allocator is driven by
+a device that hands out memory handles without a GPU.
+"""
+
+import pytest
+
+try:
+	import vk
+	from diskovery_buffer import FreeList, MemoryAllocator
+except OSError:
+	pytest.skip("the Vulkan loader (libvulkan) is not installed", allow_module_level=True)
+
+class Device(object):
+	"""
+	The parts of a :class:`~diskovery_instance.DkInstance` the
+	:class:`~diskovery_buffer.MemoryAllocator` calls, with one device local
+	memory type
+	"""
+	def __init__(self):
+		self.gpu = None
+		self.device = None
+		self.allocated = []
+		self.freed = []
+
+	def get_memory_type(self, bits, props):
+		return 0
+
+	def GetPhysicalDeviceMemoryProperties(self, gpu, props):
+		props._obj.memory_type_count = 1
+		props._obj.memory_types[0].property_flags = vk.MEMORY_PROPERTY_DEVICE_LOCAL_BIT
+
+	def AllocateMemory(self, device, info, allocator, memory):
+		self.allocated.append(info._obj.allocation_size)
+		memory._obj.value = len(self.allocated)
+		return vk.SUCCESS
+
+	def FreeMemory(self, device, memory, allocator):
+		self.freed.append(memory.value)
+
+def requirements(size, alignment=1):
+	return vk.MemoryRequirements(size=size, alignment=alignment, memory_type_bits=1)
+
+def test_free_list_alignment():
+	free = FreeList(1024)
+
+	assert free.reserve(10) == 0
+	assert free.reserve(100, 256) == 256
+	# The padding in front of the aligned range stays free
+	assert free.ranges == [[10, 246], [356, 668]]
+	assert free.used == 110
+
+	assert free.reserve(16, 16) == 16
+	assert free.reserve(1024) is None
+
+def test_free_list_coalesces_on_release():
+	free = FreeList(300)
+	offsets = [free.reserve(100) for i in range(3)]
+	assert offsets == [0, 100, 200]
+	assert free.ranges == []
+
+	free.release(0, 100)
+	free.release(200, 100)
+	assert free.ranges == [[0, 100], [200, 100]]
+	assert free.largest() == 100
+
+	# Releasing the middle merges it with both neighbours
+	free.release(100, 100)
+	assert free.ranges == [[0, 300]]
+	assert free.used == 0
+
+def test_free_list_merges_alignment_padding():
+	free = FreeList(512)
+	first = free.reserve(8)
+	second = free.reserve(64, 64)
+
+	free.release(second, 64)
+	assert free.ranges == [[8, 504]]
+
+	free.release(first, 8)
+	assert free.ranges == [[0, 512]]
+
+def test_allocator_aligns_and_shares_blocks():
+	dk = Device()
+	allocator = MemoryAllocator(dk, 4096)
+
+	first = allocator.allocate(requirements(100, 64), 0)
+	second = allocator.allocate(requirements(100, 256), 0)
+
+	assert first.offset == 0
+	assert second.offset == 256
+	assert first.memory.value == second.memory.value
+	assert dk.allocated == [4096]
+
+def test_allocator_separates_buffers_and_images():
+	dk = Device()
+	allocator = MemoryAllocator(dk, 4096)
+
+	buff = allocator.allocate(requirements(64), 0, linear=True)
+	image = allocator.allocate(requirements(64), 0, linear=False)
+
+	assert buff.block is not image.block
+	assert allocator.stats()['blocks'] == 2
+
+def test_allocator_dedicated_allocations():
+	dk = Device()
+	allocator = MemoryAllocator(dk, 4096)
+
+	small = allocator.allocate(requirements(64), 0)
+	large = allocator.allocate(requirements(3000), 0)
+
+	assert large.block.dedicated
+	assert large.block is not small.block
+	assert dk.allocated == [4096, 3000]
+
+	# A dedicated block is freed with its allocation
+	allocator.free(large)
+	assert dk.freed == [large.memory.value]
+	assert allocator.dedicated == []
+
+def test_allocator_keeps_one_empty_block():
+	dk = Device()
+	allocator = MemoryAllocator(dk, 4096)
+
+	full = [allocator.allocate(requirements(2048), 0) for i in range(2)]
+	spill = allocator.allocate(requirements(2048), 0)
+	assert spill.block is not full[0].block
+
+	# The only empty block is kept for the next allocation
+	allocator.free(spill)
+	assert dk.freed == []
+
+	for allocation in full:
+		allocator.free(allocation)
+	assert dk.freed == [full[0].memory.value]
+	assert allocator.stats()['blocks'] == 1
+
+def test_allocator_fragmentation_stats():
+	dk = Device()
+	allocator = MemoryAllocator(dk, 4096)
+
+	allocations = [allocator.allocate(requirements(512), 0) for i in range(4)]
+	stats = allocator.stats()
+	assert stats['allocations'] == 4
+	assert stats['used'] == 2048
+	assert stats['fragmentation'] == 0
+
+	allocator.free(allocations[0])
+	allocator.free(allocations[2])
+
+	stats = allocator.stats()
+	assert stats['allocations'] == 2
+	assert stats['used'] == 1024
+	assert stats['free_ranges'] == 3
+	assert stats['largest_free'] == 2048
+	assert stats['fragmentation'] == pytest.approx(1 - 2048 / 3072)
+
+	allocator.free(allocations[1])
+	allocator.free(allocations[3])
+	assert allocator.stats()['free_ranges'] == 1
+	assert allocator.stats()['fragmentation'] == 0